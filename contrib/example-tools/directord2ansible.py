@@ -23,25 +23,27 @@ python3 contrib/example-tools/directord2ansible.py \
 """
 
 import argparse
-
-# import functools
+import concurrent.futures
+import filecmp
+import hashlib
+import json
 import logging
 import shutil
 import os
 import yaml
 
-from taskflow import engines
-
-# from taskflow import task as tftask
-from taskflow.patterns import graph_flow as gf
-
-import task_core.cmd
-from task_core.inventory import Inventory
-from task_core.inventory import Roles
+from task_core.base import YAML_LOADER
+from task_core.graph import TaskGraph
 from task_core.logging import setup_basic_logging
+from task_core.manager import TaskManager
+from task_core.service import Service
 
 LOG = logging.getLogger(__name__)
 
+# bump when the generated output changes so existing roles are regenerated
+CONVERTER_VERSION = "1"
+MANIFEST_NAME = ".directord2ansible.json"
+
 
 def parse_args():
     """arguments for this script"""
@@ -69,6 +71,28 @@ def parse_args():
     parser.add_argument(
         "-d", "--debug", action="store_true", help=("Enable debug logging")
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count(),
+        help=("Number of services to convert at the same time"),
+    )
+    parser.add_argument(
+        "--play-order",
+        choices=["dependency", "grouped"],
+        default="dependency",
+        help=(
+            "Order of the tasks in the playbook. 'dependency' follows the "
+            "task dependencies, 'grouped' also keeps tasks running on the "
+            "same hosts together to use fewer plays"
+        ),
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help=("Convert every service, even the ones that did not change"),
+    )
 
     parser.add_argument(
         "ansible_directory",
@@ -87,6 +111,50 @@ def str_presenter(dumper, data):
 yaml.representer.SafeRepresenter.add_representer(str, str_presenter)
 
 
+def write_if_changed(path, content):
+    """write content to path unless the file already holds it"""
+    data = content.encode("utf-8")
+    try:
+        with open(path, "rb") as fin:
+            if fin.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    with open(path, "wb") as fout:
+        fout.write(data)
+    return True
+
+
+def copy_if_changed(src, dest_dir):
+    """copy src into dest_dir unless an identical copy is already there"""
+    dest = os.path.join(dest_dir, os.path.basename(src))
+    if os.path.isfile(dest) and filecmp.cmp(src, dest, shallow=False):
+        return False
+    shutil.copy(src, dest)
+    return True
+
+
+def _build_job_parser():
+    job_parser = argparse.ArgumentParser(
+        description="generic job parser", allow_abbrev=False, add_help=False
+    )
+    job_parser.add_argument("--blueprint", action="store_true")
+    job_parser.add_argument("--run-once", action="store_true")
+    job_parser.add_argument("--skip-cache", action="store_true")
+    job_parser.add_argument("--timeout", type=int)
+    job_parser.add_argument("--stdout-arg")
+    job_parser.add_argument("--chown")
+    job_parser.add_argument("--chmod")
+    job_parser.add_argument("--restarted", action="store_true")
+    job_parser.add_argument("--stopped", action="store_true")
+    job_parser.add_argument("--enable", action="store_true")
+    job_parser.add_argument("--disable", action="store_true")
+    return job_parser
+
+
+JOB_PARSER = _build_job_parser()
+
+
 def process_add_task(args, role_dir, kargs, uargs):
     file_name = os.path.basename(uargs[0])
     if kargs.blueprint:
@@ -99,7 +167,7 @@ def process_add_task(args, role_dir, kargs, uargs):
         src_path = "{{ role_path }}/files/%s" % file_name
     os.makedirs(file_dir, exist_ok=True)
     src_file = os.path.normpath(os.path.join(args.services_dir, uargs[0]))
-    shutil.copy(src_file, file_dir)
+    copy_if_changed(src_file, file_dir)
     data = {
         "name": "ADD",
         ansible_action: {"src": src_path, "dest": uargs[1]},
@@ -239,25 +307,11 @@ def process_directord_jobs(
     jobs,
 ):  # pylint: disable=too-many-branches,too-many-statements
     ansible_tasks = []
-    job_parser = argparse.ArgumentParser(
-        description="generic job parser", allow_abbrev=False, add_help=False
-    )
-    job_parser.add_argument("--blueprint", action="store_true")
-    job_parser.add_argument("--run-once", action="store_true")
-    job_parser.add_argument("--skip-cache", action="store_true")
-    job_parser.add_argument("--timeout", type=int)
-    job_parser.add_argument("--stdout-arg")
-    job_parser.add_argument("--chown")
-    job_parser.add_argument("--chmod")
-    job_parser.add_argument("--restarted", action="store_true")
-    job_parser.add_argument("--stopped", action="store_true")
-    job_parser.add_argument("--enable", action="store_true")
-    job_parser.add_argument("--disable", action="store_true")
     for job in jobs:
         data = None
         action = next(iter(job))
         cmd = job[action]
-        kargs, uargs = job_parser.parse_known_args(cmd.split())
+        kargs, uargs = JOB_PARSER.parse_known_args(cmd.split())
         if action in ("ADD", "COPY"):
             data = process_add_task(args, role_dir, kargs, uargs)
         elif action == "CACHEFILE":
@@ -292,47 +346,100 @@ def generate_ansible_task_file(args, role_dir, task_dir, task):
         return
     file_name = "{}.yml".format(task.task_id)
     ansible_tasks = process_directord_jobs(args, role_dir, task.jobs)
-    with open(os.path.join(task_dir, file_name), "w", encoding="utf-8") as task_file:
-        yaml.safe_dump(ansible_tasks, task_file, width=120)
+    write_if_changed(
+        os.path.join(task_dir, file_name),
+        yaml.safe_dump(ansible_tasks, width=120),
+    )
 
 
-def generate_ansible_roles(args, svcs):
+def service_digest(args, svc_file):
+    """hash of a service file and of the files its jobs add to hosts"""
+    digest = hashlib.sha256(CONVERTER_VERSION.encode("utf-8"))
+    with open(svc_file, "rb") as fin:
+        data = fin.read()
+    digest.update(data)
+    for _task in yaml.load(data, Loader=YAML_LOADER).get("tasks", []):
+        for job in _task.get("jobs", []):
+            action = next(iter(job))
+            if action not in ("ADD", "COPY"):
+                continue
+            _, uargs = JOB_PARSER.parse_known_args(job[action].split())
+            src_file = os.path.normpath(os.path.join(args.services_dir, uargs[0]))
+            digest.update(src_file.encode("utf-8"))
+            with open(src_file, "rb") as fin:
+                digest.update(fin.read())
+    return digest.hexdigest()
+
+
+def convert_service(args, roles_dir, svc_file):
+    """convert the directord tasks of a service file to an ansible role
+
+    Runs in a worker process of generate_ansible_roles.
+    """
+    svc = Service(svc_file)
+    LOG.info("Creating roles: %s", svc.name)
+    role_dir = os.path.join(roles_dir, svc.name)
+    os.makedirs(role_dir, exist_ok=True)
+    svc_tasks = svc.build_tasks(retries=False)
+    if not svc_tasks:
+        return svc.name
+    task_dir = os.path.join(role_dir, "tasks")
+    os.makedirs(task_dir, exist_ok=True)
+    for task in svc_tasks:
+        LOG.info(" - %s", task.task_id)
+        generate_ansible_task_file(args, role_dir, task_dir, task)
+    return svc.name
+
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as fin:
+            return json.load(fin)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def generate_ansible_roles(args, svc_files):
+    """convert services to roles in a process pool
+
+    svc_files maps service names to their files. Services whose file and
+    added files have the same digest as in the manifest of the previous
+    run are skipped.
+    """
     roles_dir = os.path.join(args.ansible_directory, "roles")
     os.makedirs(roles_dir, exist_ok=True)
-    for name, svc in svcs.items():
-        LOG.info("Creating roles: %s", name)
-        role_dir = os.path.join(roles_dir, name)
-        os.makedirs(role_dir, exist_ok=True)
-        svc_tasks = svc.build_tasks()
-        if not svc_tasks:
-            continue
-        task_dir = os.path.join(role_dir, "tasks")
-        os.makedirs(task_dir, exist_ok=True)
-        for task in svc.build_tasks():
-            LOG.info(" - %s", task.task_id)
-            generate_ansible_task_file(args, role_dir, task_dir, task)
-
-
-# def playbook_thingy(task, event_type, details):
-#     if details.get('progress') == 1.0:
-#         print("DONE! {}".format(task))
-
-
-def add_services_to_flow(flow, services):
-    """process services and add tasks to flow"""
-    task_type_override = task_core.tasks.NoopTask
-    for service_id in services:
-        service = services.get(service_id)
-        if len(service.hosts) == 0:
-            LOG.warning("Skipping adding service %s due to no hosts...", service.name)
+    manifest_path = os.path.join(args.ansible_directory, MANIFEST_NAME)
+    manifest = {} if args.force else load_manifest(manifest_path)
+    digests = {}
+    pending = []
+    for name, svc_file in svc_files.items():
+        digests[name] = service_digest(args, svc_file)
+        if manifest.get(name) == digests[name] and os.path.isdir(
+            os.path.join(roles_dir, name)
+        ):
+            LOG.debug("Skipping unchanged role: %s", name)
             continue
-        LOG.debug("Adding %s tasks...", service.name)
-        for task in service.build_tasks(task_type_override):
-            # use this to do task progress updates
-            # task.notifier.register(tftask.EVENT_UPDATE_PROGRESS,
-            #                        functools.partial(playbook_thingy, task))
-            flow.add(task)
-    return flow
+        pending.append(svc_file)
+    LOG.info(
+        "Converting %s services, %s unchanged",
+        len(pending),
+        len(svc_files) - len(pending),
+    )
+    converted = set()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [
+            pool.submit(convert_service, args, roles_dir, svc_file)
+            for svc_file in pending
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            converted.add(future.result())
+    manifest = {
+        name: digest
+        for name, digest in digests.items()
+        if name in converted or manifest.get(name) == digest
+    }
+    write_if_changed(manifest_path, json.dumps(manifest, indent=2, sort_keys=True))
+    return converted
 
 
 class PlaybookWriter:
@@ -353,56 +460,85 @@ class PlaybookWriter:
         self._current_play = None
         self._current_hosts = None
 
-    def __del__(self):
-        self.close()
+    @property
+    def plays(self):
+        """number of plays, including the current one"""
+        return len(self._plays) + (1 if self._current_play else 0)
 
-    def task_transition(self, state, details):
-        """update play based on task transition"""
-        LOG.debug("State change: %s", state)
-        data = details.get("result")[0].data
-        hosts = data.get("hosts")
-        if self._current_hosts != hosts:
-            LOG.debug("Hosts change to... %s", hosts)
+    def add_task(self, node):
+        """add a task graph node, starting a new play when the hosts change"""
+        if self._current_hosts != node.hosts:
+            LOG.debug("Hosts change to... %s", node.hosts)
             if self._current_play:
                 self._plays.append(self._current_play)
-            self._current_play = {"hosts": ",".join(hosts), "tasks": []}
-            self._current_hosts = hosts
-        role_name = details.get("task_name").replace("-{}".format(data.get("id")), "")
+            self._current_play = {"hosts": ",".join(node.hosts), "tasks": []}
+            self._current_hosts = node.hosts
         task = {
-            "name": details.get("task_name"),
+            "name": node.name,
             "include_role": {
-                "name": role_name,
-                "tasks_from": "{}.yml".format(data.get("id")),
+                "name": node.service,
+                "tasks_from": "{}.yml".format(node.task_id),
             },
         }
         self._current_play["tasks"].append(task)
 
     def close(self):
-        with open(self._playbook_path, "w", encoding="utf-8") as playbook:
-            yaml.safe_dump(self._plays, playbook, width=120)
+        if self._current_play:
+            self._plays.append(self._current_play)
+            self._current_play = None
+            self._current_hosts = None
+        write_if_changed(self._playbook_path, yaml.safe_dump(self._plays, width=120))
+
+
+def count_plays(graph, order):
+    """plays needed to run the tasks in order, one per change of hosts"""
+    plays = 0
+    hosts = None
+    for name in order:
+        if graph.nodes[name].hosts != hosts:
+            hosts = graph.nodes[name].hosts
+            plays += 1
+    return plays
 
 
 def generate_ansible_playbook(args, svcs):
-    inventory = Inventory(args.inventory_file)
-    roles = Roles(args.roles_file)
-    task_core.cmd.add_hosts_to_services(inventory, roles, svcs)
-    flow = gf.Flow("root")
-    add_services_to_flow(flow, svcs)
+    """write the tasks to a playbook in dependency order
+
+    The order is a topological sort of the provides/requires graph of the
+    tasks, computed without running them. With --play-order grouped, tasks
+    on the same hosts are kept together to reduce the number of plays.
+    """
+    graph = TaskGraph.from_services(svcs)
+    for name in graph.unreachable:
+        LOG.warning("Skipping adding service %s due to no hosts...", name)
+    report = graph.validate()
+    if report.has_errors:
+        raise ValueError("Invalid task graph: {}".format("; ".join(report.errors())))
+    order = graph.topological_order()
+    if args.play_order == "grouped":
+        before = count_plays(graph, order)
+        order = [
+            name
+            for batch in graph.grouped_order(lambda n: tuple(graph.nodes[n].hosts))
+            for name in batch
+        ]
+        LOG.info(
+            "Plays: %s in dependency order, %s grouped by hosts",
+            before,
+            count_plays(graph, order),
+        )
     playwriter = PlaybookWriter(args.ansible_directory)
-    e = engines.load(flow, engine="serial")
-    e.atom_notifier.register("SUCCESS", playwriter.task_transition)
-    LOG.info("Compiling...")
-    e.compile()
-    LOG.info("Preparing...")
-    e.prepare()
-    LOG.info("Running...")
-    e.run()
-    LOG.info("Done: %s", e.statistics)
+    for name in order:
+        playwriter.add_task(graph.nodes[name])
+    playwriter.close()
+    LOG.info("Done: %s tasks in %s plays", len(graph), playwriter.plays)
 
 
 if __name__ == "__main__":
     cli_args = parse_args()
     setup_basic_logging(cli_args.debug)
-    processed_svcs = task_core.cmd.load_services(cli_args.services_dir)
-    generate_ansible_roles(cli_args, processed_svcs)
-    generate_ansible_playbook(cli_args, processed_svcs)
+    mgr = TaskManager(
+        cli_args.services_dir, cli_args.inventory_file, cli_args.roles_file
+    )
+    generate_ansible_roles(cli_args, mgr.service_files)
+    generate_ansible_playbook(cli_args, mgr.services)
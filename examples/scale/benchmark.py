@@ -0,0 +1,237 @@
+"""Benchmark the task-core pipeline against generated scale data
+
+Example execution:
+python3 examples/scale/benchmark.py --hosts 100 --services 100 \\
+        --seed 42 --repeat 3 --output bench.json
+python3 examples/scale/benchmark.py --hosts 100 --services 100 \\
+        --seed 42 --repeat 3 --compare bench.json
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from gen_scale_data import EDGE_DENSITY  # pylint: disable=import-error
+from gen_scale_data import gen_scale_data  # pylint: disable=import-error
+
+from taskflow import engines
+
+from task_core.base import BaseFileData
+from task_core.manager import TaskManager
+from task_core.service import Service
+from task_core.tasks import NoopTask
+from task_core.tasks import PrintTask
+
+STAGES = [
+    "service_load",
+    "schema_validation",
+    "resolve_service_deps",
+    "inventory_load",
+    "hosts_to_services",
+    "create_flow",
+    "engine_compile",
+    "noop_run",
+    "print_run",
+    "bench_run",
+]
+
+
+class Timer:  # pylint: disable=too-few-public-methods
+    """collect the duration of named stages"""
+
+    def __init__(self):
+        self.results = {}
+
+    def time(self, stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        ret = func(*args, **kwargs)
+        self.results[stage] = time.perf_counter() - start
+        return ret
+
+
+def load_services(services_dir):
+    files = sorted(
+        glob.glob(os.path.join(services_dir, "**", "*.yaml"), recursive=True)
+    )
+    return [BaseFileData(f).data for f in files]
+
+
+def validate_services(data):
+    services = {}
+    for svc_data in data:
+        svc = Service(svc_data)
+        services[svc.name] = svc
+    return services
+
+
+def compile_engine(flow, max_workers):
+    engine = engines.load(
+        flow, executor="threaded", engine="parallel", max_workers=max_workers
+    )
+    engine.compile()
+    engine.prepare()
+    return engine
+
+
+def run_pipeline(data_dir, max_workers, run_engine=True, driver="print"):
+    """time every stage of a task-core run once"""
+    timer = Timer()
+    mgr = TaskManager(
+        os.path.join(data_dir, "services"),
+        os.path.join(data_dir, "inventory.yaml"),
+        os.path.join(data_dir, "roles.yaml"),
+        skip_loading=True,
+    )
+    data = timer.time("service_load", load_services, mgr.services_dir)
+    mgr.services = timer.time("schema_validation", validate_services, data)
+    timer.time("resolve_service_deps", mgr.resolve_service_deps)
+
+    def load_inventory():
+        mgr.load_inventory()
+        mgr.load_roles()
+
+    timer.time("inventory_load", load_inventory)
+    timer.time("hosts_to_services", mgr.hosts_to_services)
+    flow = timer.time("create_flow", mgr.create_flow)
+    engine = timer.time("engine_compile", compile_engine, flow, max_workers)
+    if run_engine:
+        # only the run is timed, the flows and engines are built beforehand
+        for stage, task_type in (("noop_run", NoopTask), ("print_run", PrintTask)):
+            stage_engine = compile_engine(mgr.create_flow(task_type), max_workers)
+            timer.time(stage, stage_engine.run)
+        if driver == "bench":
+            timer.time("bench_run", engine.run)
+    return timer.results
+
+
+def summarize(runs):
+    summary = {}
+    for stage in STAGES:
+        values = [r[stage] for r in runs if stage in r]
+        if not values:
+            continue
+        summary[stage] = {
+            "min": min(values),
+            "median": statistics.median(values),
+            "max": max(values),
+        }
+    return summary
+
+
+def compare(results, baseline_file, threshold):
+    """return the stages that regressed by more than threshold percent"""
+    with open(baseline_file, encoding="utf-8", mode="r") as fin:
+        baseline = json.load(fin)
+    if baseline.get("parameters") != results["parameters"]:
+        print("WARNING: baseline was generated with different parameters")
+    regressions = {}
+    for stage, values in results["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or not old["median"]:
+            continue
+        change = (values["median"] - old["median"]) / old["median"] * 100
+        print(
+            f"{stage:>22}: {old['median']:.4f}s -> {values['median']:.4f}s "
+            f"({change:+.1f}%)"
+        )
+        if change > threshold:
+            regressions[stage] = change
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="task-core benchmark")
+    parser.add_argument("--hosts", type=int, default=100)
+    parser.add_argument("--services", type=int, default=100)
+    parser.add_argument("--tasks-per-service", type=int, default=4)
+    parser.add_argument("--edge-density", type=int, default=EDGE_DENSITY)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--driver",
+        choices=["print", "bench"],
+        default="print",
+        help="Driver of the generated tasks, bench adds a bench_run stage",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-workers", type=int, default=5)
+    parser.add_argument(
+        "--no-run",
+        action="store_true",
+        help="Skip the noop and print engine runs",
+    )
+    parser.add_argument(
+        "--data-dir",
+        help="Use (or create) scale data in this directory",
+    )
+    parser.add_argument("--output", help="Write json results to this file")
+    parser.add_argument("--compare", help="Compare against a previous result")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=20.0,
+        help="Percent slow down of a stage median reported as a regression",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # task output would dominate the timings of the engine runs
+    logging.basicConfig(level=logging.ERROR)
+    parameters = {
+        "hosts": args.hosts,
+        "services": args.services,
+        "tasks_per_service": args.tasks_per_service,
+        "edge_density": args.edge_density,
+        "seed": args.seed,
+        "driver": args.driver,
+        "max_workers": args.max_workers,
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = args.data_dir or tmp_dir
+        if not os.path.exists(os.path.join(data_dir, "roles.yaml")):
+            gen_scale_data(
+                data_dir,
+                hosts=args.hosts,
+                services=args.services,
+                tasks_per_service=args.tasks_per_service,
+                edge_density=args.edge_density,
+                seed=args.seed,
+                driver=args.driver,
+                quiet=True,
+            )
+        runs = [
+            run_pipeline(data_dir, args.max_workers, not args.no_run, args.driver)
+            for _ in range(args.repeat)
+        ]
+    results = {
+        "parameters": parameters,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "stages": summarize(runs),
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, encoding="utf-8", mode="w") as fout:
+            json.dump(results, fout, indent=2)
+    else:
+        json.dump(results["stages"], sys.stdout, indent=2)
+        print()
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"Regressions found: {', '.join(sorted(regressions))}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,43 +1,75 @@
 """Generate sample scale data"""
+import argparse
+import os
 import random
 import yaml
 
 # generate 1000 hosts
 HOST_COUNT = 1000
-# generate 100 roles
-ROLE_COUNT = int(HOST_COUNT / 10)
 # generate 1000 services
 SERVICE_COUNT = 1000
+# up to 4 tasks per service
+TASKS_PER_SERVICE = 4
+# percent chance that a task requires tasks from other services
+EDGE_DENSITY = 24
+# up to 19 services per role
+SERVICES_PER_ROLE = 19
+# mean seconds of synthetic work per task with the bench driver
+BENCH_MEAN_DURATION = 0.01
 
 
-def dump_yaml(filename, data):
-    print(f"Outputting {filename}...")
+def dump_yaml(filename, data, quiet=False):
+    if not quiet:
+        print(f"Outputting {filename}...")
     with open(filename, encoding="utf-8", mode="w") as outfile:
         yaml.dump(data, outfile, default_flow_style=False)
 
 
-def gen_scale_data():
+def gen_scale_data(
+    output_dir=".",
+    *,
+    hosts=HOST_COUNT,
+    services=SERVICE_COUNT,
+    tasks_per_service=TASKS_PER_SERVICE,
+    edge_density=EDGE_DENSITY,
+    seed=None,
+    driver="print",
+    quiet=False,
+):  # pylint: disable=too-many-locals
+    """generate inventory, roles and services into output_dir
+
+    The same seed and parameters always generate the same data.
+    """
+    rng = random.Random(seed)
+    role_count = max(1, int(hosts / 10))
+    services_dir = os.path.join(output_dir, "services")
+    os.makedirs(services_dir, exist_ok=True)
+
     # generate inventory data
     inventory = {"hosts": {}}
-    for host in range(0, HOST_COUNT):
-        inventory["hosts"][f"host-{host:04}"] = {"role": f"role-{host % ROLE_COUNT}"}
-    dump_yaml("inventory.yaml", inventory)
+    for host in range(0, hosts):
+        inventory["hosts"][f"host-{host:04}"] = {"role": f"role-{host % role_count}"}
+    dump_yaml(os.path.join(output_dir, "inventory.yaml"), inventory, quiet)
 
     # generate roles data
     roles = {}
-    roles_services = []
-    for role in range(0, ROLE_COUNT):
-        services = []
-        for service in random.sample(range(SERVICE_COUNT), k=random.randrange(1, 20)):
-            services.append(f"service-{service}")
-        roles[f"role-{role}"] = {"services": services}
-        roles_services.extend(services)
+    roles_services = set()
+    for role in range(0, role_count):
+        role_services = []
+        for service in rng.sample(
+            range(services),
+            k=min(services, rng.randrange(1, SERVICES_PER_ROLE + 1)),
+        ):
+            role_services.append(f"service-{service}")
+        roles[f"role-{role}"] = {"services": role_services}
+        roles_services.update(role_services)
 
-    dump_yaml("roles.yaml", roles)
+    dump_yaml(os.path.join(output_dir, "roles.yaml"), roles, quiet)
 
     # create sample services and relationship data
     provides = []
-    for svc in range(0, SERVICE_COUNT):
+    task_count = 0
+    for svc in range(0, services):
         service_id = f"service-{svc}"
         service = {
             "id": service_id,
@@ -46,16 +78,23 @@ def gen_scale_data():
             "tasks": [],
         }
         service_task_provides = []
-        for tsk in range(random.randrange(1, 5)):
+        for tsk in range(rng.randrange(1, tasks_per_service + 1)):
             task_id = f"task-{tsk}"
             task_provides = f"{service_id}-{task_id}"
             task = {
                 "id": f"task-{tsk}",
-                "driver": "print",
-                "message": f"{service_id} -> {task_id}",
+                "driver": driver,
                 "provides": [task_provides],
                 "requires": [],
             }
+            if driver == "bench":
+                task["duration"] = {
+                    "distribution": "exponential",
+                    "mean": BENCH_MEAN_DURATION,
+                }
+                task["seed"] = seed or 0
+            else:
+                task["message"] = f"{service_id} -> {task_id}"
             # add previous task requirement
             if tsk > 0:
                 task["requires"].append(f"{service_id}-task-{tsk-1}")
@@ -63,22 +102,60 @@ def gen_scale_data():
             if (
                 len(provides) > 0
                 and service_id in roles_services
-                and random.randrange(0, 100) > 75
+                and rng.randrange(0, 100) < edge_density
             ):
                 task["requires"].extend(
-                    random.sample(
-                        provides, k=random.randrange(1, min(3, len(provides)))
+                    rng.sample(
+                        provides, k=rng.randrange(1, max(2, min(3, len(provides))))
                     )
                 )
             service_task_provides.append(task_provides)
             service["tasks"].append(task)
+            task_count += 1
         # add provides at the end to prevent service tasks from requiring tasks
         # from this service only if the service is defined in a role
         if service_id in roles_services:
             provides.extend(service_task_provides)
 
-        dump_yaml(f"services/{service_id}.yaml", service)
+        dump_yaml(os.path.join(services_dir, f"{service_id}.yaml"), service, quiet)
+    return task_count
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="generate sample scale data")
+    parser.add_argument("--output-dir", default=".", help="Output directory")
+    parser.add_argument("--hosts", type=int, default=HOST_COUNT)
+    parser.add_argument("--services", type=int, default=SERVICE_COUNT)
+    parser.add_argument(
+        "--tasks-per-service",
+        type=int,
+        default=TASKS_PER_SERVICE,
+        help="Maximum number of tasks per service",
+    )
+    parser.add_argument(
+        "--edge-density",
+        type=int,
+        default=EDGE_DENSITY,
+        help="Percent chance of a task requiring tasks from other services",
+    )
+    parser.add_argument("--seed", type=int, help="Random seed")
+    parser.add_argument(
+        "--driver",
+        choices=["print", "bench"],
+        default="print",
+        help="Task driver, bench tasks do synthetic work",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    gen_scale_data()
+    args = parse_args()
+    gen_scale_data(
+        args.output_dir,
+        hosts=args.hosts,
+        services=args.services,
+        tasks_per_service=args.tasks_per_service,
+        edge_density=args.edge_density,
+        seed=args.seed,
+        driver=args.driver,
+    )
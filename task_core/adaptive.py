@@ -0,0 +1,129 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""adaptive concurrency limit"""
+import logging
+import time
+
+LOG = logging.getLogger(__name__)
+
+MODES = ["fixed", "adaptive"]
+
+
+class AdaptiveLimit:  # pylint: disable=too-many-instance-attributes
+    """additive increase, multiplicative decrease of the running tasks
+
+    Finished calls are observed in windows of as many calls as the current
+    limit. After a window, the limit is cut by backoff if more than
+    max_error_rate of its calls failed, or if they took on average more than
+    tolerance times the usual duration of calls of the same key (a moving
+    average per driver). Otherwise the limit grows by one up to max_limit.
+    Durations shorter than floor seconds count as floor, the latency of
+    quick calls is mostly noise.
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 5,
+        *,
+        tolerance: float = 2.0,
+        max_error_rate: float = 0.1,
+        backoff: float = 0.5,
+        smoothing: float = 0.2,
+        floor: float = 0.1,
+    ):
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError("limits must satisfy 1 <= min_limit <= max_limit")
+        self._min = min_limit
+        self._max = max_limit
+        self._tolerance = tolerance
+        self._max_error_rate = max_error_rate
+        self._backoff = backoff
+        self._smoothing = smoothing
+        self._floor = floor
+        self._limit = min_limit
+        self._usual = {}
+        self._window = []
+        self._decisions = []
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def decisions(self) -> list:
+        """every change of the limit with the window that caused it"""
+        return self._decisions
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "limit": self._limit,
+            "highest": max([self._min] + [d["limit"] for d in self._decisions]),
+            "increases": sum(d["limit"] > d["previous"] for d in self._decisions),
+            "decreases": sum(d["limit"] < d["previous"] for d in self._decisions),
+        }
+
+    def observe(self, key, seconds: float, failed: bool = False) -> int:
+        """account for a finished call and return the limit to apply"""
+        seconds = max(seconds, self._floor)
+        usual = self._usual.get(key)
+        ratio = None if usual is None else seconds / usual
+        self._window.append((ratio, failed))
+        if not failed:
+            self._usual[key] = (
+                seconds
+                if usual is None
+                else usual + self._smoothing * (seconds - usual)
+            )
+        if len(self._window) >= self._limit:
+            self._decide()
+        return self._limit
+
+    def _decide(self):
+        window, self._window = self._window, []
+        error_rate = sum(failed for _, failed in window) / len(window)
+        ratios = [ratio for ratio, _ in window if ratio is not None]
+        latency = sum(ratios) / len(ratios) if ratios else 1.0
+        if error_rate > self._max_error_rate:
+            reason = "errors"
+        elif latency > self._tolerance:
+            reason = "latency"
+        else:
+            reason = "healthy"
+        if reason == "healthy":
+            limit = min(self._max, self._limit + 1)
+        else:
+            limit = max(self._min, int(self._limit * self._backoff))
+        if limit == self._limit:
+            return
+        LOG.info(
+            "Concurrency %s -> %s (%s): %.0f%% of %s calls failed, "
+            "latency %.2fx usual",
+            self._limit,
+            limit,
+            reason,
+            error_rate * 100,
+            len(window),
+            latency,
+        )
+        self._decisions.append(
+            {
+                "time": time.time(),
+                "previous": self._limit,
+                "limit": limit,
+                "reason": reason,
+                "error_rate": error_rate,
+                "latency": latency,
+            }
+        )
+        self._limit = limit
@@ -13,34 +13,51 @@
 import glob
 import logging
 import os
+import time
 import yaml
 from taskflow import task
 from taskflow.types import sets
+from .events import emit_task
 from .exceptions import InvalidFileData
-from .utils import merge_dict
+from .executor import released
+from .logging import set_current_task
+from .utils import Deadline
+from .utils import LayeredMapping
 
 LOG = logging.getLogger(__name__)
 
+# prefer the libyaml loader when available, it is much faster at scale
+YAML_LOADER = getattr(  # pylint: disable=invalid-name
+    yaml, "CSafeLoader", yaml.SafeLoader
+)
+
 
 class BaseFileData:
     """base object from file"""
 
     def __init__(self, definition):
         self._data = None
-        if os.path.isfile(definition):
+        if isinstance(definition, dict):
+            self._data = definition
+        elif os.path.isfile(definition):
             # if we were given a file, load it
             with open(definition, encoding="utf-8", mode="r") as fin:
-                self._data = yaml.safe_load(fin)
+                self._data = yaml.load(fin, Loader=YAML_LOADER)
         elif os.path.isdir(definition):
-            # if the definition is a directory, then find all the
-            # yaml files in the directory and merge them together
-            self._data = {}
+            # if the definition is a directory, then find all the yaml
+            # files in the directory and layer them in path order, later
+            # files override earlier ones
+            layers = []
             files = glob.glob(os.path.join(definition, "**", "*.y*ml"), recursive=True)
-            for file in files:
+            for file in sorted(files):
                 with open(file, encoding="utf-8", mode="r") as fin:
-                    self._data = merge_dict(self._data, yaml.safe_load(fin))
-        elif isinstance(definition, dict):
-            self._data = definition
+                    layer = yaml.load(fin, Loader=YAML_LOADER)
+                if layer is None:
+                    continue
+                if not isinstance(layer, dict):
+                    raise InvalidFileData(f"{file} does not contain a mapping")
+                layers.append(layer)
+            self._data = LayeredMapping(layers)
         else:
             raise InvalidFileData(
                 "Invalid file data provided. definition "
@@ -61,15 +78,17 @@ class BaseFileData:
 class BaseTask(task.Task):
     """base task"""
 
-    def __init__(self, service: str, data: dict, hosts: list):
+    def __init__(self, service: str, data: dict, hosts: list, name: str = None):
         self._service = service
         self._data = data
         self._hosts = hosts
-        name = f"{service}-{data.get('id')}"
+        name = name or f"{service}-{data.get('id')}"
         provides = data.get("provides", [])
         requires = data.get("requires", [])
         LOG.debug("Creating %s: provides: %s, requires: %s", name, provides, requires)
         super().__init__(name=name, provides=provides, requires=requires)
+        self._attempts = 0
+        self._started = None
 
     @property
     def data(self) -> dict:
@@ -107,10 +126,75 @@ class BaseTask(task.Task):
     def task_needed_by(self) -> list:
         return self._data.get("needed-by", [])
 
+    @property
+    def timeout(self):
+        """seconds the task may run for, None for no limit"""
+        return self._data.get("timeout")
+
+    def deadline(self) -> Deadline:
+        return Deadline(self.timeout)
+
+    @property
+    def retries(self) -> int:
+        """times a failed task is run again before the failure is final"""
+        return self._data.get("retries", 0)
+
+    @property
+    def delay(self) -> float:
+        return self._data.get("delay", 0)
+
+    @property
+    def backoff(self) -> float:
+        return self._data.get("backoff", 1)
+
+    @property
+    def pools(self) -> list:
+        """named concurrency pools the task runs in"""
+        return self._data.get("pools", [])
+
+    @property
+    def started(self) -> float:
+        """monotonic time the current attempt started, None before the first"""
+        return self._started
+
+    @property
+    def attempts(self) -> int:
+        """number of times the task has been started"""
+        return self._attempts
+
+    def reset(self):
+        """forget the attempts of a previous run of the task"""
+        self._attempts = 0
+        self._started = None
+
+    def retry_delay(self, attempt: int) -> float:
+        """seconds to wait before the given attempt, the first is attempt 1"""
+        if attempt < 2:
+            return 0
+        return self.delay * self.backoff ** (attempt - 2)
+
     def update_requires(self, vals: list):
         LOG.debug("Updating %s requires to include %s", self.name, vals)
         self.requires = self.requires.union(sets.OrderedSet(vals))
 
+    def pre_execute(self):
+        # tag the log records of the worker thread for per task log files
+        set_current_task(self.name)
+        self._attempts += 1
+        delay = self.retry_delay(self._attempts)
+        if delay:
+            LOG.info(
+                "%s | Waiting %.1fs before attempt %s", self, delay, self._attempts
+            )
+            # the worker slot is free for other tasks while waiting
+            with released():
+                time.sleep(delay)
+        self._started = time.monotonic()
+        emit_task("started", self, attempt=self._attempts)
+
+    def post_execute(self):
+        set_current_task(None)
+
     def execute(self, *args, **kwargs):
         raise NotImplementedError("Execute function needs to be implemented")
 
@@ -11,6 +11,8 @@
 # under the License.
 """task-core cli"""
 import argparse
+import contextlib
+import json
 import logging
 import os
 import pprint
@@ -18,10 +20,46 @@ import sys
 from datetime import datetime
 
 from taskflow import engines
+from taskflow import states
+from taskflow.types import failure
 
+from . import daemon
+from . import distributed
+from . import events
+from .adaptive import MODES as CONCURRENCY_MODES
 from .exceptions import UnavailableException
+from .executor import make_executor
+from .facts import MODES as FACT_MODES
+from .facts import FactService
+from .graph import TaskGraph
+from .graph import iter_tasks
+from .history import RunHistory
+from .listeners import EventListener
+from .listeners import FailFastListener
+from .listeners import MetricsListener
+from .listeners import ProgressListener
+from .listeners import ResultStoreListener
+from .listeners import TimingListener
+from .logging import LoggingPipeline
 from .logging import setup_basic_logging
 from .manager import TaskManager
+from .metrics import Metrics
+from .metrics import MetricsExporter
+from .plan import FORMATS as PLAN_FORMATS
+from .plan import build_plan
+from .plan import dump_plan
+from .results import ResultStore
+from .results import list_runs
+from .results import query
+from .retries import FAIL_FAST
+from .retries import POLICIES as FAILURE_POLICIES
+from .retries import REVERT_ALL
+from .retries import failure_summary
+from .retries import log_failure_summary
+from .simulate import Simulator
+from .simulate import load_durations
+from .watch import ModelWatcher
+from .watch import make_watcher
 
 LOG = logging.getLogger(__name__)
 
@@ -37,6 +75,20 @@ class Cli:
         return self._parser
 
     def parse_args(self):
+        self.parser.add_argument(
+            "action",
+            nargs="?",
+            default="run",
+            choices=["run", "validate", "simulate", "plan", "daemon", "watch"],
+            help=(
+                "Action to perform. 'run' executes the deployment, "
+                "'validate' only checks the task dependency graph, "
+                "'simulate' predicts the deployment duration, 'plan' "
+                "writes the tasks as waves that can run together, 'daemon' "
+                "keeps the deployment loaded and runs it on request and "
+                "'watch' validates again every time a file changes"
+            ),
+        )
         self.parser.add_argument(
             "-s",
             "--services-dir",
@@ -68,27 +120,528 @@ class Cli:
             default=False,
             help=("Do not run the deployment, only process the tasks"),
         )
+        self.parser.add_argument(
+            "--max-workers",
+            type=int,
+            default=5,
+            help=("Maximum number of tasks to run at the same time"),
+        )
+        self.parser.add_argument(
+            "--concurrency",
+            choices=CONCURRENCY_MODES,
+            default="fixed",
+            help=(
+                "Run up to --max-workers tasks at the same time (fixed), or "
+                "adjust the number of running tasks between --min-workers and "
+                "--max-workers from task durations and failures (adaptive)"
+            ),
+        )
+        self.parser.add_argument(
+            "--min-workers",
+            type=int,
+            default=1,
+            help=("Fewest tasks to run at the same time with adaptive concurrency"),
+        )
+        self.parser.add_argument(
+            "--metrics-textfile",
+            help=(
+                "Write run metrics to this file for the node exporter textfile "
+                "collector, updated during the run"
+            ),
+        )
+        self.parser.add_argument(
+            "--metrics-interval",
+            type=float,
+            default=15.0,
+            help=("Seconds between updates of --metrics-textfile"),
+        )
+        self.parser.add_argument(
+            "--metrics-listen",
+            help=("Serve run metrics on http://<host>:<port>/metrics"),
+        )
+        self.parser.add_argument(
+            "--events",
+            help=(
+                "Write task progress events as JSON lines to this file or fifo, "
+                "or to unix:<path> to send them to a listening unix socket"
+            ),
+        )
+        self.parser.add_argument(
+            "--history",
+            help=(
+                "SQLite run history database. Runs record their task durations "
+                "in it and report their progress and ETA from it"
+            ),
+        )
+        self.parser.add_argument(
+            "--eta-interval",
+            type=float,
+            default=30.0,
+            help=("Seconds between progress and ETA reports with --history"),
+        )
+        self.parser.add_argument(
+            "--pool",
+            action="append",
+            metavar="NAME=N",
+            help=(
+                "Run at most N tasks of the named pool at the same time. A "
+                "pool named after a driver or service limits its tasks, "
+                "per-host limits the tasks of each host. Can be repeated"
+            ),
+        )
+        self.parser.add_argument(
+            "--pools-file",
+            help=("YAML file mapping pool names to their limit"),
+        )
+        self.parser.add_argument(
+            "--listen",
+            default="unix:task-core.sock",
+            help=(
+                "Where the daemon accepts requests, either unix:<path> or "
+                "<host>:<port>"
+            ),
+        )
+        self.parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=0.5,
+            help=("Seconds between checks for changes when inotify is unavailable"),
+        )
+        self.parser.add_argument(
+            "--local-workers",
+            type=int,
+            default=0,
+            help=(
+                "Start this many worker processes on this box for a "
+                "distributed run, see --transport-url"
+            ),
+        )
+        self.parser.add_argument(
+            "--worker-threads",
+            type=int,
+            default=5,
+            help=("Tasks each local worker runs at the same time"),
+        )
+        add_transport_args(self.parser)
+        self.parser.add_argument(
+            "--coalesce-ansible",
+            action="store_true",
+            default=False,
+            help=(
+                "Run chains of dependent ansible_runner tasks sharing the "
+                "same working dir, inventory and hosts as a single playbook"
+            ),
+        )
+        self.parser.add_argument(
+            "--failure-policy",
+            choices=FAILURE_POLICIES,
+            default=REVERT_ALL,
+            help=(
+                "What a failed task does to the run: revert every task "
+                "(revert-all), stop starting tasks without reverting any "
+                "(fail-fast) or only hold back the tasks depending on it "
+                "while independent tasks run to completion "
+                "(continue-independent)"
+            ),
+        )
+        self.parser.add_argument(
+            "--facts",
+            choices=FACT_MODES,
+            default="off",
+            help=(
+                "Gather ansible facts once per host for the whole run, either "
+                "when a task first needs them (lazy) or before the run starts "
+                "(eager)"
+            ),
+        )
+        self.parser.add_argument(
+            "--facts-max-age",
+            type=int,
+            default=3600,
+            help=("Seconds before gathered facts are considered stale"),
+        )
+        self.parser.add_argument(
+            "--facts-cache-dir",
+            help=("Fact cache directory, a temporary one is used by default"),
+        )
+        self.parser.add_argument(
+            "--results-dir",
+            help=(
+                "Store task results of the run as compressed json lines in a "
+                "new directory under this one"
+            ),
+        )
+        self.parser.add_argument(
+            "--results-threshold",
+            type=int,
+            default=65536,
+            help=(
+                "Results larger than this many bytes are only kept in the "
+                "results dir, not in memory"
+            ),
+        )
+        self.parser.add_argument(
+            "--async-logging",
+            action="store_true",
+            default=False,
+            help=(
+                "Hand log records to a background thread instead of writing "
+                "them from the task workers"
+            ),
+        )
+        self.parser.add_argument(
+            "--task-log-dir",
+            help=("Also write the logs of each task to <dir>/<task>.log"),
+        )
+        self.parser.add_argument(
+            "--output-rate",
+            type=int,
+            help=(
+                "Maximum lines of command output per task and second shown "
+                "on the console, the rest are counted and suppressed"
+            ),
+        )
+        self.parser.add_argument(
+            "--report-file",
+            help=("Write a json report of the task durations of the run"),
+        )
+        self.parser.add_argument(
+            "--durations-file",
+            help=(
+                "Task duration estimates used by simulate. Either a yaml/json "
+                "mapping of task name to seconds or a run report"
+            ),
+        )
+        self.parser.add_argument(
+            "--default-duration",
+            type=float,
+            default=1.0,
+            help=("Duration in seconds for tasks without an estimate"),
+        )
+        self.parser.add_argument(
+            "--plan-format",
+            choices=PLAN_FORMATS,
+            default="yaml",
+            help=("Format of the plan written by the plan action"),
+        )
+        self.parser.add_argument(
+            "--plan-file",
+            help=("Write the plan to this file instead of stdout"),
+        )
+        self.parser.add_argument(
+            "--sweep",
+            type=int,
+            nargs="+",
+            help=("Simulate each of these max worker counts"),
+        )
         args = self.parser.parse_args()
         return args
 
 
-def main():
-    """task-core"""
-    start = datetime.now()
-    cli = Cli()
-    args = cli.parse_args()
+def add_transport_args(parser, required=False):
+    """options shared by the conductor and workers of a distributed run"""
+    parser.add_argument(
+        "--transport-url",
+        required=required,
+        help=(
+            "Dispatch tasks to task-core-worker processes through this kombu "
+            "transport, e.g. filesystem:// or amqp://host"
+        ),
+    )
+    parser.add_argument(
+        "--transport-dir",
+        help=("Message directory of the filesystem transport"),
+    )
+    parser.add_argument(
+        "--exchange",
+        default=distributed.DEFAULT_EXCHANGE,
+        help=("Exchange name of the distributed run"),
+    )
+    parser.add_argument(
+        "--topic",
+        default=distributed.DEFAULT_TOPIC,
+        help=("Topic the workers listen on"),
+    )
+
+
+def validate(mgr) -> int:
+    """check the task graph and report all problems found"""
+    return log_report(mgr.validate())
+
+
+def log_report(report) -> int:
+    for warning in report.warnings():
+        LOG.warning(warning)
+    for error in report.errors():
+        LOG.error(error)
+    if report.has_errors:
+        LOG.error("Validation failed with %s errors", len(report.errors()))
+        return 1
+    LOG.info("Validation passed")
+    return 0
+
+
+def watch(mgr, args) -> int:
+    """validate the deployment again every time one of its files changes"""
+    watcher = ModelWatcher(
+        mgr,
+        make_watcher(
+            mgr.services_dir,
+            [mgr.inventory_file, mgr.roles_file],
+            args.poll_interval,
+        ),
+    )
+    log_report(watcher.report)
+    LOG.info("Watching %s for changes...", mgr.services_dir)
+    try:
+        watcher.run(log_report)
+    except KeyboardInterrupt:
+        LOG.info("Stopping...")
+    finally:
+        watcher.close()
+    return 0
+
+
+def plan(mgr, args) -> int:
+    """write the deployment as waves of tasks that can run concurrently"""
+    graph = mgr.build_graph()
+    report = graph.validate()
+    if report.has_errors:
+        return log_report(report)
+    output = dump_plan(build_plan(graph), args.plan_format)
+    if args.plan_file:
+        with open(args.plan_file, encoding="utf-8", mode="w") as fout:
+            fout.write(output)
+        LOG.info("Plan written out to %s", args.plan_file)
+    else:
+        sys.stdout.write(output)
+    return 0
+
+
+def simulate(mgr, args) -> int:
+    """predict the makespan of the deployment for one or more worker counts"""
+    graph = TaskGraph.from_tasks(
+        mgr.create_flow(coalesce_ansible=args.coalesce_ansible)
+    )
+    durations = {}
+    if args.durations_file:
+        durations = load_durations(args.durations_file)
+    elif args.history:
+        history = RunHistory(args.history)
+        try:
+            durations = history.estimates(graph)
+        finally:
+            history.close()
+        LOG.info("Estimated %s of %s tasks from history", len(durations), len(graph))
+    sim = Simulator(graph, durations, default_duration=args.default_duration)
+    results = sim.sweep(args.sweep or [args.max_workers])
+    for result in results:
+        LOG.info(
+            "Workers: %s, makespan: %.2fs, utilization: %.1f%%",
+            result.max_workers,
+            result.makespan,
+            result.utilization * 100,
+        )
+    LOG.info(
+        "Critical path (%.2fs): %s",
+        results[-1].critical_time,
+        " -> ".join(results[-1].critical_path),
+    )
+    return 0
+
+
+@contextlib.contextmanager
+def telemetry(args):
+    """export metrics and progress events while running"""
+    with MetricsExporter(
+        args.metrics_textfile, args.metrics_listen, args.metrics_interval
+    ):
+        if args.events:
+            events.open_stream(args.events)
+            LOG.info("Writing progress events to %s", args.events)
+        try:
+            yield
+        finally:
+            events.close_stream()
+
+
+def load_engine(flow, args, executor=None, store=None):
+    """load the engine of a run and return it with what it runs on
+
+    Without a transport url tasks run in this process on the given executor
+    or a new DispatchExecutor, otherwise they are dispatched to worker
+    processes. The executor and workers returned were started for this run
+    and have to be stopped after it. store holds values the flow requires
+    that no task of the flow provides.
+    """
+    if not args.transport_url:
+        owned = None
+        if executor is None:
+            owned = executor = make_executor(args)
+        e = engines.load(flow, store=store, executor=executor, engine="parallel")
+        return e, owned, []
+    LOG.info("Dispatching tasks to workers on %s", args.transport_url)
+    e = distributed.load_engine(
+        flow,
+        args.transport_url,
+        exchange=args.exchange,
+        topic=args.topic,
+        transport_dir=args.transport_dir,
+        store=store,
+    )
+    workers = []
+    if args.local_workers:
+        workers = distributed.start_local_workers(
+            args.local_workers, distributed.worker_options(args)
+        )
+    return e, None, workers
+
+
+def add_progress_listeners(engine, flow, args) -> ProgressListener:
+    """record the progress of the run in the metrics and event stream
+
+    With a run history, the returned listener reports the ETA of the run
+    and collects the task durations to record.
+    """
+    tasks = {task.name: task for task in iter_tasks(flow)}
+    MetricsListener(
+        engine, {name: task.driver for name, task in tasks.items()}
+    ).register()
+    if events.enabled():
+        EventListener(engine, tasks, ready=not args.transport_url).register()
+    if not args.history:
+        return None
+    graph = TaskGraph.from_tasks(flow)
+    history = RunHistory(args.history)
+    try:
+        estimates = history.estimates(graph)
+    finally:
+        history.close()
+    LOG.info("Estimated %s of %s tasks from history", len(estimates), len(graph))
+    progress = ProgressListener(
+        engine,
+        graph,
+        tasks,
+        estimates,
+        max_workers=args.max_workers,
+        interval=args.eta_interval,
+        default_duration=args.default_duration,
+    )
+    progress.register()
+    return progress
+
+
+def record_history(args, progress, start, state) -> None:
+    history = RunHistory(args.history)
+    try:
+        history.record_run(progress.graph, progress.durations, start.timestamp(), state)
+    finally:
+        history.close()
+
+
+def run_engine(engine, flow) -> None:
+    """run the engine, on failure log the tasks that failed and the tasks
+    they kept from running before raising"""
+    try:
+        engine.run()
+        # a fail-fast run is suspended rather than failed
+        failure.Failure.reraise_if_any(list(engine.storage.get_failures().values()))
+    except Exception:
+        log_failure_summary(failure_summary(TaskGraph.from_tasks(flow), engine.storage))
+        raise
+
+
+def run_flow(flow, args, start, executor=None, store=None):
+    # pylint: disable=too-many-locals
+    """run the flow and return the results
+
+    A given executor is left running after the run so it can be reused.
+    """
+    LOG.info("Starting execution...")
+    facts = FactService.instance().configure(
+        args.facts, args.facts_cache_dir, args.facts_max_age
+    )
+    e, owned, workers = load_engine(flow, args, executor, store)
+    local = owned or executor
+    progress = add_progress_listeners(e, flow, args)
+    if args.failure_policy == FAIL_FAST:
+        FailFastListener(e).register()
+    if local:
+        Metrics.instance().track_executor(local)
+    result_store = None
+    if args.results_dir:
+        result_store = ResultStore(args.results_dir, threshold=args.results_threshold)
+        ResultStoreListener(e, result_store).register()
+        LOG.info("Storing task results in %s", result_store.path)
+    state = states.FAILURE
+    try:
+        # workers gather facts for the tasks they run
+        if not args.transport_url:
+            facts.prefetch(iter_tasks(flow))
+        with TimingListener(e) as timing:
+            run_engine(e, flow)
+        state = states.SUCCESS
+    finally:
+        if owned:
+            owned.shutdown()
+        distributed.stop_local_workers(workers)
+        facts.close()
+        if progress:
+            record_history(args, progress, start, state)
+    result = e.storage.fetch_all()
+    LOG.info("Ran %s tasks...", len(result.keys()))
+    LOG.info("Stats: %s", e.statistics)
+    LOG.info("Retry stats: %s", timing.retries)
+    pools = local.pools.stats if local and local.pools else {}
+    concurrency = local.controller if local else None
+    if pools:
+        LOG.info("Pool stats: %s", pools)
+    if concurrency:
+        LOG.info("Concurrency stats: %s", concurrency.stats)
+    if facts.enabled:
+        LOG.info("Fact stats: %s", facts.stats)
+    if result_store:
+        LOG.info("Result store %s: %s", result_store.run_id, result_store.stats)
+    if args.report_file:
+        timing.write_report(
+            args.report_file,
+            elapsed=(datetime.now() - start).total_seconds(),
+            statistics=e.statistics,
+            facts=facts.stats,
+            pools=pools,
+            concurrency=concurrency.decisions if concurrency else [],
+        )
+    return result
+
+
+def execute(args, start) -> int:
+    """load the services and perform the requested action"""
+    if args.action == "daemon":
+        with telemetry(args):
+            return daemon.serve(args, run_flow)
 
-    setup_basic_logging(args.debug)
     mgr = TaskManager(args.services_dir, args.inventory_file, args.roles_file)
-    flow = mgr.create_flow()
+
+    if args.action == "watch":
+        return watch(mgr, args)
+
+    if args.action in ("validate", "simulate", "plan"):
+        if args.action == "validate":
+            ret = validate(mgr)
+        elif args.action == "plan":
+            ret = plan(mgr, args)
+        else:
+            ret = simulate(mgr, args)
+        LOG.info("Elapsed time: %s", datetime.now() - start)
+        return ret
+
+    flow = mgr.create_flow(
+        coalesce_ansible=args.coalesce_ansible, failure_policy=args.failure_policy
+    )
 
     if not args.noop:
-        LOG.info("Starting execution...")
-        e = engines.load(flow, executor="threaded", engine="parallel", max_workers=5)
-        e.run()
-        result = e.storage.fetch_all()
-        LOG.info("Ran %s tasks...", len(result.keys()))
-        LOG.info("Stats: %s", e.statistics)
+        with telemetry(args):
+            result = run_flow(flow, args, start)
     else:
         result = None
         try:
@@ -101,6 +654,140 @@ def main():
     LOG.info("Elapsed time: %s", end - start)
     LOG.info("Done...")
     LOG.debug(result)
+    return 0
+
+
+def main():
+    """task-core"""
+    start = datetime.now()
+    cli = Cli()
+    args = cli.parse_args()
+
+    pipeline = None
+    if args.async_logging or args.task_log_dir or args.output_rate:
+        pipeline = LoggingPipeline(
+            args.debug, args.task_log_dir, args.output_rate
+        ).start()
+    else:
+        setup_basic_logging(args.debug)
+    try:
+        return execute(args, start)
+    finally:
+        if pipeline:
+            stats = pipeline.stats
+            LOG.info(
+                "Log lines dropped: %s, coalesced: %s",
+                stats["dropped"],
+                stats["coalesced"],
+            )
+            pipeline.stop()
+
+
+def query_results():
+    """task-core-results"""
+    parser = argparse.ArgumentParser(description="Query stored task results")
+    parser.add_argument("results_dir", help="Directory given to --results-dir")
+    parser.add_argument(
+        "--run", help="Run id to query, defaults to the most recent run"
+    )
+    parser.add_argument(
+        "--list-runs", action="store_true", help="List the stored run ids"
+    )
+    parser.add_argument("--task", help="Only tasks matching this glob pattern")
+    parser.add_argument(
+        "--state",
+        choices=["success", "failure"],
+        help="Only results of tasks in this state",
+    )
+    parser.add_argument("--data", action="store_true", help="Include the result data")
+    args = parser.parse_args()
+
+    runs = list_runs(args.results_dir)
+    if args.list_runs:
+        for run in runs:
+            print(run)
+        return 0
+    run = args.run or (runs[-1] if runs else None)
+    if run not in runs:
+        print(f"No stored results found for run {run}", file=sys.stderr)
+        return 1
+    for record in query(
+        os.path.join(args.results_dir, run), args.task, args.state, args.data
+    ):
+        print(json.dumps(record, default=str))
+    return 0
+
+
+def query_history():
+    """task-core-history"""
+    parser = argparse.ArgumentParser(
+        description="Query the run history, lists the most recent runs by default"
+    )
+    parser.add_argument("history", help="Database given to --history")
+    parser.add_argument(
+        "--slowest",
+        type=int,
+        metavar="N",
+        help="Show the N tasks with the longest median duration",
+    )
+    parser.add_argument(
+        "--trend",
+        metavar="PATTERN",
+        help="Show the durations of the tasks matching this glob pattern",
+    )
+    parser.add_argument(
+        "--limit", type=int, default=20, help="Number of runs to look at"
+    )
+    args = parser.parse_args()
+
+    if not os.path.exists(args.history):
+        print(f"No run history found in {args.history}", file=sys.stderr)
+        return 1
+    history = RunHistory(args.history, samples=args.limit)
+    try:
+        if args.slowest:
+            records = history.slowest(args.slowest)
+        elif args.trend:
+            trends = {}
+            for row in history.trend(args.trend, args.limit):
+                trends.setdefault(row["name"], []).append(
+                    {k: row[k] for k in ("run_id", "state", "duration")}
+                )
+            records = [{"name": name, "runs": runs} for name, runs in trends.items()]
+        else:
+            records = history.runs(args.limit)
+    finally:
+        history.close()
+    for record in records:
+        print(json.dumps(record, default=str))
+    return 0
+
+
+def worker():
+    """task-core-worker"""
+    parser = argparse.ArgumentParser(
+        description="Run the tasks of a distributed task-core run"
+    )
+    parser.add_argument("-s", "--services-dir", required=True)
+    parser.add_argument("-i", "--inventory-file", required=True)
+    parser.add_argument("-r", "--roles-file", required=True)
+    parser.add_argument("-d", "--debug", action="store_true", default=False)
+    parser.add_argument(
+        "--threads", type=int, default=5, help="Tasks to run at the same time"
+    )
+    parser.add_argument(
+        "--coalesce-ansible",
+        action="store_true",
+        default=False,
+        help="Must match the option given to the conductor",
+    )
+    parser.add_argument("--facts", choices=FACT_MODES, default="off")
+    parser.add_argument("--facts-max-age", type=int, default=3600)
+    parser.add_argument("--facts-cache-dir")
+    add_transport_args(parser, required=True)
+    args = parser.parse_args()
+    distributed.run_worker(distributed.worker_options(args))
+    return 0
 
 
 def example():
@@ -0,0 +1,395 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""long running task-core daemon"""
+import collections
+import copy
+import fnmatch
+import http.server
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from . import distributed
+from .executor import make_executor
+from .graph import iter_tasks
+from .manager import TaskManager
+from .metrics import reply_metrics
+
+LOG = logging.getLogger(__name__)
+
+# number of built flows kept between runs, one per kind of run or slice
+FLOW_CACHE_SIZE = 8
+
+
+class Run:  # pylint: disable=too-many-instance-attributes
+    """state of a run started by the daemon"""
+
+    def __init__(self, kind: str, tasks: list):
+        self._run_id = uuid.uuid4().hex[:12]
+        self._kind = kind
+        self._tasks = tasks
+        self._state = "PENDING"
+        self._started = None
+        self._finished = None
+        self._error = None
+        self._ran = 0
+
+    @property
+    def run_id(self) -> str:
+        return self._run_id
+
+    @property
+    def kind(self) -> str:
+        """either run or slice"""
+        return self._kind
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def done(self) -> bool:
+        return self._state in ("SUCCESS", "FAILURE")
+
+    def start(self) -> None:
+        self._state = "RUNNING"
+        self._started = time.time()
+
+    def finish(self, ran: int = 0, error: Exception = None) -> None:
+        self._ran = ran
+        self._error = error
+        self._state = "FAILURE" if error else "SUCCESS"
+        self._finished = time.time()
+
+    def as_dict(self) -> dict:
+        end = self._finished or time.time()
+        return {
+            "id": self.run_id,
+            "kind": self._kind,
+            "state": self.state,
+            "tasks": len(self._tasks),
+            "ran": self._ran,
+            "started": self._started,
+            "elapsed": end - self._started if self._started else None,
+            "error": str(self._error) if self._error else None,
+        }
+
+
+class Daemon:  # pylint: disable=too-many-instance-attributes
+    """keeps the loaded deployment and the workers warm between runs
+
+    Services, inventory and roles are loaded and resolved once. The flows
+    built from them are kept until the next reload, so a repeated run or
+    slice only resets the run state of its tasks and runs the same flow on
+    the same executor, or the same local worker processes of a distributed
+    run. One run is active at a time.
+    """
+
+    def __init__(self, args, run_flow):
+        self._args = args
+        self._run_flow = run_flow
+        self._lock = threading.Lock()
+        self._mgr = None
+        self._loaded = None
+        self._flows = collections.OrderedDict()
+        self._runs = {}
+        self._active = None
+        self._executor = None
+        self._workers = []
+        self.load()
+
+    @property
+    def manager(self) -> TaskManager:
+        return self._mgr
+
+    def load(self) -> None:
+        """(re)load the services, inventory and roles"""
+        with self._lock:
+            if self._active and not self._active.done:
+                raise RuntimeError("Cannot reload while a run is active")
+            start = time.monotonic()
+            self._mgr = TaskManager(
+                self._args.services_dir,
+                self._args.inventory_file,
+                self._args.roles_file,
+            )
+            self._loaded = time.time()
+            self._flows.clear()
+            LOG.info("Loaded deployment in %.2fs", time.monotonic() - start)
+            # workers of a distributed run load the deployment themselves
+            self._stop_workers()
+            self._start_workers()
+
+    def _start_workers(self):
+        if not self._args.transport_url:
+            self._executor = make_executor(self._args)
+        elif self._args.local_workers:
+            options = distributed.worker_options(self._args)
+            self._workers = distributed.start_local_workers(
+                self._args.local_workers, options
+            )
+
+    def _stop_workers(self):
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+        distributed.stop_local_workers(self._workers)
+        self._workers = []
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop_workers()
+
+    def select(self, patterns: list, upstream: bool = False) -> list:
+        """names of the tasks matching the patterns
+
+        A pattern is matched against task and service names. With upstream
+        the tasks the matched tasks depend on are selected too.
+        """
+        graph = self._mgr.build_graph()
+        names = set()
+        for name, node in graph.nodes.items():
+            for pattern in patterns:
+                if fnmatch.fnmatchcase(name, pattern) or fnmatch.fnmatchcase(
+                    node.service, pattern
+                ):
+                    names.add(name)
+                    break
+        if upstream:
+            names.update(graph.upstream(names))
+        return [name for name in graph.topological_order() if name in names]
+
+    def start_run(self, patterns: list = None, upstream: bool = False) -> Run:
+        """start a run of the whole deployment or of a slice of it"""
+        with self._lock:
+            if self._active and not self._active.done:
+                raise RuntimeError(f"Run {self._active.run_id} is still active")
+            task_names = None
+            store = None
+            if patterns:
+                task_names = self.select(patterns, upstream)
+                if not task_names:
+                    raise ValueError("No task matches the slice")
+                store = self._external_values(task_names)
+            flow = self._flow(task_names)
+            run = Run(
+                "slice" if patterns else "run",
+                [task.name for task in iter_tasks(flow)],
+            )
+            self._runs[run.run_id] = run
+            self._active = run
+        thread = threading.Thread(
+            target=self._run, args=(run, flow, store), name=f"run-{run.run_id}"
+        )
+        thread.daemon = True
+        thread.start()
+        return run
+
+    def _flow(self, task_names):
+        """the flow of the named tasks, built once and reset for every run"""
+        key = (
+            tuple(task_names) if task_names is not None else None,
+            self._args.coalesce_ansible,
+            self._args.failure_policy,
+        )
+        flow = self._flows.get(key)
+        if flow is None:
+            flow = self._mgr.create_flow(
+                coalesce_ansible=self._args.coalesce_ansible,
+                task_names=task_names,
+                failure_policy=self._args.failure_policy,
+            )
+            self._flows[key] = flow
+            while len(self._flows) > FLOW_CACHE_SIZE:
+                self._flows.popitem(last=False)
+        else:
+            self._flows.move_to_end(key)
+            for task in iter_tasks(flow):
+                task.reset()
+        return flow
+
+    def _external_values(self, task_names) -> dict:
+        """values required by a slice that are provided outside of it
+
+        Tasks outside of the slice are expected to have run already, their
+        values are not available to the slice.
+        """
+        graph = self._mgr.build_graph()
+        provided = set()
+        required = set()
+        for name in task_names:
+            provided.update(graph.nodes[name].provides)
+            required.update(graph.nodes[name].requires)
+        return {value: None for value in required - provided}
+
+    def _run(self, run, flow, store):
+        run.start()
+        LOG.info("Starting %s %s", run.kind, run.run_id)
+        args = copy.copy(self._args)
+        # the daemon owns the local workers of distributed runs
+        args.local_workers = 0
+        try:
+            result = self._run_flow(
+                flow, args, datetime.now(), executor=self._executor, store=store
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            LOG.error("Run %s failed: %s", run.run_id, e)
+            run.finish(error=e)
+        else:
+            run.finish(ran=len(result))
+            LOG.info("Run %s finished", run.run_id)
+
+    def wait(self, run_id: str, timeout: float = None) -> Run:
+        """wait for a run to finish, mostly useful in tests"""
+        run = self._runs[run_id]
+        end = None if timeout is None else time.monotonic() + timeout
+        while not run.done and (end is None or time.monotonic() < end):
+            time.sleep(0.05)
+        return run
+
+    def run(self, run_id: str) -> Run:
+        return self._runs.get(run_id)
+
+    def status(self) -> dict:
+        return {
+            "loaded": self._loaded,
+            "services": len(self._mgr.services),
+            "hosts": len(self._mgr.inventory.hosts),
+            "executor": {
+                "max_workers": self._executor.max_workers,
+                "running": self._executor.running,
+                "pending": self._executor.pending,
+                "pools": self._executor.pools.stats,
+                "concurrency": self._executor.controller.stats
+                if self._executor.controller
+                else None,
+            }
+            if self._executor
+            else None,
+            "workers": len(self._workers),
+            "active": self._active.as_dict() if self._active else None,
+            "runs": [run.as_dict() for run in self._runs.values()],
+        }
+
+
+class DaemonRequestHandler(http.server.BaseHTTPRequestHandler):
+    """json api of the daemon
+
+    GET  /status          daemon and run status
+    GET  /runs/<id>       status of a run
+    GET  /metrics         run metrics in the prometheus text format
+    POST /run             run the whole deployment
+    POST /slice           run the tasks matching {"tasks": [patterns]},
+                          with {"upstream": true} their dependencies too
+    POST /reload          reload services, inventory and roles
+    """
+
+    def address_string(self):
+        # unix socket clients have no address
+        return str(self.client_address or "local")
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOG.debug("%s %s", self.address_string(), format % args)
+
+    def _reply(self, code: int, body: dict) -> None:
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        daemon = self.server.task_daemon
+        if self.path == "/status":
+            self._reply(200, daemon.status())
+        elif self.path == "/metrics":
+            reply_metrics(self)
+        elif self.path.startswith("/runs/"):
+            run = daemon.run(self.path[len("/runs/") :])
+            if run is None:
+                self._reply(404, {"error": "Unknown run"})
+            else:
+                self._reply(200, run.as_dict())
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        daemon = self.server.task_daemon
+        try:
+            body = self._body()
+            if self.path == "/run":
+                self._reply(202, daemon.start_run().as_dict())
+            elif self.path == "/slice":
+                run = daemon.start_run(body.get("tasks", []), body.get("upstream"))
+                self._reply(202, run.as_dict())
+            elif self.path == "/reload":
+                daemon.load()
+                self._reply(200, daemon.status())
+            else:
+                self._reply(404, {"error": f"Unknown path {self.path}"})
+        except RuntimeError as e:
+            self._reply(409, {"error": str(e)})
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+
+
+class _TCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    task_daemon = None
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    task_daemon = None
+
+
+def make_server(daemon: Daemon, listen: str):
+    """create the api server, listen is unix:<path> or <host>:<port>"""
+    if listen.startswith("unix:"):
+        path = listen[len("unix:") :]
+        if os.path.exists(path):
+            os.unlink(path)
+        server = _UnixServer(path, DaemonRequestHandler)
+    else:
+        host, _, port = listen.rpartition(":")
+        server = _TCPServer((host or "127.0.0.1", int(port)), DaemonRequestHandler)
+    server.task_daemon = daemon
+    return server
+
+
+def serve(args, run_flow) -> int:
+    """run the daemon until interrupted"""
+    daemon = Daemon(args, run_flow)
+    server = make_server(daemon, args.listen)
+    LOG.info("Listening on %s", args.listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        LOG.info("Stopping...")
+    finally:
+        server.server_close()
+        daemon.close()
+        if args.listen.startswith("unix:"):
+            os.unlink(args.listen[len("unix:") :])
+    return 0
@@ -0,0 +1,258 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""distributed execution with the taskflow worker based engine"""
+import json
+import logging
+import multiprocessing
+
+import futurist
+from oslo_utils import reflection
+from taskflow import engines
+from taskflow.engines.worker_based import endpoint
+from taskflow.types import failure
+
+try:
+    from taskflow.engines.worker_based import server
+except ImportError:
+    # the worker based engine needs kombu for its message transport
+    server = None
+
+from .exceptions import UnavailableException
+from .facts import FactService
+from .graph import iter_tasks
+from .logging import setup_basic_logging
+from .manager import TaskManager
+from .tasks import TaskResult
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_EXCHANGE = "task-core"
+DEFAULT_TOPIC = "task-core-workers"
+
+
+def _check_available():
+    if server is None:
+        raise UnavailableException(
+            "kombu is unavailable. Please install kombu to run distributed."
+        )
+
+
+def transport_options(url: str, transport_dir: str = None) -> dict:
+    """kombu transport options for a transport url
+
+    The filesystem transport exchanges messages through files in
+    transport_dir, so workers on the same box need no broker.
+    """
+    if url.startswith("filesystem://"):
+        if not transport_dir:
+            raise ValueError("The filesystem transport needs a transport dir")
+        return {
+            "data_folder_in": transport_dir,
+            "data_folder_out": transport_dir,
+            "control_folder": transport_dir,
+            "polling_interval": 0.1,
+        }
+    if url.startswith("memory://"):
+        return {"polling_interval": 0.1}
+    return {}
+
+
+def to_wire(result):
+    """turn task results into values the json transport can carry
+
+    Task results arrive on the conductor as {"status": ..., "data": ...}
+    dicts instead of TaskResult objects.
+    """
+
+    def _default(obj):
+        if isinstance(obj, TaskResult):
+            return obj.as_dict()
+        if isinstance(obj, bytes):
+            return obj.decode("utf-8", errors="replace")
+        return str(obj)
+
+    return json.loads(json.dumps(result, default=_default))
+
+
+class TaskEndpoint(endpoint.Endpoint):
+    """worker endpoint handing out the tasks of a loaded deployment
+
+    taskflow endpoints create a new task from its class and name only,
+    which is not enough for task-core tasks. This endpoint looks the task
+    up by name in the tasks the worker built from the same services,
+    inventory and roles as the conductor.
+    """
+
+    def __init__(self, task_cls, tasks: dict):
+        super().__init__(task_cls)
+        self._tasks = tasks
+
+    def generate(self, name=None):
+        try:
+            return self._tasks[name]
+        except KeyError as e:
+            raise UnavailableException(f"Task {name} is unknown to this worker") from e
+
+    def execute(self, task, **kwargs):
+        result = super().execute(task, **kwargs)
+        if isinstance(result, failure.Failure):
+            return result
+        return to_wire(result)
+
+
+class TaskWorker:
+    """worker process side of a distributed run
+
+    Serves every task of the deployment, so any worker can run any task.
+    Workers sharing a topic share the work between them.
+    """
+
+    def __init__(
+        self,
+        tasks,
+        url: str,
+        *,
+        exchange: str = DEFAULT_EXCHANGE,
+        topic: str = DEFAULT_TOPIC,
+        threads: int = 5,
+        transport_dir: str = None,
+    ):
+        _check_available()
+        by_name = {task.name: task for task in iter_tasks(tasks)}
+        classes = {}
+        for task in by_name.values():
+            classes.setdefault(reflection.get_class_name(task), type(task))
+        self._endpoints = [TaskEndpoint(cls, by_name) for cls in classes.values()]
+        self._executor = futurist.ThreadPoolExecutor(max_workers=threads)
+        self._server = server.Server(
+            topic,
+            exchange,
+            self._executor,
+            self._endpoints,
+            url=url,
+            transport_options=transport_options(url, transport_dir),
+        )
+        self._tasks = by_name
+
+    @property
+    def tasks(self) -> dict:
+        return self._tasks
+
+    def run(self) -> None:
+        """serve requests until stopped"""
+        LOG.info("Worker serving %s tasks", len(self._tasks))
+        self._server.start()
+
+    def wait(self) -> None:
+        """wait until the worker is serving"""
+        self._server.wait()
+
+    def stop(self) -> None:
+        self._server.stop()
+        self._executor.shutdown()
+
+
+def load_engine(
+    flow,
+    url: str,
+    *,
+    exchange: str = DEFAULT_EXCHANGE,
+    topic: str = DEFAULT_TOPIC,
+    transport_dir: str = None,
+    store: dict = None,
+):
+    """load a worker based engine dispatching the flow to workers"""
+    _check_available()
+    return engines.load(
+        flow,
+        store=store,
+        engine="worker-based",
+        url=url,
+        exchange=exchange,
+        topics=[topic],
+        transport_options=transport_options(url, transport_dir),
+    )
+
+
+def worker_options(args) -> dict:
+    """options a worker needs to load the same deployment as the conductor"""
+    keys = (
+        "services_dir",
+        "inventory_file",
+        "roles_file",
+        "debug",
+        "coalesce_ansible",
+        "facts",
+        "facts_cache_dir",
+        "facts_max_age",
+        "transport_url",
+        "transport_dir",
+        "exchange",
+        "topic",
+    )
+    options = {key: getattr(args, key) for key in keys}
+    options["threads"] = getattr(args, "threads", None) or args.worker_threads
+    return options
+
+
+def run_worker(options: dict) -> None:
+    """load the deployment and serve its tasks until killed
+
+    options holds the worker command line options as a dict so the
+    function can be the target of a spawned process.
+    """
+    setup_basic_logging(options.get("debug", False))
+    FactService.instance().configure(
+        options.get("facts", "off"),
+        options.get("facts_cache_dir"),
+        options.get("facts_max_age", 3600),
+    )
+    mgr = TaskManager(
+        options["services_dir"], options["inventory_file"], options["roles_file"]
+    )
+    flow = mgr.create_flow(coalesce_ansible=options.get("coalesce_ansible", False))
+    worker = TaskWorker(
+        flow,
+        options["transport_url"],
+        exchange=options.get("exchange", DEFAULT_EXCHANGE),
+        topic=options.get("topic", DEFAULT_TOPIC),
+        threads=options.get("threads", 5),
+        transport_dir=options.get("transport_dir"),
+    )
+    try:
+        worker.run()
+    finally:
+        worker.stop()
+        FactService.instance().close()
+
+
+def start_local_workers(count: int, options: dict) -> list:
+    """start count worker processes on this box"""
+    _check_available()
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for idx in range(count):
+        proc = context.Process(
+            target=run_worker, args=(options,), name=f"task-core-worker-{idx}"
+        )
+        proc.daemon = True
+        proc.start()
+        workers.append(proc)
+    LOG.info("Started %s local workers", count)
+    return workers
+
+
+def stop_local_workers(workers: list) -> None:
+    for proc in workers:
+        proc.terminate()
+    for proc in workers:
+        proc.join()
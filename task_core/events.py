@@ -0,0 +1,146 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""structured progress events as json lines"""
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+_STREAM = None
+
+
+class EventStream:
+    """write events to a file, a fifo or a unix socket from a thread
+
+    target is a path, opened for appending, or unix:<path> to connect to a
+    listening unix socket. Emitting only queues the event, so a slow or
+    missing reader never holds up the run. When the target can not be
+    opened or written to, the remaining events are dropped.
+    """
+
+    def __init__(self, target: str):
+        self._target = target
+        self._queue = queue.SimpleQueue()
+        self._written = 0
+        self._dropped = 0
+        self._thread = threading.Thread(
+            target=self._run, name="task-core-events", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def stats(self) -> dict:
+        return {"written": self._written, "dropped": self._dropped}
+
+    def emit(self, event: str, **fields) -> None:
+        self._queue.put({"event": event, "time": time.time(), **fields})
+
+    def _open(self):
+        if self._target.startswith("unix:"):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self._target[len("unix:") :])
+            return sock.makefile(mode="w", encoding="utf-8")
+        # opening a fifo waits for a reader
+        return open(self._target, encoding="utf-8", mode="a")
+
+    def _batches(self):
+        """lists of the queued events until the stream is closed"""
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < 1000:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            closing = batch[-1] is None
+            yield [event for event in batch if event is not None]
+            if closing:
+                return
+
+    def _run(self):
+        batches = self._batches()
+        try:
+            fout = self._open()
+        except OSError as e:
+            LOG.warning("Unable to open event stream %s: %s", self._target, e)
+            fout = None
+        for batch in batches:
+            if fout is None:
+                self._dropped += len(batch)
+                continue
+            try:
+                fout.write(
+                    "".join(json.dumps(event, default=str) + "\n" for event in batch)
+                )
+                fout.flush()
+                self._written += len(batch)
+            except OSError as e:
+                LOG.warning("Unable to write to event stream %s: %s", self._target, e)
+                self._dropped += len(batch)
+                fout = None
+        if fout is not None:
+            try:
+                fout.close()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        """write the queued events and close the target"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def open_stream(target: str) -> EventStream:
+    """send the events of this process to target until close_stream()"""
+    global _STREAM  # pylint: disable=global-statement
+    close_stream()
+    _STREAM = EventStream(target)
+    return _STREAM
+
+
+def close_stream() -> None:
+    global _STREAM  # pylint: disable=global-statement
+    if _STREAM is not None:
+        _STREAM.close()
+        LOG.info("Event stream stats: %s", _STREAM.stats)
+        _STREAM = None
+
+
+def enabled() -> bool:
+    return _STREAM is not None
+
+
+def emit(event: str, **fields) -> None:
+    """queue an event if a stream is open"""
+    stream = _STREAM
+    if stream is not None:
+        stream.emit(event, **fields)
+
+
+def emit_task(event: str, task, **fields) -> None:
+    """queue an event about a task if a stream is open"""
+    stream = _STREAM
+    if stream is None:
+        return
+    # hosts are serialized later by the writer thread, they are not copied
+    stream.emit(
+        event,
+        task=task.name,
+        service=getattr(task, "service", None),
+        driver=getattr(task, "driver", None),
+        hosts=getattr(task, "hosts", None) or [],
+        **fields,
+    )
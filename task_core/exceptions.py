@@ -24,6 +24,10 @@ class ExecutionFailed(Exception):
     """Exception for execute failures"""
 
 
+class TaskTimeout(ExecutionFailed):
+    """Exception if a task did not finish within its timeout"""
+
+
 class InvalidFileData(Exception):
     """Exception for Invalid File data"""
 
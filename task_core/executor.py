@@ -0,0 +1,315 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""task executors"""
+import collections
+import contextlib
+import logging
+import queue
+import threading
+import time
+from concurrent import futures
+
+from taskflow.types import failure
+
+from .adaptive import AdaptiveLimit
+from .pools import Pools
+from .pools import load_pools
+
+LOG = logging.getLogger(__name__)
+
+_LOCAL = threading.local()
+
+# seconds an idle thread waits for a call before it exits
+IDLE_TIMEOUT = 60
+
+
+@contextlib.contextmanager
+def released():
+    """let another task start while the calling task waits on something
+
+    This is a no-op unless the caller runs in a DispatchExecutor.
+    """
+    executor = getattr(_LOCAL, "executor", None)
+    if executor is None:
+        yield
+        return
+    with executor.released():
+        yield
+
+
+def _failed(result) -> bool:
+    """whether the result of an engine call holds a task failure"""
+    # the engine catches task errors and returns (event, Failure) instead
+    return isinstance(result, tuple) and any(
+        isinstance(item, failure.Failure) for item in result
+    )
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    """a submitted call waiting for a slot"""
+
+    __slots__ = ("future", "func", "args", "kwargs", "pools", "blocked", "key")
+
+    def __init__(self, future, func, args, kwargs, pools):
+        self.future = future
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.pools = pools
+        # calls are compared to others of the same driver for latency
+        self.key = getattr(args[0], "driver", None) if args else None
+        # (pool, since) while the call waits on a full pool
+        self.blocked = None
+
+
+class DispatchExecutor(futures.Executor):
+    # pylint: disable=too-many-instance-attributes
+    """executor that limits the number of running tasks, not threads
+
+    Submitted calls are queued and handed to a thread once one of the
+    max_workers slots is free. A running call can give its slot back while
+    it waits on external work (see released()) so another call can start,
+    and takes a slot again before it continues. Threads are started when no
+    idle one is left, so every call holding a slot is running on a thread,
+    and there are as many threads as calls holding a slot or released.
+
+    With pools, a call for a task also needs a free slot in each of the
+    task's pools (see Pools.keys). Calls waiting on a full pool let later
+    calls start. Pool slots are kept while a call is released, the work it
+    waits on still loads the backend.
+
+    With a controller, the number of slots follows its limit, which it
+    adjusts from the duration and outcome of the finished calls.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 5,
+        pools: Pools = None,
+        controller: AdaptiveLimit = None,
+    ):
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        self._max_workers = controller.limit if controller else max_workers
+        self._pools = pools or Pools()
+        self._controller = controller
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._running = 0
+        self._returning = 0
+        self._shutdown = False
+        self._calls = queue.SimpleQueue()
+        self._idle = 0
+        self._threads = set()
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @property
+    def controller(self) -> AdaptiveLimit:
+        return self._controller
+
+    @property
+    def running(self) -> int:
+        """number of calls currently holding a slot"""
+        with self._cond:
+            return self._running
+
+    @property
+    def threads(self) -> int:
+        """number of threads started and not exited"""
+        with self._cond:
+            return len(self._threads)
+
+    @property
+    def pending(self) -> int:
+        """number of calls waiting for a slot"""
+        with self._cond:
+            return len(self._pending)
+
+    @property
+    def pools(self) -> Pools:
+        return self._pools
+
+    def submit(self, func, *args, **kwargs):  # pylint: disable=arguments-differ
+        future = futures.Future()
+        # the parallel engine submits calls with the task as first argument
+        pools = self._pools.keys(args[0]) if args else ()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            self._pending.append(_Call(future, func, args, kwargs, pools))
+        self._dispatch()
+        return future
+
+    def _next_call(self):
+        """remove and return the first call whose pools have a free slot"""
+        if not self._pools:
+            return self._pending.popleft()
+        now = time.monotonic()
+        for idx, call in enumerate(self._pending):
+            blocking = self._pools.blocking(call.pools)
+            if call.blocked and call.blocked[0] != blocking:
+                self._pools.waited(call.blocked[0], now - call.blocked[1])
+                call.blocked = None
+            if blocking:
+                if call.blocked is None:
+                    call.blocked = (blocking, now)
+                continue
+            del self._pending[idx]
+            self._pools.acquire(call.pools)
+            return call
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                # calls coming back from released() go first
+                if (
+                    not self._pending
+                    or self._returning
+                    or self._running >= self._max_workers
+                ):
+                    return
+                call = self._next_call()
+                if call is None:
+                    return
+                self._running += 1
+            if not call.future.set_running_or_notify_cancel():
+                self._free_slot(call.pools)
+                continue
+            self._start(call)
+
+    def _start(self, call):
+        """hand the call to an idle thread, or to a new one"""
+        with self._cond:
+            # idle threads exit on shutdown
+            if self._idle and not self._shutdown:
+                self._idle -= 1
+                thread = None
+            else:
+                thread = threading.Thread(
+                    target=self._worker,
+                    name=f"task-core-{len(self._threads)}",
+                    daemon=True,
+                )
+                self._threads.add(thread)
+        self._calls.put(call)
+        if thread:
+            thread.start()
+
+    def _worker(self):
+        while True:
+            try:
+                call = self._calls.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                with self._cond:
+                    # a call may have been handed to this thread meanwhile
+                    if not self._idle:
+                        continue
+                    self._idle -= 1
+                    self._threads.discard(threading.current_thread())
+                    return
+            if call is None:
+                with self._cond:
+                    self._threads.discard(threading.current_thread())
+                return
+            self._run(call)
+            with self._cond:
+                self._idle += 1
+
+    def _run(self, call):
+        _LOCAL.executor = self
+        _LOCAL.held = True
+        start = time.monotonic()
+        try:
+            result = call.func(*call.args, **call.kwargs)
+        except BaseException as exc:  # pylint: disable=broad-except
+            self._finish(call, time.monotonic() - start, True)
+            call.future.set_exception(exc)
+        else:
+            self._finish(call, time.monotonic() - start, _failed(result))
+            call.future.set_result(result)
+
+    def _finish(self, call, seconds, failed):
+        held = _LOCAL.held
+        _LOCAL.executor = None
+        _LOCAL.held = False
+        if self._controller:
+            with self._cond:
+                self._max_workers = self._controller.observe(call.key, seconds, failed)
+        if held:
+            self._free_slot(call.pools)
+        elif call.pools or self._controller:
+            with self._cond:
+                self._pools.release(call.pools)
+            self._dispatch()
+
+    def _free_slot(self, pools=()):
+        with self._cond:
+            self._running -= 1
+            self._pools.release(pools)
+            self._cond.notify_all()
+        self._dispatch()
+
+    def _take_slot(self):
+        with self._cond:
+            self._returning += 1
+            while self._running >= self._max_workers:
+                self._cond.wait()
+            self._returning -= 1
+            self._running += 1
+        self._dispatch()
+
+    @contextlib.contextmanager
+    def released(self):
+        """give the calling call's slot to another call for a while"""
+        if getattr(_LOCAL, "executor", None) is not self or not _LOCAL.held:
+            yield
+            return
+        _LOCAL.held = False
+        # the pool slots are kept, only the worker slot is given back
+        self._free_slot()
+        try:
+            yield
+        finally:
+            self._take_slot()
+            _LOCAL.held = True
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                while self._pending:
+                    self._pending.popleft().future.cancel()
+            if wait:
+                while self._pending or self._running:
+                    self._cond.wait()
+            threads = list(self._threads)
+        for _ in threads:
+            self._calls.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+
+def make_executor(args) -> DispatchExecutor:
+    """the executor of a local run set up from the command line arguments"""
+    controller = None
+    if args.concurrency == "adaptive":
+        controller = AdaptiveLimit(args.min_workers, args.max_workers)
+    return DispatchExecutor(
+        max_workers=args.max_workers,
+        pools=Pools(load_pools(args.pools_file, args.pool)),
+        controller=controller,
+    )
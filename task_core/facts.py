@@ -0,0 +1,182 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""run scoped ansible fact service"""
+import logging
+import shutil
+import tempfile
+import threading
+import time
+
+from .base import BaseInstance
+from .executor import released
+
+LOG = logging.getLogger(__name__)
+
+MODES = ("off", "lazy", "eager")
+
+
+class FactService(BaseInstance):  # pylint: disable=too-many-instance-attributes
+    """gather ansible facts once per host for a whole run
+
+    Facts are stored in a jsonfile fact cache shared by every ansible_runner
+    task of the run. Tasks run with smart gathering, so a play only gathers
+    facts for hosts missing from the cache or older than max_age seconds.
+    Tasks whose hosts are all cached run with explicit gathering, so only
+    plays asking for gather_facts themselves gather again.
+    In lazy mode facts are gathered the first time a task targets a host,
+    in eager mode all hosts are gathered before the flow starts.
+    """
+
+    _instance = None
+    _mode = "off"
+    _max_age = 3600
+    _cache_dir = None
+    _own_cache_dir = False
+    _lock = None
+    _inventory_locks = None
+    _gathered = None
+    _failed = None
+    _stats = None
+
+    def configure(self, mode: str = "lazy", cache_dir: str = None, max_age=3600):
+        if mode not in MODES:
+            raise ValueError(f"Unknown fact service mode {mode}")
+        self.close()
+        self._mode = mode
+        self._max_age = max_age
+        self._own_cache_dir = cache_dir is None and mode != "off"
+        if self._own_cache_dir:
+            cache_dir = tempfile.mkdtemp(prefix="task-core-facts-")
+        self._cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._inventory_locks = {}
+        # (inventory, host) -> (gathered at, seconds it took per host)
+        self._gathered = {}
+        # hosts that could not be gathered are left to the tasks' own plays
+        self._failed = set()
+        self._stats = {
+            "gather_runs": 0,
+            "gathered": 0,
+            "reused": 0,
+            "failed": 0,
+            "gather_time": 0.0,
+            "saved_time": 0.0,
+        }
+        return self
+
+    def close(self) -> None:
+        """remove the fact cache if it was created for this run"""
+        if self._own_cache_dir:
+            shutil.rmtree(self._cache_dir, ignore_errors=True)
+            self._own_cache_dir = False
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @property
+    def enabled(self) -> bool:
+        return self._mode != "off"
+
+    @property
+    def cache_dir(self) -> str:
+        return self._cache_dir
+
+    @property
+    def stats(self) -> dict:
+        """gathering statistics, saved_time estimates the gathering avoided"""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            return dict(self._stats)
+
+    def env(self, cached: bool = False) -> dict:
+        """ansible settings that make a task use the shared fact cache
+
+        cached is what ensure() returned for the task.
+        """
+        return {
+            "ANSIBLE_CACHE_PLUGIN": "jsonfile",
+            "ANSIBLE_CACHE_PLUGIN_CONNECTION": self._cache_dir,
+            "ANSIBLE_CACHE_PLUGIN_TIMEOUT": str(int(self._max_age)),
+            "ANSIBLE_GATHERING": "explicit" if cached else "smart",
+        }
+
+    def _inventory_lock(self, inventory) -> threading.Lock:
+        with self._lock:
+            return self._inventory_locks.setdefault(inventory, threading.Lock())
+
+    def ensure(self, task, hosts: list = None) -> bool:
+        """make sure the facts of the task's hosts are in the cache
+
+        Other tasks targeting the same inventory wait for a gathering in
+        progress instead of starting their own. Returns whether the facts of
+        every host are cached.
+        """
+        if not self.enabled:
+            return False
+        hosts = hosts or task.hosts
+        if not hosts:
+            return False
+        inventory = task.inventory_path
+        # waiting on another task's gathering should not hold a worker slot
+        with released(), self._inventory_lock(inventory):
+            now = time.monotonic()
+            stale = []
+            # gatherings for other inventories update the cache meanwhile
+            with self._lock:
+                for host in hosts:
+                    if (inventory, host) in self._failed:
+                        continue
+                    gathered = self._gathered.get((inventory, host))
+                    if gathered and now - gathered[0] <= self._max_age:
+                        self._stats["reused"] += 1
+                        self._stats["saved_time"] += gathered[1]
+                    else:
+                        stale.append(host)
+            if stale:
+                self._gather(task, inventory, stale)
+            with self._lock:
+                return not any((inventory, host) in self._failed for host in hosts)
+
+    def _gather(self, task, inventory, hosts):
+        LOG.info("%s | Gathering facts for %s hosts", task, len(hosts))
+        start = time.monotonic()
+        try:
+            success = task.gather_facts(hosts)
+        except Exception as e:  # pylint: disable=broad-except
+            LOG.warning("%s | Fact gathering failed: %s", task, e)
+            success = False
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._stats["gather_runs"] += 1
+            self._stats["gather_time"] += elapsed
+            if not success:
+                self._stats["failed"] += len(hosts)
+                self._failed.update((inventory, host) for host in hosts)
+                return
+            self._stats["gathered"] += len(hosts)
+            for host in hosts:
+                self._gathered[(inventory, host)] = (start, elapsed / len(hosts))
+
+    def prefetch(self, tasks) -> None:
+        """gather facts for every host targeted by the given ansible tasks"""
+        if self._mode != "eager":
+            return
+        groups = {}
+        for task in tasks:
+            if not getattr(task, "shared_facts", False):
+                continue
+            _, hosts = groups.setdefault(task.inventory_path, (task, set()))
+            hosts.update(task.hosts)
+        for first, hosts in groups.values():
+            self.ensure(first, sorted(hosts))
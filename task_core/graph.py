@@ -0,0 +1,607 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""task dependency graph"""
+import collections
+import logging
+
+from taskflow import flow as tf_flow
+from taskflow import retry as tf_retry
+
+LOG = logging.getLogger(__name__)
+
+TaskNode = collections.namedtuple(
+    "TaskNode",
+    ["name", "service", "task_id", "driver", "hosts", "provides", "requires"],
+)
+
+
+class GraphReport:
+    """result of a graph validation"""
+
+    def __init__(self, missing, duplicates, cycles, unreachable, inactive=None):
+        self._missing = missing
+        self._duplicates = duplicates
+        self._cycles = cycles
+        self._unreachable = unreachable
+        self._inactive = inactive or {}
+
+    @property
+    def missing(self) -> dict:
+        """required value -> tasks requiring it without a provider"""
+        return self._missing
+
+    @property
+    def duplicates(self) -> dict:
+        """provided value -> tasks providing it more than once"""
+        return self._duplicates
+
+    @property
+    def cycles(self) -> list:
+        """list of task name lists forming dependency cycles"""
+        return self._cycles
+
+    @property
+    def unreachable(self) -> list:
+        """services that are not assigned to any host"""
+        return self._unreachable
+
+    @property
+    def has_errors(self) -> bool:
+        return bool(self.missing or self.duplicates or self.cycles)
+
+    def errors(self) -> list:
+        errors = []
+        for value, names in self.missing.items():
+            msg = f"Missing provider for '{value}' required by {', '.join(names)}"
+            if value in self._inactive:
+                msg += f" (provided by service '{self._inactive[value]}' with no hosts)"
+            errors.append(msg)
+        for value, names in self.duplicates.items():
+            errors.append(f"Duplicate providers for '{value}': {', '.join(names)}")
+        for members in self.cycles:
+            errors.append(f"Dependency cycle between: {', '.join(members)}")
+        return errors
+
+    def warnings(self) -> list:
+        return [
+            f"Service '{svc}' is unreachable, no hosts are assigned to it"
+            for svc in self.unreachable
+        ]
+
+    def as_dict(self) -> dict:
+        return {
+            "missing": self.missing,
+            "duplicates": self.duplicates,
+            "cycles": self.cycles,
+            "unreachable": self.unreachable,
+        }
+
+
+class TaskGraph:  # pylint: disable=too-many-instance-attributes
+    """provides/requires graph of tasks built without taskflow
+
+    Nodes are tasks and an edge u -> v exists when v requires a value that
+    u provides. Every operation here is linear in the size of the graph so
+    it can be used on large deployments before building a flow.
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._providers = {}
+        self._consumers = {}
+        self._by_service = {}
+        self._inactive = {}
+        self._inactive_values = {}
+        self._unreachable = []
+        self._succ = None
+        self._pred = None
+        # what changed since the last validation, see validate()
+        self._changed_names = set()
+        self._changed_values = set()
+
+    @classmethod
+    def from_services(cls, services: dict, skip_hostless: bool = True):
+        """build a graph from a dict of loaded Service objects"""
+        graph = cls()
+        for name, service in services.items():
+            graph.add_service(name, service, skip_hostless)
+        return graph
+
+    @classmethod
+    def from_tasks(cls, tasks):
+        """build a graph from BaseTask objects or a taskflow flow of them"""
+        graph = cls()
+        for task in iter_tasks(tasks):
+            graph.add(
+                TaskNode(
+                    name=task.name,
+                    service=getattr(task, "service", None),
+                    task_id=getattr(task, "task_id", None),
+                    driver=getattr(task, "driver", None),
+                    hosts=list(getattr(task, "hosts", [])),
+                    provides=list(task.provides),
+                    requires=list(task.requires),
+                )
+            )
+        return graph
+
+    def add(self, node: TaskNode):
+        if node.name in self._nodes:
+            raise ValueError(f"Task {node.name} already exists in graph")
+        self._nodes[node.name] = node
+        self._by_service.setdefault(node.service, []).append(node.name)
+        for value in node.provides:
+            self._providers.setdefault(value, []).append(node.name)
+        for value in node.requires:
+            self._consumers.setdefault(value, []).append(node.name)
+        self._changed_names.add(node.name)
+        self._changed_values.update(node.provides)
+        self._changed_values.update(node.requires)
+        if self._succ is None:
+            return
+        # only the edges of the new task are added to the built ones
+        self._succ[node.name] = {}
+        self._pred[node.name] = {}
+        for value in node.requires:
+            for provider in self._providers.get(value, []):
+                self._succ[provider][node.name] = True
+                self._pred[node.name][provider] = True
+        for value in node.provides:
+            for consumer in self._consumers.get(value, []):
+                self._succ[node.name][consumer] = True
+                self._pred[consumer][node.name] = True
+
+    def remove(self, name: str):
+        """remove a task and its edges"""
+        node = self._nodes.pop(name)
+        names = self._by_service[node.service]
+        names.remove(name)
+        if not names:
+            del self._by_service[node.service]
+        for index, values in (
+            (self._providers, node.provides),
+            (self._consumers, node.requires),
+        ):
+            for value in values:
+                names = index[value]
+                names.remove(name)
+                if not names:
+                    del index[value]
+        self._changed_names.add(name)
+        self._changed_values.update(node.provides)
+        self._changed_values.update(node.requires)
+        if self._succ is None:
+            return
+        for provider in self._pred.pop(name):
+            self._succ[provider].pop(name, None)
+        for consumer in self._succ.pop(name):
+            self._pred[consumer].pop(name, None)
+
+    def add_service(self, name: str, service, skip_hostless: bool = True):
+        """add the tasks of a loaded Service object"""
+        if skip_hostless and not service.hosts:
+            self.add_inactive_service(name, service.tasks)
+            return
+        for _task in service.tasks:
+            self.add(
+                TaskNode(
+                    name=f"{name}-{_task.get('id')}",
+                    service=name,
+                    task_id=_task.get("id"),
+                    driver=_task.get("driver", "service"),
+                    hosts=list(service.hosts),
+                    provides=list(_task.get("provides", [])),
+                    requires=list(_task.get("requires", [])),
+                )
+            )
+
+    def remove_service(self, name: str):
+        """remove the tasks of a service, e.g. before adding it again"""
+        for node_name in list(self._by_service.get(name, [])):
+            self.remove(node_name)
+        if name in self._unreachable:
+            self._unreachable.remove(name)
+        for value in self._inactive_values.pop(name, []):
+            if self._inactive.get(value) == name:
+                del self._inactive[value]
+            self._changed_values.add(value)
+
+    def add_inactive_service(self, name: str, tasks: list):
+        """record a service that has no hosts and will not be run"""
+        self._unreachable.append(name)
+        values = self._inactive_values.setdefault(name, [])
+        for _task in tasks:
+            for value in _task.get("provides", []):
+                self._inactive[value] = name
+                values.append(value)
+                self._changed_values.add(value)
+
+    def service_tasks(self, name: str) -> list:
+        """names of the tasks of a service"""
+        return list(self._by_service.get(name, []))
+
+    @property
+    def nodes(self) -> dict:
+        return self._nodes
+
+    @property
+    def unreachable(self) -> list:
+        return self._unreachable
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, name):
+        return name in self._nodes
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def providers(self, value) -> list:
+        return self._providers.get(value, [])
+
+    def _build_edges(self):
+        succ = {name: {} for name in self._nodes}
+        pred = {name: {} for name in self._nodes}
+        for name, node in self._nodes.items():
+            for value in node.requires:
+                for provider in self._providers.get(value, []):
+                    succ[provider][name] = True
+                    pred[name][provider] = True
+        self._succ = succ
+        self._pred = pred
+
+    def successors(self, name) -> list:
+        if self._succ is None:
+            self._build_edges()
+        return list(self._succ[name])
+
+    def predecessors(self, name) -> list:
+        if self._pred is None:
+            self._build_edges()
+        return list(self._pred[name])
+
+    def edges(self):
+        if self._succ is None:
+            self._build_edges()
+        for name, succ in self._succ.items():
+            for child in succ:
+                yield name, child
+
+    def missing(self) -> dict:
+        missing = {}
+        for name, node in self._nodes.items():
+            for value in node.requires:
+                if value not in self._providers:
+                    missing.setdefault(value, []).append(name)
+        return missing
+
+    def duplicates(self) -> dict:
+        return {
+            value: list(names)
+            for value, names in self._providers.items()
+            if len(names) > 1
+        }
+
+    def cycles(self, names=None) -> list:
+        # pylint: disable=too-many-locals,too-many-branches
+        """find all dependency cycles using an iterative tarjan scc
+
+        With names, only the cycles between the given tasks are found.
+        """
+        if self._succ is None:
+            self._build_edges()
+        if names is None:
+            names = self._nodes
+            children_of = self._succ.__getitem__
+        else:
+            names = set(names)
+
+            def children_of(name):
+                return [child for child in self._succ[name] if child in names]
+
+        index = {}
+        lowlink = {}
+        on_stack = set()
+        stack = []
+        cycles = []
+        counter = 0
+        for root in names:
+            if root in index:
+                continue
+            work = [(root, iter(children_of(root)))]
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, children = work[-1]
+                advanced = False
+                for child in children:
+                    if child not in index:
+                        index[child] = lowlink[child] = counter
+                        counter += 1
+                        stack.append(child)
+                        on_stack.add(child)
+                        work.append((child, iter(children_of(child))))
+                        advanced = True
+                        break
+                    if child in on_stack:
+                        lowlink[node] = min(lowlink[node], index[child])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    members = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        members.append(member)
+                        if member == node:
+                            break
+                    if len(members) > 1 or node in self._succ[node]:
+                        cycles.append(list(reversed(members)))
+        return cycles
+
+    def topological_order(self) -> list:
+        """kahn ordering, ties are broken by insertion order"""
+        if self._pred is None:
+            self._build_edges()
+        indegree = {name: len(pred) for name, pred in self._pred.items()}
+        ready = collections.deque(n for n, d in indegree.items() if d == 0)
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            for child in self._succ[name]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+        if len(order) != len(self._nodes):
+            raise ValueError("Task graph contains a dependency cycle")
+        return order
+
+    def levels(self):
+        """earliest and latest start level of every task
+
+        A task at level n depends on a task at level n - 1. The earliest
+        level is the length of the longest dependency chain leading to the
+        task. The latest is the last level it can start at without making
+        the deepest chain longer. Returns both as dicts of task name to
+        level, computed in linear time.
+        """
+        order = self.topological_order()
+        earliest = {}
+        for name in order:
+            earliest[name] = max((earliest[p] + 1 for p in self._pred[name]), default=0)
+        depth = max(earliest.values(), default=0)
+        latest = {}
+        for name in reversed(order):
+            latest[name] = min((latest[s] - 1 for s in self._succ[name]), default=depth)
+        return earliest, latest
+
+    def grouped_order(self, key) -> list:  # pylint: disable=too-many-locals
+        """topological order keeping tasks with the same key together
+
+        Returns batches of task names in dependency order, the tasks of a
+        batch share the same hashable key() value. A batch runs every task
+        of its key that is ready or becomes ready within the batch. The
+        next batch is picked greedily, looking one batch ahead: the key
+        whose batch plus the largest batch that could follow it covers the
+        most tasks, ties go to the key that became ready first. This keeps
+        the number of batches low, it is not guaranteed to be the minimum.
+        """
+        if self._pred is None:
+            self._build_edges()
+        keys = {name: key(name) for name in self._nodes}
+        indegree = {name: len(pred) for name, pred in self._pred.items()}
+        ready = collections.OrderedDict()
+        for name, degree in indegree.items():
+            if degree == 0:
+                ready.setdefault(keys[name], []).append(name)
+
+        def _score(group):
+            batch, released, done = self._drain(
+                group, ready[group], keys, lambda n: indegree[n]
+            )
+            best = 0
+            for other in set(ready) | set(released):
+                if other == group:
+                    continue
+                names = ready.get(other, []) + released.get(other, [])
+                after = self._drain(
+                    other, names, keys, lambda n: indegree[n] - done.get(n, 0)
+                )[0]
+                best = max(best, len(after))
+            return len(batch) + best
+
+        batches = []
+        while ready:
+            group = max(ready, key=_score)
+            batch, released, done = self._drain(
+                group, ready.pop(group), keys, lambda n: indegree[n]
+            )
+            for name, count in done.items():
+                indegree[name] -= count
+            for other, names in released.items():
+                ready.setdefault(other, []).extend(names)
+            batches.append(batch)
+        if sum(len(batch) for batch in batches) != len(self._nodes):
+            raise ValueError("Task graph contains a dependency cycle")
+        return batches
+
+    def _drain(self, group, names, keys, remaining):
+        """run the ready names and every task of group they make ready
+
+        remaining(name) is the number of unfinished predecessors of a task.
+        Returns the batch, the tasks of other keys made ready by it and
+        the number of finished predecessors per task.
+        """
+        done = {}
+        released = collections.OrderedDict()
+        pending = collections.deque(names)
+        batch = []
+        while pending:
+            name = pending.popleft()
+            batch.append(name)
+            for child in self._succ[name]:
+                done[child] = done.get(child, 0) + 1
+                if done[child] == remaining(child):
+                    if keys[child] == group:
+                        pending.append(child)
+                    else:
+                        released.setdefault(keys[child], []).append(child)
+        return batch, released, done
+
+    def linear_chains(self, key) -> list:
+        """find runs of tasks that can be merged into a single task
+
+        Two tasks are chained when the first is the only predecessor of the
+        second, the second is the only successor of the first and key()
+        returns the same value, other than None, for both task names. Only
+        chains of two or more tasks are returned, in dependency order.
+        """
+        if self._succ is None:
+            self._build_edges()
+        keys = {name: key(name) for name in self._nodes}
+
+        def _next(name):
+            if keys[name] is None or len(self._succ[name]) != 1:
+                return None
+            child = next(iter(self._succ[name]))
+            if len(self._pred[child]) != 1 or keys[child] != keys[name]:
+                return None
+            return child
+
+        links = {}
+        for name in self._nodes:
+            child = _next(name)
+            if child is not None:
+                links[name] = child
+        chained = set(links.values())
+        chains = []
+        for name in self._nodes:
+            if name not in links or name in chained:
+                continue
+            chain = [name]
+            while chain[-1] in links:
+                chain.append(links[chain[-1]])
+            chains.append(chain)
+        return chains
+
+    def downstream(self, names) -> set:
+        """all tasks that depend, directly or not, on the given tasks"""
+        return self._closure(names, self.successors)
+
+    def upstream(self, names) -> set:
+        """all tasks the given tasks depend on, directly or not"""
+        return self._closure(names, self.predecessors)
+
+    @staticmethod
+    def _closure(names, neighbours) -> set:
+        seen = set()
+        pending = list(names)
+        while pending:
+            for name in neighbours(pending.pop()):
+                if name not in seen:
+                    seen.add(name)
+                    pending.append(name)
+        return seen
+
+    def validate(self, previous: GraphReport = None) -> GraphReport:
+        """check the graph for missing and duplicate providers and cycles
+
+        With the report of the previous validation of this graph, only the
+        values and tasks changed since then are checked again: the cycles
+        are searched for among the tasks both upstream and downstream of
+        the changed tasks.
+        """
+        if previous is None:
+            report = GraphReport(
+                missing=self.missing(),
+                duplicates=self.duplicates(),
+                cycles=self.cycles(),
+                unreachable=list(self._unreachable),
+                inactive=self._inactive,
+            )
+        else:
+            report = GraphReport(
+                missing=self._patch_missing(previous.missing),
+                duplicates=self._patch_duplicates(previous.duplicates),
+                cycles=self._patch_cycles(previous.cycles),
+                unreachable=list(self._unreachable),
+                inactive=self._inactive,
+            )
+        self._changed_names = set()
+        self._changed_values = set()
+        return report
+
+    def _patch_missing(self, missing: dict) -> dict:
+        missing = dict(missing)
+        for value in self._changed_values:
+            consumers = self._consumers.get(value)
+            if consumers and value not in self._providers:
+                missing[value] = list(consumers)
+            else:
+                missing.pop(value, None)
+        return missing
+
+    def _patch_duplicates(self, duplicates: dict) -> dict:
+        duplicates = dict(duplicates)
+        for value in self._changed_values:
+            providers = self._providers.get(value, [])
+            if len(providers) > 1:
+                duplicates[value] = list(providers)
+            else:
+                duplicates.pop(value, None)
+        return duplicates
+
+    def _patch_cycles(self, cycles: list) -> list:
+        changed = self._changed_names
+        kept = []
+        seeds = {name for name in changed if name in self._nodes}
+        for members in cycles:
+            if changed.intersection(members):
+                # the rest of a broken cycle may still form a smaller one
+                seeds.update(name for name in members if name in self._nodes)
+            else:
+                kept.append(members)
+        if not seeds:
+            return kept
+        # every cycle through a seed is both upstream and downstream of it,
+        # so the upstream walk stays within the downstream tasks
+        downstream = self.downstream(seeds) | seeds
+        region = set(seeds)
+        pending = list(seeds)
+        while pending:
+            for name in self._pred[pending.pop()]:
+                if name in downstream and name not in region:
+                    region.add(name)
+                    pending.append(name)
+        found = self.cycles(region)
+        return [members for members in kept if region.isdisjoint(members)] + found
+
+
+def iter_tasks(tasks):
+    """yield task atoms from a list of tasks and/or (nested) flows"""
+    pending = collections.deque([tasks])
+    while pending:
+        item = pending.popleft()
+        if isinstance(item, tf_flow.Flow):
+            pending.extendleft(reversed(list(item)))
+        elif isinstance(item, (list, tuple)):
+            pending.extendleft(reversed(item))
+        elif not isinstance(item, tf_retry.Retry):
+            yield item
@@ -0,0 +1,180 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""sqlite history of run and task durations"""
+import collections
+import fnmatch
+import logging
+import sqlite3
+import statistics
+import time
+import uuid
+
+from .graph import TaskGraph
+
+LOG = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started REAL NOT NULL,
+    elapsed REAL,
+    state TEXT,
+    tasks INTEGER
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    name TEXT NOT NULL,
+    service TEXT,
+    task_id TEXT,
+    driver TEXT,
+    hosts INTEGER,
+    state TEXT,
+    duration REAL,
+    attempts INTEGER
+);
+CREATE INDEX IF NOT EXISTS tasks_key ON tasks (service, task_id, driver, hosts);
+CREATE INDEX IF NOT EXISTS tasks_run ON tasks (run_id);
+"""
+
+
+def task_key(node) -> tuple:
+    """what makes runs of a task comparable: its service, id, driver and
+    number of hosts"""
+    return (
+        node.service,
+        node.task_id,
+        node.driver or "service",
+        len(node.hosts or []),
+    )
+
+
+class RunHistory:
+    """durations of the tasks of past runs in a sqlite database
+
+    Estimates are the median duration of the successful attempts of a task
+    in the last ``samples`` runs it ran in. A task that never ran with its
+    number of hosts is estimated from its runs with any number of hosts.
+    """
+
+    def __init__(self, path: str, samples: int = 10):
+        self._path = path
+        self._samples = samples
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def record_run(
+        self, graph: TaskGraph, durations: dict, started: float, state: str
+    ) -> str:
+        """store a run, durations maps task names to their duration, state
+        and attempts"""
+        run_id = "{}-{}".format(
+            time.strftime("%Y%m%d%H%M%S", time.localtime(started)),
+            uuid.uuid4().hex[:8],
+        )
+        rows = []
+        for name, info in durations.items():
+            node = graph.nodes.get(name)
+            if node is None:
+                continue
+            rows.append(
+                (run_id, name)
+                + task_key(node)
+                + (info["state"], info["duration"], info.get("attempts", 1))
+            )
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO runs VALUES (?, ?, ?, ?, ?)",
+                (run_id, started, time.time() - started, state, len(rows)),
+            )
+            self._conn.executemany(
+                "INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+        LOG.info("Recorded run %s in %s", run_id, self._path)
+        return run_id
+
+    def _samples_by_key(self) -> dict:
+        """the recent successful durations of every task key"""
+        samples = collections.defaultdict(list)
+        cursor = self._conn.execute(
+            "SELECT service, task_id, driver, hosts, duration FROM tasks "
+            "JOIN runs USING (run_id) WHERE tasks.state = 'SUCCESS' "
+            "ORDER BY runs.started DESC"
+        )
+        for service, task_id, driver, hosts, duration in cursor:
+            values = samples[(service, task_id, driver, hosts)]
+            if len(values) < self._samples:
+                values.append(duration)
+        return samples
+
+    def estimates(self, graph: TaskGraph) -> dict:
+        """estimated duration of the tasks of the graph with a history"""
+        samples = self._samples_by_key()
+        any_hosts = collections.defaultdict(list)
+        for key, values in samples.items():
+            any_hosts[key[:3]].extend(values)
+        estimates = {}
+        for name, node in graph.nodes.items():
+            key = task_key(node)
+            values = samples.get(key) or any_hosts.get(key[:3])
+            if values:
+                estimates[name] = statistics.median(values)
+        return estimates
+
+    def runs(self, limit: int = 20) -> list:
+        cursor = self._conn.execute(
+            "SELECT run_id, started, elapsed, state, tasks FROM runs "
+            "ORDER BY started DESC LIMIT ?",
+            (limit,),
+        )
+        fields = ("run_id", "started", "elapsed", "state", "tasks")
+        return [dict(zip(fields, row)) for row in cursor]
+
+    def slowest(self, limit: int = 10) -> list:
+        """the tasks with the longest median duration"""
+        rows = []
+        for key, values in self._samples_by_key().items():
+            rows.append(
+                {
+                    "service": key[0],
+                    "task_id": key[1],
+                    "driver": key[2],
+                    "hosts": key[3],
+                    "runs": len(values),
+                    "median": statistics.median(values),
+                    "max": max(values),
+                }
+            )
+        rows.sort(key=lambda row: row["median"], reverse=True)
+        return rows[:limit]
+
+    def trend(self, pattern: str, limit: int = 20) -> list:
+        """durations of the tasks matching pattern in the last runs"""
+        cursor = self._conn.execute(
+            "SELECT runs.run_id, runs.started, name, tasks.state, duration, "
+            "attempts FROM tasks JOIN runs USING (run_id) WHERE run_id IN "
+            "(SELECT run_id FROM runs ORDER BY started DESC LIMIT ?) "
+            "ORDER BY runs.started, name",
+            (limit,),
+        )
+        fields = ("run_id", "started", "name", "state", "duration", "attempts")
+        return [
+            dict(zip(fields, row))
+            for row in cursor
+            if fnmatch.fnmatchcase(row[2], pattern)
+        ]
@@ -0,0 +1,358 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""engine listeners"""
+import json
+import logging
+import time
+
+from taskflow import states
+from taskflow.listeners import base
+
+from . import events
+from .graph import TaskGraph
+from .metrics import Metrics
+from .simulate import Simulator
+
+LOG = logging.getLogger(__name__)
+
+
+class TimingListener(base.Listener):
+    """records the wall clock duration of every task in a run"""
+
+    def __init__(self, engine):
+        super().__init__(
+            engine,
+            task_listen_for=(states.RUNNING, states.SUCCESS, states.FAILURE),
+            flow_listen_for=[],
+            retry_listen_for=[],
+        )
+        self._starts = {}
+        self._tasks = {}
+        self._attempts = {}
+        self._first_failure = {}
+
+    @property
+    def tasks(self) -> dict:
+        """task name -> {"duration": seconds, "state": final state}
+
+        Retried tasks also have their number of attempts and the seconds
+        from their first failure to their last attempt ending.
+        """
+        return self._tasks
+
+    @property
+    def retries(self) -> dict:
+        """total number of retries and seconds spent retrying"""
+        retried = [info for info in self._tasks.values() if "attempts" in info]
+        return {
+            "retried_tasks": len(retried),
+            "retries": sum(info["attempts"] - 1 for info in retried),
+            "retry_time": sum(info["retry_time"] for info in retried),
+        }
+
+    def _task_receiver(self, state, details):
+        name = details["task_name"]
+        now = time.monotonic()
+        if state == states.RUNNING:
+            self._starts[name] = now
+            self._attempts[name] = self._attempts.get(name, 0) + 1
+            return
+        start = self._starts.pop(name, None)
+        if start is None:
+            return
+        info = {"duration": now - start, "state": state}
+        if self._attempts[name] > 1:
+            info["attempts"] = self._attempts[name]
+            info["retry_time"] = now - self._first_failure[name]
+        if state == states.FAILURE:
+            self._first_failure.setdefault(name, now)
+        self._tasks[name] = info
+
+    def report(self, **extra) -> dict:
+        report = {"tasks": self.tasks, "retries": self.retries}
+        report.update(extra)
+        return report
+
+    def write_report(self, output_file, **extra) -> None:
+        with open(output_file, encoding="utf-8", mode="w") as fout:
+            json.dump(self.report(**extra), fout, indent=2, default=str)
+        LOG.info("Run report written out to %s", output_file)
+
+
+class MetricsListener(base.Listener):
+    """records task durations, failures and retries per driver in Metrics
+
+    drivers maps the task names of the flow to their driver.
+    """
+
+    def __init__(self, engine, drivers: dict):
+        super().__init__(
+            engine,
+            task_listen_for=(states.RUNNING, states.SUCCESS, states.FAILURE),
+            flow_listen_for=[],
+            retry_listen_for=[],
+        )
+        self._drivers = drivers
+        self._starts = {}
+        self._failed = set()
+        self._metrics = Metrics.instance()
+
+    def _task_receiver(self, state, details):
+        name = details["task_name"]
+        driver = self._drivers.get(name) or "service"
+        if state == states.RUNNING:
+            self._starts[name] = time.monotonic()
+            if name in self._failed:
+                self._metrics.inc("task_core_task_retries_total", driver=driver)
+            return
+        start = self._starts.pop(name, None)
+        if start is None:
+            return
+        self._metrics.observe(
+            "task_core_task_duration_seconds", time.monotonic() - start, driver=driver
+        )
+        if state == states.FAILURE:
+            self._failed.add(name)
+            self._metrics.inc("task_core_task_failures_total", driver=driver)
+
+
+class EventListener(base.Listener):
+    """emits the progress of the tasks of a run to the event stream
+
+    tasks maps the task names of the flow to their task. With ready, tasks
+    are reported ready when the engine schedules them, and the tasks report
+    themselves started once they get a worker slot. Otherwise, as when tasks
+    run on remote workers, scheduled tasks are reported started. Tasks that
+    never ran are reported skipped when the run ends.
+    """
+
+    def __init__(self, engine, tasks: dict, ready: bool = True):
+        super().__init__(
+            engine,
+            task_listen_for=(
+                states.RUNNING,
+                states.SUCCESS,
+                states.FAILURE,
+                states.IGNORE,
+            ),
+            flow_listen_for=(
+                states.RUNNING,
+                states.SUCCESS,
+                states.FAILURE,
+                states.REVERTED,
+                states.SUSPENDED,
+            ),
+            retry_listen_for=[],
+        )
+        self._tasks = tasks
+        self._ready = ready
+        self._scheduled = {}
+        self._attempts = {}
+        self._done = set()
+
+    def _flow_receiver(self, state, details):
+        if state == states.RUNNING:
+            events.emit("run-started", tasks=len(self._tasks))
+            return
+        for name, task in self._tasks.items():
+            if name not in self._done and name not in self._scheduled:
+                events.emit_task("skipped", task, reason="not run")
+        events.emit("run-finished", state=state)
+
+    def _duration(self, name, now) -> float:
+        # the task knows when it got a worker slot, unless it ran remotely
+        started = getattr(self._tasks.get(name), "started", None)
+        scheduled = self._scheduled.pop(name)
+        return now - (started if self._ready and started else scheduled)
+
+    def _task_receiver(self, state, details):
+        name = details["task_name"]
+        task = self._tasks.get(name)
+        if task is None:
+            return
+        now = time.monotonic()
+        if state == states.RUNNING:
+            self._scheduled[name] = now
+            self._attempts[name] = self._attempts.get(name, 0) + 1
+            if self._ready:
+                events.emit_task("ready", task, attempt=self._attempts[name])
+            else:
+                events.emit_task("started", task, attempt=self._attempts[name])
+        elif state == states.IGNORE:
+            self._done.add(name)
+            events.emit_task("skipped", task, reason="ignored")
+        elif name in self._scheduled:
+            self._done.add(name)
+            duration = self._duration(name, now)
+            if state == states.SUCCESS:
+                events.emit_task("finished", task, duration=duration)
+            else:
+                result = details.get("result")
+                events.emit_task(
+                    "failed",
+                    task,
+                    duration=duration,
+                    error=getattr(result, "exception_str", str(result)),
+                )
+
+
+class ProgressListener(base.Listener):  # pylint: disable=too-many-instance-attributes
+    """tracks task durations and reports the progress and ETA of a run
+
+    Task durations are taken from when a task got its worker slot when it
+    knows it. estimates maps task names to their expected duration. Every
+    interval seconds, the percentage of the estimated work that is done and
+    the ETA, simulated from the remaining graph, are logged, emitted to the
+    event stream and set in the metrics.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        engine,
+        graph: TaskGraph,
+        tasks: dict,
+        estimates: dict,
+        *,
+        max_workers: int = 5,
+        interval: float = 10.0,
+        default_duration: float = 1.0,
+    ):
+        super().__init__(
+            engine,
+            task_listen_for=(states.RUNNING, states.SUCCESS, states.FAILURE),
+            flow_listen_for=[],
+            retry_listen_for=[],
+        )
+        self._graph = graph
+        self._tasks = tasks
+        self._estimates = {
+            name: estimates.get(name, default_duration) for name in graph.nodes
+        }
+        self._total = sum(self._estimates.values())
+        self._simulator = Simulator(graph, self._estimates)
+        self._max_workers = max_workers
+        self._interval = interval
+        self._last = time.monotonic()
+        self._running = {}
+        self._done = set()
+        self._durations = {}
+
+    @property
+    def graph(self) -> TaskGraph:
+        return self._graph
+
+    @property
+    def durations(self) -> dict:
+        """task name -> {"duration": seconds, "state": state, "attempts": n}"""
+        return self._durations
+
+    def _task_receiver(self, state, details):
+        name = details["task_name"]
+        now = time.monotonic()
+        if state == states.RUNNING:
+            self._running[name] = now
+        elif name in self._running:
+            scheduled = self._running.pop(name)
+            started = getattr(self._tasks.get(name), "started", None)
+            info = self._durations.setdefault(name, {"attempts": 0})
+            info["duration"] = now - max(scheduled, started or scheduled)
+            info["state"] = state
+            info["attempts"] += 1
+            if state == states.SUCCESS:
+                self._done.add(name)
+        if self._interval and now - self._last >= self._interval:
+            self._last = now
+            self.report(now)
+
+    def progress(self, now: float = None) -> dict:
+        now = now or time.monotonic()
+        running = {}
+        work = sum(self._estimates.get(name, 0) for name in self._done)
+        for name, scheduled in self._running.items():
+            estimate = self._estimates.get(name, 0)
+            elapsed = now - scheduled
+            work += min(elapsed, estimate)
+            running[name] = max(estimate - elapsed, 0.0)
+        result = self._simulator.run(
+            self._max_workers, done=self._done, running=running
+        )
+        return {
+            "done": len(self._done),
+            "tasks": len(self._estimates),
+            "percent": 100.0 * work / self._total if self._total else 100.0,
+            "eta": result.makespan,
+        }
+
+    def report(self, now: float = None) -> dict:
+        progress = self.progress(now)
+        LOG.info(
+            "Progress: %.0f%% (%s/%s tasks), ETA %.0fs",
+            progress["percent"],
+            progress["done"],
+            progress["tasks"],
+            progress["eta"],
+        )
+        events.emit("progress", **progress)
+        metrics = Metrics.instance()
+        metrics.set("task_core_run_progress_percent", progress["percent"])
+        metrics.set("task_core_run_eta_seconds", progress["eta"])
+        return progress
+
+
+class ResultStoreListener(base.Listener):
+    """writes task results to a ResultStore as tasks finish
+
+    Large results are swapped for lightweight handles in engine storage
+    before any dependent task can fetch them.
+    """
+
+    def __init__(self, engine, store):
+        super().__init__(
+            engine,
+            task_listen_for=(states.SUCCESS, states.FAILURE),
+            flow_listen_for=[],
+            retry_listen_for=[],
+        )
+        self._store = store
+
+    def _task_receiver(self, state, details):
+        name = details["task_name"]
+        if "result" not in details:
+            return
+        if state == states.FAILURE:
+            self._store.store_failure(name, details["result"])
+            return
+        result = self._store.store(name, details["result"])
+        if result is not details["result"]:
+            self._engine.storage.save(name, result)
+
+
+class FailFastListener(base.Listener):
+    """suspends the engine as soon as a task gives up
+
+    The flow must be created with the fail-fast failure policy, so every
+    task has a retry controller that reverts only the task once its retries
+    are exhausted. Running tasks finish, no other task is started and
+    nothing is reverted.
+    """
+
+    def __init__(self, engine):
+        super().__init__(
+            engine,
+            task_listen_for=[],
+            flow_listen_for=[],
+            retry_listen_for=(states.REVERTING,),
+        )
+
+    def _retry_receiver(self, state, details):
+        LOG.error("Stopping the run, %s gave up", details["retry_name"])
+        self._engine.suspend()
@@ -11,16 +11,220 @@
 # under the License.
 """logging util functions"""
 
+import collections
+import contextlib
 import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
 
 LOG = logging.getLogger(__name__)
 
+LOG_FORMAT = "[%(asctime)s] [%(levelname)s] %(message)s"
+
+_CONTEXT = threading.local()
+
 
 def setup_basic_logging(debug=False):
     log_level = logging.INFO
     if debug:
         log_level = logging.DEBUG
-    logging.basicConfig(
-        format="[%(asctime)s] [%(levelname)s] %(message)s", level=log_level
-    )
+    logging.basicConfig(format=LOG_FORMAT, level=log_level)
     LOG.debug("Logging setup")
+
+
+def set_current_task(name):
+    """mark log records emitted by the calling thread as coming from a task
+
+    Returns the previously set task name.
+    """
+    previous = getattr(_CONTEXT, "task", None)
+    _CONTEXT.task = name
+    return previous
+
+
+def current_task():
+    return getattr(_CONTEXT, "task", None)
+
+
+@contextlib.contextmanager
+def task_context(name):
+    previous = set_current_task(name)
+    try:
+        yield
+    finally:
+        set_current_task(previous)
+
+
+class Truncated:  # pylint: disable=too-few-public-methods
+    """defer the repr of a large payload until a record is formatted
+
+    The repr is cut at limit characters so a single debug line cannot grow
+    without bound.
+    """
+
+    def __init__(self, obj, limit=2048):
+        self._obj = obj
+        self._limit = limit
+
+    def __str__(self):
+        text = repr(self._obj)
+        if len(text) > self._limit:
+            return f"{text[:self._limit]}... ({len(text)} chars)"
+        return text
+
+    __repr__ = __str__
+
+
+class _AsyncQueueHandler(QueueHandler):
+    """queue handler that leaves formatting to the listener thread
+
+    Records below WARNING are dropped, and counted, when the queue is full
+    instead of blocking the worker thread.
+    """
+
+    def __init__(self, log_queue, stats):
+        super().__init__(log_queue)
+        self._stats = stats
+
+    def prepare(self, record):
+        record.task_name = current_task()
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self.lock:
+                self._stats["dropped"] += 1
+
+
+class OutputRateLimiter(logging.Filter):  # pylint: disable=too-few-public-methods
+    """limit the lines of task output passed on per task and second
+
+    Lines over the limit are suppressed and the count is reported in the
+    next line that is let through.
+    """
+
+    def __init__(self, lines_per_second, stats):
+        super().__init__()
+        self._rate = lines_per_second
+        self._stats = stats
+        self._windows = {}
+
+    def filter(self, record):
+        if not getattr(record, "task_output", False):
+            return True
+        key = getattr(record, "task_name", None) or current_task()
+        now = int(time.monotonic())
+        start, count, suppressed = self._windows.get(key, (now, 0, 0))
+        if start != now:
+            start, count = now, 0
+        if count >= self._rate:
+            self._windows[key] = (start, count, suppressed + 1)
+            self._stats["dropped"] += 1
+            return False
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} lines suppressed)"
+            record.args = None
+            self._stats["coalesced"] += 1
+        self._windows[key] = (start, count + 1, 0)
+        return True
+
+
+class TaskFileHandler(logging.Handler):
+    """write the records of each task to <log_dir>/<task name>.log"""
+
+    def __init__(self, log_dir, max_open=64):
+        super().__init__()
+        self._log_dir = log_dir
+        self._max_open = max_open
+        self._files = collections.OrderedDict()
+        os.makedirs(log_dir, exist_ok=True)
+
+    def _stream(self, name):
+        stream = self._files.pop(name, None)
+        if stream is None:
+            path = os.path.join(self._log_dir, f"{name}.log")
+            # pylint: disable=consider-using-with
+            stream = open(path, encoding="utf-8", mode="a")
+            if len(self._files) >= self._max_open:
+                self._files.popitem(last=False)[1].close()
+        self._files[name] = stream
+        return stream
+
+    def emit(self, record):
+        name = getattr(record, "task_name", None)
+        if not name:
+            return
+        try:
+            self._stream(name).write(f"{self.format(record)}\n")
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def close(self):
+        for stream in self._files.values():
+            stream.close()
+        self._files.clear()
+        super().close()
+
+
+class LoggingPipeline:
+    """asynchronous logging for worker threads
+
+    Workers only put records on a queue, a listener thread formats them and
+    writes them to the console and, optionally, to per task log files.
+    """
+
+    def __init__(
+        self, debug=False, task_log_dir=None, output_rate=None, queue_size=10000
+    ):
+        self._stats = {"dropped": 0, "coalesced": 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = []
+        if task_log_dir:
+            # task files come first so they get every line unchanged
+            task_files = TaskFileHandler(task_log_dir)
+            task_files.setFormatter(formatter)
+            handlers.append(task_files)
+        console = logging.StreamHandler()
+        console.setFormatter(formatter)
+        if output_rate:
+            console.addFilter(OutputRateLimiter(output_rate, self._stats))
+        handlers.append(console)
+        self._handlers = handlers
+        self._listener = QueueListener(
+            self._queue, *handlers, respect_handler_level=True
+        )
+        self._handler = _AsyncQueueHandler(self._queue, self._stats)
+        self._level = logging.DEBUG if debug else logging.INFO
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def start(self):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self._handler)
+        root.setLevel(self._level)
+        self._listener.start()
+        LOG.debug("Async logging setup")
+        return self
+
+    def stop(self):
+        """flush all queued records and restore synchronous logging"""
+        self._listener.stop()
+        root = logging.getLogger()
+        root.removeHandler(self._handler)
+        for handler in self._handlers[:-1]:
+            handler.close()
+        root.addHandler(self._handlers[-1])
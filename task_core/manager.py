@@ -23,14 +23,18 @@ from taskflow import exceptions as tf_exc
 from taskflow.patterns import graph_flow as gf
 
 from .exceptions import InvalidService, UnavailableException
+from .graph import TaskGraph
 from .inventory import Inventory
 from .inventory import Roles
+from .retries import REVERT_ALL
+from .retries import with_retries
 from .service import Service
+from .tasks import coalesce_ansible_tasks
 
 LOG = logging.getLogger(__name__)
 
 
-class TaskManager:
+class TaskManager:  # pylint: disable=too-many-instance-attributes
     """task-core manager"""
 
     def __init__(
@@ -44,17 +48,20 @@ class TaskManager:
         # validate inputs
         if not os.path.isdir(services_dir):
             raise Exception(f"{services_dir} does not exist or is not a directory")
-        if not os.path.isfile(inventory_file):
-            raise Exception(f"{inventory_file} does not exist or is not a file")
-        if not os.path.isfile(roles_file):
-            raise Exception(f"{roles_file} does not exist or is not a file")
+        # inventory and roles can be split into a directory of yaml files
+        if not (os.path.isfile(inventory_file) or os.path.isdir(inventory_file)):
+            raise Exception(f"{inventory_file} does not exist")
+        if not (os.path.isfile(roles_file) or os.path.isdir(roles_file)):
+            raise Exception(f"{roles_file} does not exist")
 
         self.services_dir = services_dir
         self.inventory_file = inventory_file
         self.roles_file = roles_file
         self.services = {}
+        self.service_files = {}
         self.inventory = []
         self.roles = []
+        self._needs = {}
         if not skip_loading:
             self.load()
 
@@ -77,6 +84,7 @@ class TaskManager:
                 LOG.error("Error loading %s", file)
                 raise
             self.services[svc.name] = svc
+            self.service_files[svc.name] = os.path.normpath(file)
         return self.resolve_service_deps()
 
     def load_inventory(self) -> dict:
@@ -94,17 +102,96 @@ class TaskManager:
     def resolve_service_deps(self) -> dict:
         """loop through services and handle needed_by"""
         LOG.info("Handling extra service dependencies...")
-        needed_by = {}
-        for name in self.services:
-            service = self.services.get(name)
-            needs = service.get_tasks_needed_by()
-            for need, provides in needs.items():
-                needed_by[need] = list(set(needed_by.get(need, []) + provides))
+        self._needs = {
+            name: service.get_tasks_needed_by()
+            for name, service in self.services.items()
+        }
+        needed_by = self._needed_by()
         for name in self.services:
             service = self.services.get(name)
             service.update_task_requires(needed_by)
         return self.services
 
+    def _needed_by(self) -> dict:
+        needed_by = {}
+        for needs in self._needs.values():
+            for need, provides in needs.items():
+                needed_by[need] = list(set(needed_by.get(need, []) + provides))
+        return needed_by
+
+    def _service_hosts(self, name) -> list:
+        hosts = []
+        for host, data in self.inventory.hosts.items():
+            if name in self.roles.get_services(data.get("role")):
+                hosts.append(host)
+        return hosts
+
+    def reload_service_file(self, file) -> set:
+        """reload a single service file that was added, changed or removed
+
+        Requires added by needed-by cannot be taken back from a service, so
+        the services providing a value whose needed-by changed are reloaded
+        from their files too. Returns the names of the services that were
+        (re)loaded or removed.
+        """
+        file = os.path.normpath(file)
+        old_name = next(
+            (name for name, path in self.service_files.items() if path == file), None
+        )
+        svc = Service(file) if os.path.isfile(file) else None
+        old_needs = self._needs.pop(old_name, {})
+        new_needs = svc.get_tasks_needed_by() if svc else {}
+        changed = {
+            need
+            for need in set(old_needs) | set(new_needs)
+            if old_needs.get(need) != new_needs.get(need)
+        }
+        names = set()
+        if old_name:
+            del self.services[old_name]
+            del self.service_files[old_name]
+            names.add(old_name)
+        if svc:
+            self.services[svc.name] = svc
+            self.service_files[svc.name] = file
+            self._needs[svc.name] = new_needs
+            names.add(svc.name)
+        affected = {svc.name} if svc else set()
+        if changed:
+            for name, service in self.services.items():
+                for _task in service.tasks:
+                    if changed.intersection(_task.get("provides", [])):
+                        affected.add(name)
+                        break
+        for name in affected:
+            if name != getattr(svc, "name", None):
+                LOG.debug("Reloading %s for changed needed-by", name)
+                self.services[name] = Service(self.service_files[name])
+            for host in self._service_hosts(name):
+                self.services[name].add_host(host)
+        needed_by = self._needed_by()
+        for name in affected:
+            self.services[name].update_task_requires(needed_by)
+        return names | affected
+
+    def reload_inventory(self) -> dict:
+        """reload the inventory and reassign hosts to services"""
+        self.load_inventory()
+        self._reassign_hosts()
+        return self.inventory
+
+    def reload_roles(self) -> dict:
+        """reload the roles and reassign hosts to services"""
+        self.load_roles()
+        self._reassign_hosts()
+        return self.roles
+
+    def _reassign_hosts(self):
+        for service in self.services.values():
+            for host in list(service.hosts):
+                service.remove_host(host)
+        self.hosts_to_services()
+
     def hosts_to_services(self):
         for host in self.inventory.hosts.keys():
             for svc in self.roles.get_services(
@@ -117,9 +204,30 @@ class TaskManager:
                     raise InvalidService(f"Service '{svc}' is not defined") from e
         return self.services
 
-    def create_flow(self, task_type_override=None) -> gf.Flow:
+    def build_graph(self) -> TaskGraph:
+        """build the task dependency graph without creating a flow"""
+        LOG.info("Building task graph...")
+        return TaskGraph.from_services(self.services)
+
+    def validate(self):
+        """validate the provides/requires graph of the loaded services"""
+        return self.build_graph().validate()
+
+    def create_flow(
+        self,
+        task_type_override=None,
+        coalesce_ansible=False,
+        task_names=None,
+        failure_policy=REVERT_ALL,
+    ) -> gf.Flow:
+        """create the flow of all tasks, or only of the named tasks
+
+        failure_policy is one of retries.POLICIES and decides how much of
+        the flow a failed task reverts.
+        """
         LOG.info("Creating graph flow...")
         flow = gf.Flow("root")
+        tasks = []
         for service_id in self.services:
             service = self.services.get(service_id)
             if len(service.hosts) == 0:
@@ -129,15 +237,21 @@ class TaskManager:
                 )
                 continue
             LOG.debug("Adding %s tasks...", service.name)
+            tasks.extend(service.build_tasks(task_type_override, retries=False))
+        if task_names is not None:
+            tasks = [task for task in tasks if task.name in task_names]
+        if coalesce_ansible:
+            tasks = coalesce_ansible_tasks(tasks)
+        tasks = [with_retries(task, failure_policy) for task in tasks]
+        try:
+            for task in tasks:
+                flow.add(task)
+        except tf_exc.DependencyFailure as fail_exc:
             try:
-                for task in service.build_tasks(task_type_override):
-                    flow.add(task)
-            except tf_exc.DependencyFailure as fail_exc:
-                try:
-                    self.write_flow_graph(flow, "failure.svg")
-                except UnavailableException:
-                    pass
-                raise fail_exc
+                self.write_flow_graph(flow, "failure.svg")
+            except UnavailableException:
+                pass
+            raise fail_exc
         return flow
 
     def write_flow_graph(self, flow, output_file="output.svg") -> None:
@@ -0,0 +1,251 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""run metrics in the prometheus text format"""
+import http.server
+import logging
+import os
+import socketserver
+import threading
+
+from .base import BaseInstance
+
+LOG = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds, from quick local commands to long playbooks
+BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600)
+
+METRICS = {
+    "task_core_task_duration_seconds": (
+        "histogram",
+        "Duration of task attempts by driver",
+    ),
+    "task_core_task_failures_total": ("counter", "Failed task attempts by driver"),
+    "task_core_task_retries_total": ("counter", "Retried task attempts by driver"),
+    "task_core_tasks_running": ("gauge", "Tasks holding a worker slot"),
+    "task_core_tasks_ready": ("gauge", "Tasks ready to run waiting for a slot"),
+    "task_core_concurrency_limit": ("gauge", "Tasks allowed to run at once"),
+    "task_core_directord_polls_total": ("counter", "Directord job status polls"),
+    "task_core_run_progress_percent": ("gauge", "Estimated work done in the run"),
+    "task_core_run_eta_seconds": ("gauge", "Estimated seconds left in the run"),
+}
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    values = ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in labels
+    )
+    return "{" + values + "}"
+
+
+def _histogram_samples(name, labels, buckets, total, count) -> list:
+    samples = [
+        f"{name}_bucket{_labels(labels + (('le', bound),))} {bucket}"
+        for bound, bucket in zip(BUCKETS, buckets)
+    ]
+    samples.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+    samples.append(f"{name}_sum{_labels(labels)} {total}")
+    samples.append(f"{name}_count{_labels(labels)} {count}")
+    return samples
+
+
+class Metrics(BaseInstance):
+    """registry of the metrics of this process
+
+    Counters and histograms are kept per metric and label set. Gauges can
+    also be read from a function when the metrics are rendered.
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+    _values = {}
+    _histograms = {}
+    _gauge_functions = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+            self._histograms = {}
+            self._gauge_functions = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def gauge_function(self, name: str, func) -> None:
+        """read the gauge from func() every time the metrics are rendered"""
+        with self._lock:
+            self._gauge_functions[name] = func
+
+    def track_executor(self, executor) -> None:
+        """report the running and ready tasks and the limit of a DispatchExecutor"""
+        self.gauge_function("task_core_tasks_running", lambda: executor.running)
+        self.gauge_function("task_core_tasks_ready", lambda: executor.pending)
+        self.gauge_function("task_core_concurrency_limit", lambda: executor.max_workers)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for idx, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[0][idx] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def value(self, name: str, **labels):
+        """current value of a counter or gauge, None if never set"""
+        with self._lock:
+            return self._values.get((name, tuple(sorted(labels.items()))))
+
+    def render(self) -> str:
+        """all the metrics in the prometheus text exposition format"""
+        with self._lock:
+            values = dict(self._values)
+            for name, func in self._gauge_functions.items():
+                values[(name, ())] = func()
+            histograms = {
+                key: (list(buckets), total, count)
+                for key, (buckets, total, count) in self._histograms.items()
+            }
+        lines = []
+        for name, (kind, text) in METRICS.items():
+            samples = [
+                f"{name}{_labels(labels)} {value}"
+                for (metric, labels), value in sorted(values.items())
+                if metric == name
+            ]
+            for (metric, labels), hist in sorted(histograms.items()):
+                if metric == name:
+                    samples.extend(_histogram_samples(name, labels, *hist))
+            if samples:
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """write the metrics for the node exporter textfile collector"""
+        # the collector must never read a partially written file
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, encoding="utf-8", mode="w") as fout:
+            fout.write(self.render())
+        os.replace(tmp, path)
+
+
+def reply_metrics(handler: http.server.BaseHTTPRequestHandler) -> None:
+    """answer an http request with the metrics"""
+    data = Metrics.instance().render().encode("utf-8")
+    handler.send_response(200)
+    handler.send_header("Content-Type", CONTENT_TYPE)
+    handler.send_header("Content-Length", str(len(data)))
+    handler.end_headers()
+    handler.wfile.write(data)
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """serve the metrics on GET /metrics"""
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOG.debug("%s %s", self.address_string(), format % args)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        reply_metrics(self)
+
+
+class _MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class MetricsExporter:
+    """export the metrics while the process runs
+
+    The metrics are written to a textfile every interval seconds and when
+    the exporter is closed, and/or served over http on listen, given as
+    <host>:<port>.
+    """
+
+    def __init__(self, textfile: str = None, listen: str = None, interval=15.0):
+        self._textfile = textfile
+        self._listen = listen
+        self._interval = interval
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+
+    @property
+    def address(self):
+        """the address the http endpoint listens on"""
+        return self._server.server_address if self._server else None
+
+    def start(self):
+        if self._listen:
+            host, _, port = self._listen.rpartition(":")
+            self._server = _MetricsServer(
+                (host or "127.0.0.1", int(port)), MetricsRequestHandler
+            )
+            self._start(self._server.serve_forever)
+            LOG.info("Serving metrics on http://%s:%s/metrics", *self.address[:2])
+        if self._textfile:
+            self._start(self._write_loop)
+            LOG.info("Writing metrics to %s", self._textfile)
+        return self
+
+    def _start(self, target):
+        thread = threading.Thread(target=target, name="task-core-metrics")
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+    def _write(self):
+        try:
+            Metrics.instance().write_textfile(self._textfile)
+        except OSError as e:
+            LOG.warning("Unable to write metrics to %s: %s", self._textfile, e)
+
+    def _write_loop(self):
+        while not self._stop.wait(self._interval):
+            self._write()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self._textfile:
+            self._write()
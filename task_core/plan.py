@@ -0,0 +1,55 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""levelized execution plan"""
+import json
+
+import yaml
+
+from .graph import TaskGraph
+
+FORMATS = ["yaml", "json"]
+
+
+def build_plan(graph: TaskGraph) -> dict:
+    """group the tasks of the graph into waves of tasks that can run together
+
+    A task is placed in the wave of its earliest start level. Its slack is
+    the number of waves it can be delayed by without delaying the run.
+    """
+    earliest, latest = graph.levels()
+    waves = [[] for _ in range(max(earliest.values(), default=-1) + 1)]
+    for name, level in earliest.items():
+        node = graph.nodes[name]
+        waves[level].append(
+            {
+                "name": name,
+                "service": node.service,
+                "driver": node.driver,
+                "hosts": list(node.hosts),
+                "earliest": level,
+                "latest": latest[name],
+                "slack": latest[name] - level,
+            }
+        )
+    return {
+        "tasks": len(earliest),
+        "depth": len(waves),
+        "waves": [{"wave": idx, "tasks": tasks} for idx, tasks in enumerate(waves)],
+    }
+
+
+def dump_plan(plan: dict, fmt: str = "yaml") -> str:
+    if fmt == "json":
+        return json.dumps(plan, indent=2)
+    if fmt == "yaml":
+        return yaml.safe_dump(plan, sort_keys=False)
+    raise ValueError(f"Unknown plan format {fmt}")
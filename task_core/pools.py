@@ -0,0 +1,114 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""named concurrency pools"""
+import yaml
+
+PER_HOST = "per-host"
+
+
+def parse_pool_args(values) -> dict:
+    """turn name=N command line values into a dict of pool limits"""
+    limits = {}
+    for value in values or []:
+        name, sep, limit = value.partition("=")
+        if not sep or not name:
+            raise ValueError(f"Invalid pool '{value}', expected name=N")
+        limits[name] = int(limit)
+    return limits
+
+
+def load_pools(pools_file=None, pool_args=None) -> dict:
+    """pool limits from a yaml mapping of name to limit and the cli
+
+    Limits given on the command line override the ones of the file.
+    """
+    limits = {}
+    if pools_file:
+        with open(pools_file, encoding="utf-8", mode="r") as fin:
+            data = yaml.safe_load(fin) or {}
+        if not isinstance(data, dict):
+            raise ValueError(f"Invalid pool data in {pools_file}")
+        limits.update({name: int(limit) for name, limit in data.items()})
+    limits.update(parse_pool_args(pool_args))
+    return limits
+
+
+class Pools:
+    """limits on the number of tasks running at once per named pool
+
+    A task is in the pools listed in its ``pools``, and in the pools named
+    after its driver or its service. With a ``per-host`` pool, each of the
+    hosts of a task is a pool with that limit. Pools are not thread safe,
+    the executor using them serializes access.
+    """
+
+    def __init__(self, limits: dict = None):
+        self._limits = dict(limits or {})
+        for name, limit in self._limits.items():
+            if limit < 1:
+                raise ValueError(f"Pool {name} must allow at least 1 task")
+        self._in_use = {}
+        self._stats = {
+            name: {"limit": limit, "max_in_use": 0, "waits": 0, "wait_time": 0.0}
+            for name, limit in self._limits.items()
+        }
+
+    def __bool__(self):
+        return bool(self._limits)
+
+    @property
+    def limits(self) -> dict:
+        return self._limits
+
+    @property
+    def stats(self) -> dict:
+        """per pool limit, most tasks in use at once and time spent waiting"""
+        return self._stats
+
+    def keys(self, task) -> tuple:
+        """the pools a task has to get a slot in before it runs"""
+        if not self._limits:
+            return ()
+        names = list(getattr(task, "pools", None) or [])
+        names.append(getattr(task, "driver", None) or "service")
+        names.append(getattr(task, "service", None))
+        keys = [name for name in dict.fromkeys(names) if name in self._limits]
+        if PER_HOST in self._limits:
+            keys.extend(f"{PER_HOST}:{host}" for host in getattr(task, "hosts", []))
+        return tuple(keys)
+
+    @staticmethod
+    def _name(key) -> str:
+        return PER_HOST if key.startswith(PER_HOST + ":") else key
+
+    def blocking(self, keys):
+        """the first pool of keys without a free slot, or None"""
+        for key in keys:
+            if self._in_use.get(key, 0) >= self._limits[self._name(key)]:
+                return key
+        return None
+
+    def acquire(self, keys) -> None:
+        for key in keys:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+            stats = self._stats[self._name(key)]
+            stats["max_in_use"] = max(stats["max_in_use"], self._in_use[key])
+
+    def release(self, keys) -> None:
+        for key in keys:
+            self._in_use[key] -= 1
+
+    def waited(self, key, seconds: float) -> None:
+        """account for a task that waited on a pool"""
+        stats = self._stats[self._name(key)]
+        stats["waits"] += 1
+        stats["wait_time"] += seconds
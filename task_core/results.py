@@ -0,0 +1,211 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""on disk task result store"""
+import fnmatch
+import gzip
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from .tasks import TaskResult
+
+LOG = logging.getLogger(__name__)
+
+DATA_FILE = "results.jsonl.gz"
+INDEX_FILE = "index.jsonl"
+
+
+def read_record(data_file, offset) -> dict:
+    """read the record stored at offset of a results file
+
+    Every record is its own gzip member, so reading can start at any
+    record boundary.
+    """
+    with open(data_file, mode="rb") as fin:
+        fin.seek(offset)
+        with gzip.GzipFile(fileobj=fin, mode="rb") as gzin:
+            return json.loads(gzin.readline())
+
+
+class StoredResult(TaskResult):
+    """task result whose data was spilled to the result store"""
+
+    def __init__(self, status: bool, data_file: str, offset: int, size: int):
+        super().__init__(status, None)
+        self._data_file = data_file
+        self._offset = offset
+        self._size = size
+
+    @property
+    def data(self) -> dict:
+        """load the data from the result store"""
+        return read_record(self._data_file, self._offset)["data"]
+
+    @property
+    def handle(self) -> dict:
+        return {"file": self._data_file, "offset": self._offset, "size": self._size}
+
+    def __repr__(self):
+        return repr({"status": self.status, "stored": self.handle})
+
+
+class ResultStore:
+    """per run store of task results as compressed json lines
+
+    Task results whose json record is larger than threshold bytes, and
+    task failures, are appended to the run's results file, with an index
+    of records next to it. The large results are replaced in engine
+    storage with a StoredResult.
+    """
+
+    def __init__(self, base_dir: str, run_id: str = None, threshold: int = 65536):
+        self._run_id = run_id or "{}-{}".format(
+            datetime.now().strftime("%Y%m%d-%H%M%S"), uuid.uuid4().hex[:6]
+        )
+        self._path = os.path.join(base_dir, self._run_id)
+        os.makedirs(self._path, exist_ok=True)
+        self._data_file = os.path.join(self._path, DATA_FILE)
+        self._index_file = os.path.join(self._path, INDEX_FILE)
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        self._stats = {"records": 0, "spilled": 0, "spilled_bytes": 0}
+
+    @property
+    def run_id(self) -> str:
+        return self._run_id
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def write(self, record: dict) -> tuple:
+        """append a record and return its (offset, size)"""
+        return self._append(record, json.dumps(record, default=str))
+
+    def _append(self, record: dict, line: str) -> tuple:
+        index = {k: v for k, v in record.items() if k != "data"}
+        with self._lock:
+            with open(self._data_file, mode="ab") as fout:
+                offset = fout.tell()
+                fout.write(gzip.compress(f"{line}\n".encode("utf-8")))
+            index.update({"offset": offset, "size": len(line)})
+            with open(self._index_file, encoding="utf-8", mode="a") as fidx:
+                fidx.write(f"{json.dumps(index, default=str)}\n")
+            self._stats["records"] += 1
+        return offset, len(line)
+
+    @staticmethod
+    def _is_remote(item) -> bool:
+        # results of remote workers are plain dicts
+        return isinstance(item, dict) and set(item) == {"status", "data"}
+
+    def _store_item(self, name: str, key, item):
+        """write an item over the threshold, returning what to keep"""
+        remote = self._is_remote(item)
+        if not remote and (
+            not isinstance(item, TaskResult) or isinstance(item, StoredResult)
+        ):
+            return item
+        record = {
+            "task": name,
+            "state": "SUCCESS",
+            "index": key,
+            "status": item["status"] if remote else item.status,
+            "data": item["data"] if remote else item.data,
+        }
+        line = json.dumps(record, default=str)
+        if len(line) <= self._threshold:
+            return item
+        offset, size = self._append(record, line)
+        # a handle can not be sent back to a worker, remote results are kept
+        if remote:
+            return item
+        with self._lock:
+            self._stats["spilled"] += 1
+            self._stats["spilled_bytes"] += size
+        return StoredResult(item.status, self._data_file, offset, size)
+
+    def store(self, name: str, result):
+        """record a large task result, returning what engine storage should
+        keep
+
+        result is a single result, a list of them or a dict of them by
+        provided value. A result found more than once in it, such as the
+        result of a coalesced task providing several values, is stored
+        once.
+        """
+        if isinstance(result, (list, tuple)):
+            items = list(enumerate(result))
+        elif isinstance(result, dict) and not self._is_remote(result):
+            items = list(result.items())
+        else:
+            items = [(0, result)]
+        kept = {}
+        seen = {}
+        for key, item in items:
+            if id(item) not in seen:
+                seen[id(item)] = self._store_item(name, key, item)
+            kept[key] = seen[id(item)]
+        if all(kept[key] is item for key, item in items):
+            return result
+        if isinstance(result, (list, tuple)):
+            return type(result)(kept[key] for key, _ in items)
+        if isinstance(result, dict) and not self._is_remote(result):
+            return kept
+        return kept[0]
+
+    def store_failure(self, name: str, failure) -> None:
+        self.write(
+            {
+                "task": name,
+                "state": "FAILURE",
+                "index": 0,
+                "status": False,
+                "data": {"error": str(getattr(failure, "exception_str", failure))},
+            }
+        )
+
+
+def list_runs(base_dir: str) -> list:
+    """run ids found in a result store directory, oldest first"""
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(
+        run
+        for run in os.listdir(base_dir)
+        if os.path.isfile(os.path.join(base_dir, run, INDEX_FILE))
+    )
+
+
+def query(run_dir: str, task: str = None, state: str = None, with_data=False):
+    """yield index records of a run, optionally with their data
+
+    task is a shell style pattern matched against task names.
+    """
+    data_file = os.path.join(run_dir, DATA_FILE)
+    with open(os.path.join(run_dir, INDEX_FILE), encoding="utf-8", mode="r") as fin:
+        for line in fin:
+            record = json.loads(line)
+            if task and not fnmatch.fnmatchcase(record["task"], task):
+                continue
+            if state and record["state"] != state.upper():
+                continue
+            if with_data:
+                record["data"] = read_record(data_file, record["offset"])["data"]
+            yield record
@@ -0,0 +1,117 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""task retry controllers and failure policies"""
+import logging
+
+from taskflow import retry
+from taskflow import states
+from taskflow.patterns import linear_flow as lf
+
+from .graph import TaskGraph
+
+LOG = logging.getLogger(__name__)
+
+REVERT_ALL = "revert-all"
+FAIL_FAST = "fail-fast"
+CONTINUE_INDEPENDENT = "continue-independent"
+POLICIES = [REVERT_ALL, FAIL_FAST, CONTINUE_INDEPENDENT]
+
+
+class TaskRetry(retry.Times):
+    """run a failed task again up to its configured number of retries
+
+    The controller only covers the flow wrapping the task, so a retry does
+    not revert or re-run any other task. The wait between attempts is done
+    by the task itself (see BaseTask.retry_delay) so the engine is not
+    blocked while waiting. Once the attempts are exhausted, the whole flow
+    is reverted with revert_all, only the task otherwise.
+    """
+
+    def __init__(self, task, revert_all: bool = True):
+        super().__init__(
+            attempts=getattr(task, "retries", 0) + 1,
+            name=f"{task.name}-retry",
+            revert_all=revert_all,
+        )
+        self._task_name = task.name
+
+    def on_failure(self, history, *args, **kwargs):
+        decision = super().on_failure(history, *args, **kwargs)
+        if decision == retry.RETRY:
+            LOG.warning(
+                "%s | Failed attempt %s of %s, retrying",
+                self._task_name,
+                len(history),
+                self._attempts,
+            )
+        elif self._attempts > 1:
+            LOG.error("%s | Failed after %s attempts", self._task_name, len(history))
+        return decision
+
+
+def with_retries(task, policy: str = REVERT_ALL):
+    """return the task, wrapped in a retried flow if needed
+
+    With revert-all only tasks with retries are wrapped, the failure of any
+    task reverts the whole flow. With the other policies every task is
+    wrapped, so its failure only reverts the task itself and leaves the
+    tasks depending on it pending.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown failure policy {policy}")
+    if policy == REVERT_ALL and not getattr(task, "retries", 0):
+        return task
+    # the flow is named after the task so it can be found by task name
+    return lf.Flow(
+        task.name, retry=TaskRetry(task, revert_all=policy == REVERT_ALL)
+    ).add(task)
+
+
+def failure_summary(graph: TaskGraph, storage) -> dict:
+    """the failed tasks of a run and the pending tasks they blocked
+
+    Returns {"failed": [names], "blocked": {failed: [names]}, "not_run":
+    [names]}, where not_run are the pending tasks blocked by no failure,
+    as when a fail-fast run stops before starting them.
+    """
+    failed = sorted(storage.get_failures())
+    pending = {
+        name for name in graph.nodes if storage.get_atom_state(name) == states.PENDING
+    }
+    blocked = {}
+    for name in failed:
+        downstream = sorted(pending & graph.downstream([name]))
+        if downstream:
+            blocked[name] = downstream
+    reached = set().union(*blocked.values()) if blocked else set()
+    return {
+        "failed": failed,
+        "blocked": blocked,
+        "not_run": sorted(pending - reached - set(failed)),
+    }
+
+
+def log_failure_summary(summary: dict) -> None:
+    for name in summary["failed"]:
+        blocked = summary["blocked"].get(name, [])
+        LOG.error(
+            "%s | Failed, blocking %s tasks%s",
+            name,
+            len(blocked),
+            (": " + ", ".join(blocked)) if blocked else "",
+        )
+    if summary["not_run"]:
+        LOG.error(
+            "%s tasks not run: %s",
+            len(summary["not_run"]),
+            ", ".join(summary["not_run"]),
+        )
@@ -10,6 +10,7 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """schema classess"""
+import collections.abc
 import logging
 import os
 import sys
@@ -26,6 +27,7 @@ class BaseSchemaValidator(BaseInstance):
     _instance = None
     _schema = None
     _schema_path = None
+    _validator = None
 
     @property
     def schema_folder(self):
@@ -58,7 +60,23 @@ class BaseSchemaValidator(BaseInstance):
             self._schema = yaml.safe_load(schema_file.read())
 
     def validate(self, obj):
-        return jsonschema.validate(obj, self.schema)
+        # jsonschema.validate checks the schema itself on every call, which
+        # dominates load time with thousands of services so we only check it
+        # once and reuse the validator
+        if self._validator is None:
+            cls = jsonschema.validators.validator_for(self.schema)
+            cls.check_schema(self.schema)
+            # data loaded from a directory is a LayeredMapping, not a dict
+            cls = jsonschema.validators.extend(
+                cls,
+                type_checker=cls.TYPE_CHECKER.redefine(
+                    "object", lambda _, obj: isinstance(obj, collections.abc.Mapping)
+                ),
+            )
+            self._validator = cls(self.schema)
+        error = jsonschema.exceptions.best_match(self._validator.iter_errors(obj))
+        if error is not None:
+            raise error
 
 
 class InventorySchemaValidator(BaseSchemaValidator):
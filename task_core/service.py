@@ -13,6 +13,8 @@
 import logging
 import yaml
 from .base import BaseFileData
+from .retries import REVERT_ALL
+from .retries import with_retries
 from .tasks import TaskManager
 from .schema import ServiceSchemaValidator
 
@@ -88,7 +90,15 @@ class Service(BaseFileData):
                 if need in _task.get("provides", []):
                     _task["requires"] = list(set(_task.get("requires", []) + provides))
 
-    def build_tasks(self, task_type_override=None):
+    def build_tasks(
+        self, task_type_override=None, retries=True, failure_policy=REVERT_ALL
+    ):
+        """build the service's tasks
+
+        Tasks are returned wrapped in a flow with a retry controller when
+        they have retries or when the failure policy needs it (see
+        retries.with_retries), unless retries is False.
+        """
         tasks = []
         for _task in self.tasks:
             if task_type_override:
@@ -97,7 +107,7 @@ class Service(BaseFileData):
                 task_type = self._task_mgr.get_driver(_task.get("driver", "service"))
             task = task_type(self.name, _task, self.hosts)
             task.version = tuple(int(v) for v in self.version.split("."))
-            tasks.append(task)
+            tasks.append(with_retries(task, failure_policy) if retries else task)
         return tasks
 
     def save(self, location) -> None:
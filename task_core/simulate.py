@@ -0,0 +1,171 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""deployment makespan simulation"""
+import collections
+import heapq
+import json
+import logging
+
+import yaml
+
+from .graph import TaskGraph
+
+LOG = logging.getLogger(__name__)
+
+
+def load_durations(duration_file) -> dict:
+    """load task duration estimates
+
+    The file can either be a yaml/json mapping of task name to seconds or a
+    run report written by ``task-core --report-file``.
+    """
+    with open(duration_file, encoding="utf-8", mode="r") as fin:
+        if duration_file.endswith(".json"):
+            data = json.load(fin)
+        else:
+            data = yaml.safe_load(fin)
+    if not isinstance(data, dict):
+        raise ValueError(f"Invalid duration data in {duration_file}")
+    if isinstance(data.get("tasks"), dict):
+        return {
+            name: float(info.get("duration", 0)) for name, info in data["tasks"].items()
+        }
+    return {name: float(value) for name, value in data.items()}
+
+
+class SimulationResult:
+    """outcome of a single simulated run"""
+
+    def __init__(self, max_workers, makespan, busy, critical_path, critical_time):
+        self._max_workers = max_workers
+        self._makespan = makespan
+        self._busy = busy
+        self._critical_path = critical_path
+        self._critical_time = critical_time
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @property
+    def makespan(self) -> float:
+        return self._makespan
+
+    @property
+    def utilization(self) -> float:
+        """fraction of available worker time spent running tasks"""
+        if not self._makespan:
+            return 0.0
+        return self._busy / (self._makespan * self._max_workers)
+
+    @property
+    def critical_path(self) -> list:
+        return self._critical_path
+
+    @property
+    def critical_time(self) -> float:
+        return self._critical_time
+
+    def as_dict(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "makespan": self.makespan,
+            "utilization": self.utilization,
+            "critical_path": self.critical_path,
+            "critical_time": self.critical_time,
+        }
+
+
+class Simulator:
+    """discrete event simulation of the parallel engine
+
+    Ready tasks are handed to a pool of ``max_workers`` workers in the order
+    they became ready, which is how the parallel engine submits atoms to its
+    thread pool executor.
+    """
+
+    def __init__(self, graph: TaskGraph, durations=None, default_duration=1.0):
+        self._graph = graph
+        self._durations = durations or {}
+        self._default = default_duration
+        self._order = graph.topological_order()
+
+    @classmethod
+    def from_flow(cls, flow, durations=None, default_duration=1.0):
+        return cls(TaskGraph.from_tasks(flow), durations, default_duration)
+
+    def duration(self, name) -> float:
+        return self._durations.get(name, self._default)
+
+    def critical_path(self):
+        """longest path through the graph weighted by task duration"""
+        finish = {}
+        via = {}
+        for name in self._order:
+            start = 0.0
+            for pred in self._graph.predecessors(name):
+                if finish[pred] > start:
+                    start = finish[pred]
+                    via[name] = pred
+            finish[name] = start + self.duration(name)
+        if not finish:
+            return [], 0.0
+        name = max(finish, key=finish.get)
+        total = finish[name]
+        path = [name]
+        while name in via:
+            name = via[name]
+            path.append(name)
+        return list(reversed(path)), total
+
+    def run(self, max_workers=5, done=None, running=None) -> SimulationResult:
+        """simulate the run, or the rest of a run in progress
+
+        done holds the names of the finished tasks, running maps the names
+        of the running tasks to the seconds they have left.
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        done = done or set()
+        running = running or {}
+        waiting = {
+            name: sum(1 for pred in self._graph.predecessors(name) if pred not in done)
+            for name in self._order
+            if name not in done
+        }
+        ready = collections.deque(
+            n for n in self._order if waiting.get(n) == 0 and n not in running
+        )
+        now = 0.0
+        busy = sum(running.values())
+        seq = len(running)
+        running = [
+            (left, idx, name) for idx, (name, left) in enumerate(running.items())
+        ]
+        heapq.heapify(running)
+        while ready or running:
+            while ready and len(running) < max_workers:
+                name = ready.popleft()
+                duration = self.duration(name)
+                busy += duration
+                heapq.heappush(running, (now + duration, seq, name))
+                seq += 1
+            now, _, name = heapq.heappop(running)
+            for child in self._graph.successors(name):
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+        path, critical_time = self.critical_path()
+        return SimulationResult(max_workers, now, busy, path, critical_time)
+
+    def sweep(self, worker_counts) -> list:
+        return [self.run(count) for count in worker_counts]
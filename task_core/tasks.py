@@ -10,17 +10,26 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """service and task objects"""
+# pylint: disable=too-many-lines
+import collections
+import json
 import logging
 import os
 import random
+import signal
 import subprocess
+import tempfile
+import threading
 import time
 
+import yaml
+
 try:
     import ansible_runner
 except ImportError:
     ansible_runner = None
 from stevedore import driver
+from taskflow.types import sets
 
 try:
     from directord import DirectordConnect
@@ -30,6 +39,13 @@ except ImportError:
 from .base import BaseTask
 from .base import BaseInstance
 from .exceptions import ExecutionFailed
+from .exceptions import TaskTimeout
+from .executor import released
+from .facts import FactService
+from .graph import TaskGraph
+from .logging import Truncated
+from .logging import task_context
+from .metrics import Metrics
 
 LOG = logging.getLogger(__name__)
 
@@ -65,8 +81,11 @@ class TaskResult:
         """rturn data info"""
         return self._data
 
+    def as_dict(self) -> dict:
+        return {"status": self.status, "data": self.data}
+
     def __repr__(self):
-        return repr({"status": self.status, "data": self.data})
+        return repr(self.as_dict())
 
 
 class ServiceTask(BaseTask):
@@ -83,13 +102,19 @@ class ServiceTask(BaseTask):
             args,
             kwargs,
             self.hosts,
-            self.data,
+            Truncated(self.data),
         )
         LOG.info("%s | Running", self)
+        deadline = self.deadline()
         for j in self.jobs:
             if "echo" in j:
                 LOG.info(j.get("echo"))
-                time.sleep(random.random())
+                delay = random.random()
+                remaining = deadline.remaining()
+                if remaining is not None and delay > remaining:
+                    time.sleep(remaining)
+                    raise TaskTimeout(f"{self} | Timed out after {self.timeout}s")
+                time.sleep(delay)
             else:
                 LOG.info("%s | Unknown action: %s", self, j)
         # note: this return time needs to match the "provides" format type.
@@ -120,7 +145,7 @@ class DirectordTask(ServiceTask):
             args,
             kwargs,
             self.hosts,
-            self.data,
+            Truncated(self.data),
         )
         LOG.info("%s | Running", self)
 
@@ -143,10 +168,20 @@ class DirectordTask(ServiceTask):
         pending = jobs
         success = []
         failure = []
+        deadline = self.deadline()
         while len(pending) > 0:
+            if deadline.expired():
+                # the jobs keep running in directord, we only stop waiting
+                LOG.error("%s | Abandoning jobs %s", self, ", ".join(pending))
+                raise TaskTimeout(
+                    "{} | Timed out after {}s waiting for {}".format(
+                        self, self.timeout, ", ".join(pending)
+                    )
+                )
             job = pending.pop(0)
             LOG.debug("%s | Waiting for job... %s", self, job)
             status, info = conn.poll(job_id=job)
+            Metrics.instance().inc("task_core_directord_polls_total")
             if status is True:
                 success.append(job)
             elif status is False:
@@ -189,7 +224,7 @@ class PrintTask(BaseTask):
             args,
             kwargs,
             self.hosts,
-            self.data,
+            Truncated(self.data),
         )
         LOG.info("%s | Running", self)
         LOG.info("PRINT: %s", self.message)
@@ -197,6 +232,84 @@ class PrintTask(BaseTask):
         return [TaskResult(True, {})]
 
 
+class _EventSummary:
+    """stream ansible-runner events into the logs and summarize them
+
+    Only the last stdout_lines lines of output are kept in memory, the
+    complete output stays in the runner artifacts on disk.
+    """
+
+    STATUSES = {
+        "runner_on_ok": "ok",
+        "runner_on_failed": "failed",
+        "runner_on_skipped": "skipped",
+        "runner_on_unreachable": "unreachable",
+    }
+
+    def __init__(self, task, stdout_lines: int = 100, handler=None):
+        self._task = task
+        self._handler = handler
+        self._stdout = collections.deque(maxlen=stdout_lines)
+        self._hosts = {}
+        self._tasks = {}
+
+    @property
+    def stdout(self) -> str:
+        return "\n".join(self._stdout)
+
+    @property
+    def hosts(self) -> dict:
+        """host -> {status: count}"""
+        return self._hosts
+
+    @property
+    def tasks(self) -> dict:
+        """ansible task name -> {status: count, "duration": seconds}"""
+        return self._tasks
+
+    def __call__(self, event: dict) -> bool:
+        if event.get("stdout"):
+            self._stdout.extend(event["stdout"].splitlines())
+        kind = event.get("event")
+        data = event.get("event_data", {})
+        if kind == "playbook_on_task_start":
+            LOG.info("%s | TASK [%s]", self._task, data.get("task"))
+        status = self.STATUSES.get(kind)
+        if status:
+            if status == "ok" and data.get("res", {}).get("changed"):
+                status = "changed"
+            elif status == "failed" and data.get("ignore_errors"):
+                status = "ignored"
+            self._record(status, data)
+        if self._handler:
+            return self._handler(event)
+        return True
+
+    def _record(self, status, data):
+        host = data.get("host")
+        name = data.get("task")
+        host_summary = self._hosts.setdefault(host, {})
+        host_summary[status] = host_summary.get(status, 0) + 1
+        task_summary = self._tasks.setdefault(name, {"duration": 0.0})
+        task_summary[status] = task_summary.get(status, 0) + 1
+        task_summary["duration"] = max(
+            task_summary["duration"], float(data.get("duration") or 0)
+        )
+        if status in ("failed", "unreachable"):
+            LOG.error(
+                "%s | %s: [%s] %s",
+                self._task,
+                status,
+                host,
+                data.get("res", {}).get("msg", name),
+            )
+        else:
+            LOG.debug("%s | %s: [%s] %s", self._task, status, host, name)
+
+    def as_dict(self) -> dict:
+        return {"stdout": self.stdout, "hosts": self.hosts, "tasks": self.tasks}
+
+
 class AnsibleRunnerTask(BaseTask):
     """ansible task"""
 
@@ -224,6 +337,40 @@ class AnsibleRunnerTask(BaseTask):
     def global_fact_cache(self) -> bool:
         return self._data.get("global_fact_cache", True)
 
+    @property
+    def coalesce(self) -> bool:
+        return self._data.get("coalesce", True)
+
+    @property
+    def shared_facts(self) -> bool:
+        return self._data.get("shared_facts", True)
+
+    @property
+    def run_async(self) -> bool:
+        return self._data.get("async", False)
+
+    @property
+    def stdout_lines(self) -> int:
+        return self._data.get("stdout_lines", 100)
+
+    def coalesce_key(self):
+        """tasks with the same key can share a single ansible-playbook run"""
+        if not self.coalesce:
+            return None
+        return (
+            self.working_dir,
+            self.inventory_path,
+            tuple(sorted(self.hosts)),
+            json.dumps(self.runner_options, sort_keys=True, default=str),
+            json.dumps(self.task_options, sort_keys=True, default=str),
+            self.global_fact_cache,
+            self.shared_facts,
+            # the coalesced run can only apply one setting to all its tasks
+            self.timeout,
+            self.run_async,
+            self.stdout_lines,
+        )
+
     def _default_ansible_paths(self):
         paths = {}
         paths["ANSIBLE_ACTION_PLUGINS"] = ":".join(
@@ -265,28 +412,18 @@ class AnsibleRunnerTask(BaseTask):
         )
         return paths
 
-    def execute(self, *args, **kwargs) -> list:
-        if not ansible_runner:
-            raise Exception(
-                "ansible-runner libraries are unavailable. Please "
-                "install ansible-runner."
-            )
-        LOG.debug(
-            "%s ansible execute - args: %s, kwargs: %s, working_dir: %s, hosts: %s, data; %s",
-            self,
-            args,
-            kwargs,
-            self.working_dir,
-            self.hosts,
-            self.data,
-        )
-        LOG.info("%s | Running", self)
+    @property
+    def playbook_path(self) -> str:
+        """path of the playbook to run, also used by coalesced tasks"""
         # check if playbook is relative to working dir and exists, or
         # fall back to the provided playbook path and hope it exists
         playbook_path = os.path.join(self.working_dir, self.playbook)
         if not os.path.isfile(playbook_path):
             playbook_path = self.playbook
+        return playbook_path
 
+    @property
+    def inventory_path(self) -> str:
         # default to an inventory in working dir if not defined on the task
         inventory_path = os.path.join(self.working_dir, "inventory.yaml")
         if self.inventory is not None and os.path.exists(
@@ -295,6 +432,10 @@ class AnsibleRunnerTask(BaseTask):
             inventory_path = os.path.join(self.working_dir, self.inventory)
         elif not os.path.exists(inventory_path):
             inventory_path = None
+        return inventory_path
+
+    def _runner_config(self, playbook_path, facts_cached=False, **extra_opts):
+        inventory_path = self.inventory_path
 
         env = self._default_ansible_paths()
         cfg_path = os.path.join(self.working_dir, "ansible.cfg")
@@ -304,11 +445,13 @@ class AnsibleRunnerTask(BaseTask):
         runner_opts = {
             "private_data_dir": self.working_dir,
             "project_dir": self.working_dir,
-            "playbook": playbook_path,
             "envvars": env,
         }
+        if playbook_path:
+            runner_opts["playbook"] = playbook_path
         if inventory_path:
             runner_opts["inventory"] = inventory_path
+        runner_opts.update(extra_opts)
 
         runner_opts.update(self.runner_options)
         runner_config = ansible_runner.runner_config.RunnerConfig(**runner_opts)
@@ -327,9 +470,88 @@ class AnsibleRunnerTask(BaseTask):
             runner_config.env[
                 "ANSIBLE_CACHE_PLUGIN_CONNECTION"
             ] = "~/.ansible/fact_cache"
+
+        # facts gathered once for the run by the fact service win over both
+        if self.shared_facts and FactService.instance().enabled:
+            runner_config.env.update(FactService.instance().env(facts_cached))
+        return runner_config
+
+    def gather_facts(self, hosts: list) -> bool:
+        """run the setup module against hosts to fill the fact cache"""
+        runner_config = self._runner_config(
+            None, module="setup", host_pattern=":".join(hosts)
+        )
         runner = ansible_runner.Runner(config=runner_config)
         status, rc = runner.run()
-        data = {"stdout": runner.stdout, "stats": runner.stats}
+        return rc == 0 and status == "successful"
+
+    def _runner(self, runner_config, deadline, **kwargs):
+        # ansible-runner kills the playbook once the callback returns True
+        if deadline.timeout is not None:
+            kwargs["cancel_callback"] = deadline.expired
+        return ansible_runner.Runner(config=runner_config, **kwargs)
+
+    def _check_timeout(self, status, deadline):
+        if status == "canceled" and deadline.expired():
+            raise TaskTimeout(f"{self} | Timed out after {deadline.timeout}s")
+
+    def _run_async(self, runner_config, event_handler=None, deadline=None):
+        """run the playbook in the background while streaming its events
+
+        The engine slot of this task is given back while the playbook runs
+        so other tasks can start in the meantime.
+        """
+        summary = _EventSummary(self, self.stdout_lines, event_handler)
+        runner = self._runner(
+            runner_config, deadline or self.deadline(), event_handler=summary
+        )
+        errors = []
+
+        def _run():
+            try:
+                with task_context(self.name):
+                    runner.run()
+            except Exception as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        thread = threading.Thread(target=_run, name=f"ansible-{self.name}")
+        thread.daemon = True
+        thread.start()
+        with released():
+            thread.join()
+        if errors:
+            raise errors[0]
+        return runner, summary
+
+    def execute(self, *args, **kwargs) -> list:
+        if not ansible_runner:
+            raise Exception(
+                "ansible-runner libraries are unavailable. Please "
+                "install ansible-runner."
+            )
+        LOG.debug(
+            "%s ansible execute - args: %s, kwargs: %s, working_dir: %s, hosts: %s, data; %s",
+            self,
+            args,
+            kwargs,
+            self.working_dir,
+            self.hosts,
+            Truncated(self.data),
+        )
+        LOG.info("%s | Running", self)
+        facts_cached = self.shared_facts and FactService.instance().ensure(self)
+        runner_config = self._runner_config(self.playbook_path, facts_cached)
+        deadline = self.deadline()
+        if self.run_async:
+            runner, summary = self._run_async(runner_config, deadline=deadline)
+            status, rc = runner.status, runner.rc
+            data = summary.as_dict()
+            data["stats"] = runner.stats
+        else:
+            runner = self._runner(runner_config, deadline)
+            status, rc = runner.run()
+            data = {"stdout": runner.stdout, "stats": runner.stats}
+        self._check_timeout(status, deadline)
         # https://ansible-runner.readthedocs.io/en/stable/python_interface.html#the-runner-object
         status = rc == 0 and status == "successful"
         if not status:
@@ -342,6 +564,229 @@ class AnsibleRunnerTask(BaseTask):
         return [TaskResult(status, data)]
 
 
+class _PlaybookSegments:
+    """attribute the events of a coalesced playbook run to the original tasks
+
+    Every task's playbook is preceded by a marker play named after the task,
+    so all events between two marker plays belong to the first one.
+    """
+
+    MARKER = "task-core: "
+
+    def __init__(self, names: list):
+        self._markers = {f"{self.MARKER}{name}": name for name in names}
+        self._current = None
+        self._in_marker = False
+        self._ran = set()
+        self._failures = {}
+
+    def __call__(self, event: dict) -> bool:
+        kind = event.get("event")
+        data = event.get("event_data", {})
+        if kind == "playbook_on_play_start":
+            play = data.get("play")
+            self._in_marker = play in self._markers
+            if self._in_marker:
+                self._current = self._markers[play]
+            elif self._current:
+                self._ran.add(self._current)
+        elif self._current and not self._in_marker:
+            # failures in marker plays come from the guard that stops the
+            # run after a failed task, they do not belong to the next task
+            if kind == "runner_on_unreachable" or (
+                kind == "runner_on_failed" and not data.get("ignore_errors")
+            ):
+                self._failures[self._current] = self._failures.get(self._current, 0) + 1
+        # keep the event in the runner artifacts
+        return True
+
+    def status(self, name: str) -> str:
+        if self._failures.get(name):
+            return "failed"
+        if name in self._ran:
+            return "successful"
+        return "not run"
+
+    def failures(self, name: str) -> int:
+        return self._failures.get(name, 0)
+
+
+class CoalescedAnsibleRunnerTask(AnsibleRunnerTask):
+    """several dependent ansible tasks run as a single playbook
+
+    The tasks must share working_dir, inventory, hosts and options (see
+    AnsibleRunnerTask.coalesce_key) and form a linear chain. A generated
+    playbook imports each task's playbook in order, with a guard play in
+    between that stops the run once any host has failed so later tasks do
+    not run, just like they would not be started by the engine.
+    """
+
+    def __init__(self, tasks: list):
+        first = tasks[0]
+        provides = []
+        for task in tasks:
+            provides.extend(task.task_provides or [])
+        requires = []
+        for task in tasks:
+            for value in task.task_requires:
+                if value not in provides and value not in requires:
+                    requires.append(value)
+        data = dict(first.data)
+        # a set maps the results by value name, see execute()
+        data.update({"provides": sets.OrderedSet(provides), "requires": requires})
+        data.pop("playbook", None)
+        # the playbook may run as long as its tasks would have together
+        timeouts = [task.timeout for task in tasks]
+        data.pop("timeout", None)
+        if None not in timeouts:
+            data["timeout"] = sum(timeouts)
+        super().__init__(
+            first.service,
+            data,
+            first.hosts,
+            name="+".join(task.name for task in tasks),
+        )
+        self.version = first.version
+        self._tasks = tasks
+
+    @property
+    def tasks(self) -> list:
+        return self._tasks
+
+    def _playbook(self) -> list:
+        plays = []
+        for idx, task in enumerate(self.tasks):
+            marker = {
+                "name": f"{_PlaybookSegments.MARKER}{task.name}",
+                "hosts": "all",
+                "gather_facts": False,
+                "tasks": [],
+            }
+            if idx > 0:
+                marker["any_errors_fatal"] = True
+                marker["tasks"].append(
+                    {
+                        "name": "Stop if a previous task failed",
+                        "fail": {"msg": f"Not running {task.name}"},
+                        "run_once": True,
+                        "when": (
+                            "ansible_play_hosts | length < "
+                            "ansible_play_hosts_all | length"
+                        ),
+                    }
+                )
+            plays.append(marker)
+            plays.append({"import_playbook": task.playbook_path})
+        return plays
+
+    def _write_playbook(self) -> str:
+        # write next to the original playbooks so playbook_dir is unchanged
+        with tempfile.NamedTemporaryFile(
+            mode="w",
+            encoding="utf-8",
+            dir=self.working_dir,
+            prefix=".task-core-",
+            suffix=".yaml",
+            delete=False,
+        ) as fout:
+            yaml.safe_dump(self._playbook(), fout, default_flow_style=False)
+        return fout.name
+
+    def execute(self, *args, **kwargs) -> list:  # pylint: disable=too-many-locals
+        if not ansible_runner:
+            raise Exception(
+                "ansible-runner libraries are unavailable. Please "
+                "install ansible-runner."
+            )
+        LOG.debug(
+            "%s ansible execute - args: %s, kwargs: %s, working_dir: %s, hosts: %s, data; %s",
+            self,
+            args,
+            kwargs,
+            self.working_dir,
+            self.hosts,
+            Truncated(self.data),
+        )
+        LOG.info("%s | Running", self)
+        facts_cached = self.shared_facts and FactService.instance().ensure(self)
+        segments = _PlaybookSegments([task.name for task in self.tasks])
+        playbook_path = self._write_playbook()
+        deadline = self.deadline()
+        try:
+            runner_config = self._runner_config(playbook_path, facts_cached)
+            if self.run_async:
+                runner, summary = self._run_async(runner_config, segments, deadline)
+                status, rc = runner.status, runner.rc
+                stdout = summary.stdout
+            else:
+                runner = self._runner(runner_config, deadline, event_handler=segments)
+                status, rc = runner.run()
+                stdout = runner.stdout
+        finally:
+            os.unlink(playbook_path)
+        self._check_timeout(status, deadline)
+
+        results = {}
+        failed = []
+        for task in self.tasks:
+            task_status = segments.status(task.name)
+            if task_status != "successful":
+                failed.append(task.name)
+            data = {
+                "stdout": stdout,
+                "stats": runner.stats,
+                "status": task_status,
+                "failures": segments.failures(task.name),
+            }
+            result = TaskResult(task_status == "successful", data)
+            # every value maps back to the result of the task declaring it
+            for value in task.task_provides or []:
+                results[value] = result
+            if task_status == "successful":
+                LOG.info("%s | Completed", task)
+            else:
+                LOG.error("%s | %s", task, task_status)
+
+        if not (rc == 0 and status == "successful"):
+            raise ExecutionFailed(
+                "{} | Ansible job execution failed for {}. rc: {}, status {}".format(
+                    self, ", ".join(failed) or self.name, rc, status
+                )
+            )
+        LOG.info("%s | Completed", self)
+        return results
+
+
+def coalesce_ansible_tasks(tasks: list) -> list:
+    """replace linear chains of compatible ansible tasks with a single task
+
+    Each chain is replaced with a CoalescedAnsibleRunnerTask at the position
+    of its first task, all other tasks are returned unchanged.
+    """
+    by_name = {task.name: task for task in tasks}
+
+    def _key(name):
+        task = by_name[name]
+        # retried tasks keep their own retry controller
+        if not isinstance(task, AnsibleRunnerTask) or task.retries:
+            return None
+        return task.coalesce_key()
+
+    merged = {}
+    for chain in TaskGraph.from_tasks(tasks).linear_chains(_key):
+        LOG.info("Coalescing ansible tasks %s", ", ".join(chain))
+        coalesced = CoalescedAnsibleRunnerTask([by_name[name] for name in chain])
+        merged[chain[0]] = coalesced
+        for name in chain[1:]:
+            merged[name] = None
+    result = []
+    for task in tasks:
+        task = merged.get(task.name, task)
+        if task is not None:
+            result.append(task)
+    return result
+
+
 class NoopTask(BaseTask):
     """noop task that returns name and hosts in results"""
 
@@ -352,7 +797,7 @@ class NoopTask(BaseTask):
             args,
             kwargs,
             self.hosts,
-            self.data,
+            Truncated(self.data),
         )
         LOG.info("%s | Running", self)
         data = {"id": self.task_id, "hosts": self.hosts}
@@ -375,13 +820,21 @@ class LocalTask(BaseTask):
     def returncodes(self):
         return self.data.get("returncodes", [0])
 
+    @staticmethod
+    def _kill(proc, killed):
+        killed.set()
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
     def execute(self, *args, **kwargs) -> list:
         LOG.debug(
             "%s local execute - args: %s, kwargs: %s, data; %s",
             self,
             args,
             kwargs,
-            self.data,
+            Truncated(self.data),
         )
         LOG.info("%s | Running", self)
         cmd = self.command.strip()
@@ -389,14 +842,29 @@ class LocalTask(BaseTask):
             "id": self.task_id,
             "command": cmd,
         }
+        deadline = self.deadline()
         with subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
             shell=True,
+            # own process group so a timeout kills the whole command
+            start_new_session=True,
         ) as proc:
+            killed = threading.Event()
+            timer = None
+            if deadline.timeout is not None and not self.quiet:
+                timer = threading.Timer(
+                    deadline.remaining(), self._kill, [proc, killed]
+                )
+                timer.daemon = True
+                timer.start()
             if self.quiet:
-                output, errs = proc.communicate()
+                try:
+                    output, errs = proc.communicate(timeout=deadline.remaining())
+                except subprocess.TimeoutExpired:
+                    self._kill(proc, killed)
+                    output, errs = proc.communicate()
                 data["output"] = output
                 data["errors"] = errs
             else:
@@ -409,10 +877,130 @@ class LocalTask(BaseTask):
                         break
                     if isinstance(line, bytes):
                         line = line.decode("utf-8")
-                    LOG.info(line.rstrip())
+                    LOG.info(line.rstrip(), extra={"task_output": True})
                 proc.stdout.close()
                 proc.wait()
+            if timer is not None:
+                timer.cancel()
+            if killed.is_set():
+                raise TaskTimeout(f"{self} | Timed out after {self.timeout}s")
             data["returncode"] = proc.returncode
             result = proc.returncode in self.returncodes
         LOG.info("%s | Completed", self)
         return [TaskResult(result, data)]
+
+
+class BenchTask(BaseTask):
+    """synthetic load task for benchmarking the engine
+
+    Every value is drawn from a random generator seeded with the seed, the
+    task name and the attempt number, so a run can be repeated exactly.
+    Durations are either a number of seconds or a distribution such as
+    {"distribution": "exponential", "mean": 0.5}.
+    """
+
+    @property
+    def duration(self):
+        return self._data.get("duration", 0)
+
+    @property
+    def cpu(self):
+        return self._data.get("cpu", 0)
+
+    @property
+    def memory(self) -> int:
+        return self._data.get("memory", 0)
+
+    @property
+    def output(self) -> int:
+        return self._data.get("output", 0)
+
+    @property
+    def failure_rate(self) -> float:
+        return self._data.get("failure_rate", 0.0)
+
+    @property
+    def seed(self) -> int:
+        return self._data.get("seed", 0)
+
+    @property
+    def release(self) -> bool:
+        return self._data.get("release", False)
+
+    @staticmethod
+    def sample(spec, rng: random.Random) -> float:
+        """draw a non negative number of seconds from a distribution spec"""
+        if not isinstance(spec, dict):
+            return max(0.0, float(spec))
+        dist = spec.get("distribution", "fixed")
+        if dist == "fixed":
+            value = spec.get("value", 0)
+        elif dist == "uniform":
+            value = rng.uniform(spec.get("min", 0), spec.get("max", 1))
+        elif dist == "normal":
+            value = rng.gauss(spec.get("mean", 1), spec.get("stddev", 0))
+        elif dist == "exponential":
+            value = rng.expovariate(1.0 / spec.get("mean", 1))
+        elif dist == "lognormal":
+            value = rng.lognormvariate(spec.get("mu", 0), spec.get("sigma", 1))
+        else:
+            raise ValueError(f"Unknown distribution {dist}")
+        return max(0.0, float(value))
+
+    @staticmethod
+    def burn(seconds: float) -> int:
+        """keep the calling thread busy for seconds of cpu time"""
+        clock = getattr(time, "thread_time", time.process_time)
+        end = clock() + seconds
+        loops = 0
+        while clock() < end:
+            for i in range(1000):
+                loops += i & 1
+        return loops
+
+    def execute(self, *args, **kwargs) -> list:
+        LOG.debug(
+            "%s bench execute - args: %s, kwargs: %s, hosts: %s, data; %s",
+            self,
+            args,
+            kwargs,
+            self.hosts,
+            Truncated(self.data),
+        )
+        LOG.info("%s | Running", self)
+        # pre_execute counts the attempts of the task
+        rng = random.Random(f"{self.seed}:{self.name}:{self.attempts}")
+        duration = self.sample(self.duration, rng)
+        cpu = self.sample(self.cpu, rng)
+        # work that would not fit in the timeout is cut short
+        remaining = self.deadline().remaining()
+        timed_out = remaining is not None and cpu + duration > remaining
+        if timed_out:
+            cpu = min(cpu, remaining)
+            duration = min(duration, remaining - cpu)
+        # hold the memory for the whole task like a real working set
+        ballast = bytearray(self.memory)
+        if cpu:
+            self.burn(cpu)
+        if duration:
+            if self.release:
+                with released():
+                    time.sleep(duration)
+            else:
+                time.sleep(duration)
+        if timed_out:
+            raise TaskTimeout(f"{self} | Timed out after {self.timeout}s")
+        failed = rng.random() < self.failure_rate
+        data = {
+            "id": self.task_id,
+            "attempt": self.attempts,
+            "duration": duration,
+            "cpu": cpu,
+            "memory": len(ballast),
+            "output": "x" * self.output,
+        }
+        del ballast
+        if failed:
+            raise ExecutionFailed(f"{self} | Synthetic failure")
+        LOG.info("%s | Completed", self)
+        return [TaskResult(True, data)]
@@ -0,0 +1,68 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the adaptive module"""
+import unittest
+from task_core.adaptive import AdaptiveLimit
+
+
+class TestAdaptiveLimit(unittest.TestCase):
+    """Test AdaptiveLimit"""
+
+    def _window(self, limit, seconds, failed=False, key="ansible"):
+        for _ in range(limit.limit):
+            limit.observe(key, seconds, failed)
+
+    def test_increase(self):
+        limit = AdaptiveLimit(2, 4)
+        self.assertEqual(limit.limit, 2)
+        for expected in (3, 4, 4):
+            self._window(limit, 1.0)
+            self.assertEqual(limit.limit, expected)
+        self.assertEqual(
+            limit.stats, {"limit": 4, "highest": 4, "increases": 2, "decreases": 0}
+        )
+
+    def test_latency(self):
+        limit = AdaptiveLimit(1, 8)
+        for _ in range(3):
+            self._window(limit, 1.0)
+        self.assertEqual(limit.limit, 4)
+        # another driver has its own usual duration
+        self._window(limit, 10.0, key="directord")
+        self.assertEqual(limit.limit, 5)
+        self._window(limit, 5.0)
+        self.assertEqual(limit.limit, 2)
+        self.assertEqual(limit.decisions[-1]["reason"], "latency")
+        self.assertEqual(limit.decisions[-1]["previous"], 5)
+
+    def test_errors(self):
+        limit = AdaptiveLimit(1, 8)
+        for _ in range(3):
+            self._window(limit, 1.0)
+        limit.observe("ansible", 1.0, failed=True)
+        self._window(limit, 1.0)
+        self.assertEqual(limit.limit, 2)
+        self.assertEqual(limit.decisions[-1]["reason"], "errors")
+        self.assertEqual(limit.decisions[-1]["error_rate"], 0.25)
+        self._window(limit, 1.0, failed=True)
+        self._window(limit, 1.0, failed=True)
+        self.assertEqual(limit.limit, 1)
+
+    def test_floor(self):
+        limit = AdaptiveLimit(1, 3)
+        # 50 times slower, but both below the floor
+        limit.observe("print", 0.001)
+        limit.observe("print", 0.05)
+        limit.observe("print", 0.05)
+        self.assertEqual(limit.limit, 3)
+        self.assertRaises(ValueError, AdaptiveLimit, 0, 2)
+        self.assertRaises(ValueError, AdaptiveLimit, 3, 2)
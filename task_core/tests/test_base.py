@@ -72,6 +72,29 @@ class TestBaseFileData(unittest.TestCase):
             self.assertEqual(obj.data, {"id": "foo", "name": "bar"})
             self.assertEqual(obj.name, "foo")
 
+    @mock.patch("glob.glob", return_value=["/foo/bar/b.yaml", "/foo/bar/a.yaml"])
+    @mock.patch("os.path.isdir", return_value=True)
+    @mock.patch("os.path.isfile", return_value=False)
+    def test_file_data_directory_layers(self, mock_isfile, mock_isdir, mock_glob):
+        """test files of a directory are layered in path order"""
+        with mock.patch("builtins.open", mock.mock_open()) as open_mock:
+            open_mock.side_effect = [
+                mock.mock_open(read_data=content).return_value
+                for content in ["id: foo", "", "id: bar"]
+            ]
+            mock_glob.return_value.append("/foo/bar/c.yaml")
+            obj = base.BaseFileData("/foo/bar")
+            self.assertEqual(
+                [c[0][0] for c in open_mock.call_args_list],
+                ["/foo/bar/a.yaml", "/foo/bar/b.yaml", "/foo/bar/c.yaml"],
+            )
+            # the empty b.yaml is skipped
+            self.assertEqual(obj.data.layers, [{"id": "foo"}, {"id": "bar"}])
+            self.assertEqual(obj.name, "bar")
+
+        with mock.patch("builtins.open", mock.mock_open(read_data="[1]")):
+            self.assertRaises(InvalidFileData, base.BaseFileData, "/foo/bar")
+
     @mock.patch("os.path.isdir", return_value=False)
     @mock.patch("os.path.isfile", return_value=False)
     def test_file_data_dict(self, mock_isfile, mock_isdir):
@@ -117,6 +140,22 @@ class TestBaseTask(unittest.TestCase):
         obj.update_requires(["buzz"])
         self.assertEqual(obj.requires, sets.OrderedSet(["bar", "buzz"]))
 
+    @mock.patch("time.sleep")
+    def test_retry_delay(self, mock_sleep):
+        obj = base.BaseTask("test", {"id": "i"}, [])
+        self.assertEqual((obj.retries, obj.delay, obj.backoff), (0, 0, 1))
+        obj = base.BaseTask("test", {"id": "i", "delay": 2, "backoff": 3}, [])
+        self.assertEqual(obj.retry_delay(1), 0)
+        self.assertEqual(obj.retry_delay(2), 2)
+        self.assertEqual(obj.retry_delay(4), 18)
+        obj.pre_execute()
+        self.assertFalse(mock_sleep.called)
+        obj.pre_execute()
+        mock_sleep.assert_called_once_with(2)
+        self.assertEqual(obj.attempts, 2)
+        obj.reset()
+        self.assertEqual((obj.attempts, obj.started), (0, None))
+
 
 class TestBaseInstance(unittest.TestCase):
     """Test BaseInstance object"""
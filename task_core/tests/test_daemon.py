@@ -0,0 +1,206 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the daemon module"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+import yaml
+from task_core import daemon
+from task_core.graph import iter_tasks
+
+SERVICE_A = {
+    "id": "service-a",
+    "type": "service",
+    "version": "1.0.0",
+    "tasks": [
+        {
+            "id": "setup",
+            "driver": "print",
+            "message": "m",
+            "provides": ["service-a.setup"],
+        },
+        {
+            "id": "run",
+            "driver": "print",
+            "message": "m",
+            "provides": ["service-a.run"],
+            "requires": ["service-a.setup"],
+        },
+    ],
+}
+SERVICE_B = {
+    "id": "service-b",
+    "type": "service",
+    "version": "1.0.0",
+    "tasks": [
+        {
+            "id": "run",
+            "driver": "print",
+            "message": "m",
+            "provides": ["service-b.run"],
+            "requires": ["service-a.run"],
+        },
+    ],
+}
+
+
+class FakeRunFlow:
+    """records the flows the daemon runs"""
+
+    def __init__(self):
+        self.calls = []
+        self.flows = []
+        self.error = None
+        self.event = threading.Event()
+
+    def __call__(self, flow, args, start, executor=None, store=None):
+        self.flows.append(flow)
+        self.calls.append(([t.name for t in iter_tasks(flow)], executor, store))
+        self.event.wait(5)
+        if self.error:
+            raise self.error
+        return {name: None for name in self.calls[-1][0]}
+
+
+class TestDaemon(unittest.TestCase):
+    """Test Daemon"""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        services_dir = os.path.join(tmp.name, "services")
+        os.makedirs(services_dir)
+        files = {
+            os.path.join(services_dir, "service-a.yaml"): SERVICE_A,
+            os.path.join(services_dir, "service-b.yaml"): SERVICE_B,
+            os.path.join(tmp.name, "inventory.yaml"): {
+                "hosts": {"host-a": {"role": "role-a"}}
+            },
+            os.path.join(tmp.name, "roles.yaml"): {
+                "role-a": {"services": ["service-a", "service-b"]}
+            },
+        }
+        for path, data in files.items():
+            with open(path, encoding="utf-8", mode="w") as fout:
+                yaml.safe_dump(data, fout)
+        self.args = argparse.Namespace(
+            services_dir=services_dir,
+            inventory_file=os.path.join(tmp.name, "inventory.yaml"),
+            roles_file=os.path.join(tmp.name, "roles.yaml"),
+            max_workers=2,
+            min_workers=1,
+            concurrency="fixed",
+            pool=["print=1"],
+            pools_file=None,
+            transport_url=None,
+            local_workers=0,
+            coalesce_ansible=False,
+            failure_policy="revert-all",
+        )
+        self.run_flow = FakeRunFlow()
+        self.daemon = daemon.Daemon(self.args, self.run_flow)
+        self.addCleanup(self.daemon.close)
+
+    def test_select(self):
+        self.assertEqual(self.daemon.select(["service-b"]), ["service-b-run"])
+        self.assertEqual(
+            self.daemon.select(["*-run"], upstream=True),
+            ["service-a-setup", "service-a-run", "service-b-run"],
+        )
+
+    def test_run(self):
+        self.run_flow.event.set()
+        run = self.daemon.start_run()
+        self.assertEqual(run.kind, "run")
+        run = self.daemon.wait(run.run_id, timeout=5)
+        self.assertEqual(run.state, "SUCCESS")
+        self.assertEqual(run.as_dict()["ran"], 3)
+        tasks, executor, store = self.run_flow.calls[0]
+        self.assertEqual(len(tasks), 3)
+        self.assertIsNone(store)
+        # the same executor is used for every run
+        run = self.daemon.wait(self.daemon.start_run().run_id, timeout=5)
+        self.assertIs(self.run_flow.calls[1][1], executor)
+        self.assertEqual(executor.pools.limits, {"print": 1})
+        self.assertEqual(len(self.daemon.status()["runs"]), 2)
+
+    def test_reuse_flow(self):
+        self.run_flow.event.set()
+        self.daemon.wait(self.daemon.start_run().run_id, timeout=5)
+        flow = self.run_flow.flows[0]
+        for task in iter_tasks(flow):
+            task.pre_execute()
+        self.daemon.wait(self.daemon.start_run().run_id, timeout=5)
+        self.assertIs(self.run_flow.flows[1], flow)
+        # the tasks start the next run without the attempts of the last one
+        self.assertEqual({task.attempts for task in iter_tasks(flow)}, {0})
+        self.daemon.wait(self.daemon.start_run(["service-b-*"]).run_id, timeout=5)
+        self.assertIsNot(self.run_flow.flows[2], flow)
+        self.daemon.load()
+        self.daemon.wait(self.daemon.start_run().run_id, timeout=5)
+        self.assertIsNot(self.run_flow.flows[3], flow)
+
+    def test_slice(self):
+        self.run_flow.event.set()
+        run = self.daemon.start_run(["service-b-*"])
+        self.assertEqual(self.daemon.wait(run.run_id, timeout=5).state, "SUCCESS")
+        tasks, _, store = self.run_flow.calls[0]
+        self.assertEqual(tasks, ["service-b-run"])
+        self.assertEqual(store, {"service-a.run": None})
+        self.assertRaises(ValueError, self.daemon.start_run, ["nope"])
+
+    def test_one_run_at_a_time(self):
+        run = self.daemon.start_run()
+        self.assertRaises(RuntimeError, self.daemon.start_run)
+        self.assertRaises(RuntimeError, self.daemon.load)
+        self.run_flow.error = Exception("boom")
+        self.run_flow.event.set()
+        run = self.daemon.wait(run.run_id, timeout=5)
+        self.assertEqual(run.state, "FAILURE")
+        self.assertEqual(run.as_dict()["error"], "boom")
+
+    def test_api(self):
+        server = daemon.make_server(self.daemon, "127.0.0.1:0")
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = "http://127.0.0.1:{}".format(server.server_address[1])
+
+        def _request(path, body=None):
+            data = None if body is None else json.dumps(body).encode("utf-8")
+            with urllib.request.urlopen(url + path, data=data) as resp:
+                return resp.status, json.loads(resp.read())
+
+        with urllib.request.urlopen(url + "/metrics") as resp:
+            self.assertTrue(resp.headers["Content-Type"].startswith("text/plain"))
+        status, body = _request("/status")
+        self.assertEqual((status, body["services"], body["active"]), (200, 2, None))
+        status, body = _request("/slice", {"tasks": ["service-b-run"]})
+        self.assertEqual((status, body["kind"], body["tasks"]), (202, "slice", 1))
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            _request("/run", {})
+        self.assertEqual(ctx.exception.code, 409)
+        self.run_flow.event.set()
+        self.daemon.wait(body["id"], timeout=5)
+        status, body = _request("/runs/" + body["id"])
+        self.assertEqual(body["state"], "SUCCESS")
+        with self.assertRaises(urllib.error.HTTPError) as ctx:
+            _request("/runs/nope")
+        self.assertEqual(ctx.exception.code, 404)
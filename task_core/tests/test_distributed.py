@@ -0,0 +1,108 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the distributed module"""
+import threading
+import unittest
+from unittest import mock
+from taskflow.patterns import graph_flow as gf
+from taskflow.types import failure
+from task_core import distributed
+from task_core.exceptions import ExecutionFailed
+from task_core.exceptions import UnavailableException
+from task_core.tasks import NoopTask
+from task_core.tasks import TaskResult
+
+KOMBU_UNAVAILABLE = distributed.server is None
+
+
+def _flow():
+    flow = gf.Flow("root")
+    flow.add(
+        NoopTask("svc", {"id": "a", "provides": ["a"]}, ["host-a"]),
+        NoopTask("svc", {"id": "b", "provides": ["b"], "requires": ["a"]}, []),
+    )
+    return flow
+
+
+class FailingTask(NoopTask):
+    """task that always fails"""
+
+    def execute(self, *args, **kwargs):
+        raise ExecutionFailed("boom")
+
+
+class TestDistributed(unittest.TestCase):
+    """Test distributed helpers"""
+
+    def test_to_wire(self):
+        self.assertEqual(
+            distributed.to_wire([TaskResult(True, {"output": b"out"})]),
+            [{"status": True, "data": {"output": "out"}}],
+        )
+
+    def test_transport_options(self):
+        self.assertEqual(
+            distributed.transport_options("filesystem://", "/tmp/t")["data_folder_in"],
+            "/tmp/t",
+        )
+        self.assertRaises(ValueError, distributed.transport_options, "filesystem://")
+        self.assertEqual(distributed.transport_options("amqp://host"), {})
+
+    def test_unavailable(self):
+        with mock.patch.object(distributed, "server", None):
+            self.assertRaises(
+                UnavailableException, distributed.load_engine, _flow(), "memory://"
+            )
+            self.assertRaises(
+                UnavailableException, distributed.TaskWorker, _flow(), "memory://"
+            )
+
+
+class TestTaskEndpoint(unittest.TestCase):
+    """Test TaskEndpoint"""
+
+    def test_endpoint(self):
+        task = NoopTask("svc", {"id": "a"}, ["host-a"])
+        endpoint = distributed.TaskEndpoint(NoopTask, {task.name: task})
+        self.assertEqual(endpoint.name, "task_core.tasks.NoopTask")
+        self.assertIs(endpoint.generate("svc-a"), task)
+        self.assertRaises(UnavailableException, endpoint.generate, "svc-b")
+        result = endpoint.execute(task, task_uuid="uuid", arguments={})
+        self.assertEqual(
+            result, [{"status": True, "data": {"id": "a", "hosts": ["host-a"]}}]
+        )
+
+    def test_endpoint_failure(self):
+        task = FailingTask("svc", {"id": "a"}, [])
+        endpoint = distributed.TaskEndpoint(FailingTask, {task.name: task})
+        result = endpoint.execute(task, task_uuid="uuid", arguments={})
+        self.assertIsInstance(result, failure.Failure)
+        self.assertTrue(result.check(ExecutionFailed))
+
+
+@unittest.skipIf(KOMBU_UNAVAILABLE, "kombu library unavailable")
+class TestDistributedRun(unittest.TestCase):
+    """Test a run through an in memory transport"""
+
+    def test_run(self):
+        worker = distributed.TaskWorker(_flow(), "memory://", topic="test")
+        thread = threading.Thread(target=worker.run)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(worker.stop)
+        worker.wait()
+        engine = distributed.load_engine(_flow(), "memory://", topic="test")
+        engine.run()
+        self.assertEqual(
+            engine.storage.fetch("b"),
+            {"status": True, "data": {"id": "b", "hosts": []}},
+        )
@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the events module"""
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+from task_core import events
+from task_core.base import BaseTask
+
+
+class TestEvents(unittest.TestCase):
+    """Test EventStream and the module functions"""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.addCleanup(events.close_stream)
+
+    def test_file(self):
+        path = os.path.join(self.tmp, "events.jsonl")
+        task = BaseTask("service-a", {"id": "run", "driver": "print"}, ["host-a"])
+        events.emit("ignored")
+        self.assertFalse(events.enabled())
+        stream = events.open_stream(path)
+        self.assertTrue(events.enabled())
+        events.emit_task("finished", task, duration=1.5)
+        events.emit("run-finished", state="SUCCESS")
+        events.close_stream()
+        self.assertFalse(events.enabled())
+        self.assertEqual(stream.stats, {"written": 2, "dropped": 0})
+        with open(path, encoding="utf-8", mode="r") as fin:
+            lines = [json.loads(line) for line in fin]
+        self.assertEqual(list(lines[0])[:2], ["event", "time"])
+        del lines[0]["time"]
+        self.assertEqual(
+            lines[0],
+            {
+                "event": "finished",
+                "task": "service-a-run",
+                "service": "service-a",
+                "driver": "print",
+                "hosts": ["host-a"],
+                "duration": 1.5,
+            },
+        )
+        self.assertEqual(lines[1]["state"], "SUCCESS")
+
+    def test_unix_socket(self):
+        path = os.path.join(self.tmp, "events.sock")
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.addCleanup(server.close)
+        server.bind(path)
+        server.listen(1)
+        received = []
+
+        def _read():
+            conn, _ = server.accept()
+            with conn, conn.makefile(mode="r", encoding="utf-8") as fin:
+                received.extend(json.loads(line) for line in fin)
+
+        reader = threading.Thread(target=_read)
+        reader.start()
+        events.open_stream("unix:" + path)
+        for idx in range(3):
+            events.emit("ready", idx=idx)
+        events.close_stream()
+        reader.join(5)
+        self.assertEqual([e["idx"] for e in received], [0, 1, 2])
+
+    def test_unavailable(self):
+        stream = events.open_stream("unix:" + os.path.join(self.tmp, "nope"))
+        events.emit("ready")
+        events.close_stream()
+        self.assertEqual(stream.stats, {"written": 0, "dropped": 1})
@@ -0,0 +1,148 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the executor module"""
+import threading
+import time
+import unittest
+from concurrent import futures
+from unittest import mock
+from taskflow import engines
+from taskflow.patterns import linear_flow as lf
+from taskflow.types import failure
+from task_core import executor
+from task_core.adaptive import AdaptiveLimit
+from task_core.pools import Pools
+from task_core.tasks import NoopTask
+
+
+class TestDispatchExecutor(unittest.TestCase):
+    """Test DispatchExecutor"""
+
+    def setUp(self):
+        super().setUp()
+        self.executor = executor.DispatchExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+
+    def test_limit(self):
+        gate = threading.Event()
+        first = self.executor.submit(gate.wait, 5)
+        second = self.executor.submit(lambda: "second")
+        self.assertEqual(self.executor.running, 1)
+        self.assertEqual(self.executor.pending, 1)
+        self.assertFalse(second.done())
+        gate.set()
+        self.assertTrue(first.result(5))
+        self.assertEqual(second.result(5), "second")
+
+    def test_released(self):
+        gate = threading.Event()
+
+        def _wait():
+            with executor.released():
+                return gate.wait(5)
+
+        first = self.executor.submit(_wait)
+        # only runs while the first call has given its slot back
+        second = self.executor.submit(gate.set)
+        self.assertIsNone(second.result(5))
+        self.assertTrue(first.result(5))
+        self.assertEqual(self.executor.running, 0)
+
+    def test_many_released(self):
+        # more calls waiting released than max_workers * 10 used to leave
+        # every thread released and the slots held by calls with no thread
+        dispatch = executor.DispatchExecutor(max_workers=2)
+        self.addCleanup(dispatch.shutdown)
+
+        def _wait():
+            with executor.released():
+                time.sleep(0.2)
+            return True
+
+        calls = [dispatch.submit(_wait) for _ in range(100)]
+        done, not_done = futures.wait(calls, timeout=10)
+        self.assertEqual((len(done), len(not_done)), (100, 0))
+        self.assertEqual((dispatch.running, dispatch.pending), (0, 0))
+        self.assertLessEqual(dispatch.threads, 102)
+
+    def test_shutdown_threads(self):
+        dispatch = executor.DispatchExecutor(max_workers=2)
+        self.assertEqual(dispatch.submit(lambda: 1).result(5), 1)
+        self.assertEqual(dispatch.threads, 1)
+        dispatch.shutdown()
+        self.assertEqual(dispatch.threads, 0)
+
+    def test_exception(self):
+        future = self.executor.submit(int, "nope")
+        self.assertRaises(ValueError, future.result, 5)
+        self.assertEqual(self.executor.submit(int, "1").result(5), 1)
+
+    def test_engine(self):
+        flow = lf.Flow("root")
+        flow.add(
+            NoopTask("svc", {"id": "a", "provides": ["a"]}, []),
+            NoopTask("svc", {"id": "b", "requires": ["a"]}, []),
+        )
+        engine = engines.load(flow, executor=self.executor, engine="parallel")
+        engine.run()
+        self.assertEqual(engine.storage.fetch("a").data["id"], "a")
+
+    def test_released_noop(self):
+        with executor.released():
+            pass
+        self.assertRaises(ValueError, executor.DispatchExecutor, 0)
+
+    def test_pools(self):
+        pools = Pools({"ansible": 1})
+        dispatch = executor.DispatchExecutor(max_workers=3, pools=pools)
+        self.addCleanup(dispatch.shutdown)
+        gate = threading.Event()
+        ansible = mock.MagicMock(pools=[], driver="ansible", service="svc")
+        other = mock.MagicMock(pools=[], driver="print", service="svc")
+
+        def _wait(_task):
+            with executor.released():
+                return gate.wait(5)
+
+        first = dispatch.submit(_wait, ansible)
+        second = dispatch.submit(lambda _task: "second", ansible)
+        # the pool slot is kept while the first call is released, later
+        # calls outside of the pool still start
+        self.assertEqual(
+            dispatch.submit(lambda _task: "third", other).result(5), "third"
+        )
+        self.assertEqual(dispatch.pending, 1)
+        self.assertFalse(second.done())
+        gate.set()
+        self.assertTrue(first.result(5))
+        self.assertEqual(second.result(5), "second")
+        stats = pools.stats["ansible"]
+        self.assertEqual((stats["max_in_use"], stats["waits"]), (1, 1))
+        self.assertGreater(stats["wait_time"], 0)
+
+    def test_controller(self):
+        controller = AdaptiveLimit(1, 4)
+        dispatch = executor.DispatchExecutor(max_workers=4, controller=controller)
+        self.addCleanup(dispatch.shutdown)
+        self.assertEqual(dispatch.max_workers, 1)
+        task = mock.MagicMock(driver="print")
+        for _ in range(3):
+            dispatch.submit(lambda _task: ("executed", None), task).result(5)
+        self.assertEqual(dispatch.max_workers, 3)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            result = ("executed", failure.Failure())
+        for _ in range(3):
+            dispatch.submit(lambda _task: result, task).result(5)
+        self.assertEqual(dispatch.max_workers, 1)
+        self.assertEqual(controller.stats["decreases"], 1)
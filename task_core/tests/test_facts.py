@@ -0,0 +1,113 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the facts module"""
+import os
+import time
+import unittest
+from concurrent import futures
+from unittest import mock
+from task_core import executor
+from task_core import facts
+
+
+def _task(hosts, inventory="/inv.yaml"):
+    task = mock.MagicMock()
+    task.hosts = hosts
+    task.inventory_path = inventory
+    task.shared_facts = True
+    task.gather_facts.return_value = True
+    return task
+
+
+class TestFactService(unittest.TestCase):
+    """Test FactService"""
+
+    def setUp(self):
+        super().setUp()
+        self.svc = facts.FactService.instance()
+        self.addCleanup(self.svc.configure, "off")
+
+    def test_off(self):
+        self.svc.configure("off")
+        task = _task(["host-a"])
+        self.assertFalse(self.svc.ensure(task))
+        task.gather_facts.assert_not_called()
+        self.assertFalse(self.svc.enabled)
+        self.assertEqual(self.svc.stats, {})
+        self.assertRaises(ValueError, self.svc.configure, "always")
+
+    def test_lazy(self):
+        self.svc.configure("lazy")
+        cache_dir = self.svc.cache_dir
+        self.assertTrue(os.path.isdir(cache_dir))
+        self.assertEqual(self.svc.env()["ANSIBLE_GATHERING"], "smart")
+        self.assertEqual(self.svc.env(True)["ANSIBLE_GATHERING"], "explicit")
+        self.assertEqual(self.svc.env()["ANSIBLE_CACHE_PLUGIN_CONNECTION"], cache_dir)
+
+        first = _task(["host-a", "host-b"])
+        self.assertTrue(self.svc.ensure(first))
+        first.gather_facts.assert_called_once_with(["host-a", "host-b"])
+        second = _task(["host-b", "host-c"])
+        self.svc.ensure(second)
+        second.gather_facts.assert_called_once_with(["host-c"])
+        stats = self.svc.stats
+        self.assertEqual(stats["gather_runs"], 2)
+        self.assertEqual(stats["gathered"], 3)
+        self.assertEqual(stats["reused"], 1)
+
+        self.svc.close()
+        self.assertFalse(os.path.exists(cache_dir))
+
+    def test_max_age(self):
+        self.svc.configure("lazy", cache_dir="/facts", max_age=0)
+        task = _task(["host-a"])
+        with mock.patch("time.monotonic", side_effect=[1.0, 1.0, 2.0, 5.0, 5.0, 6.0]):
+            self.svc.ensure(task)
+            self.svc.ensure(task)
+        self.assertEqual(task.gather_facts.call_count, 2)
+        self.assertEqual(self.svc.stats["reused"], 0)
+
+    def test_failure(self):
+        self.svc.configure("lazy", cache_dir="/facts")
+        task = _task(["host-a"])
+        task.gather_facts.side_effect = Exception("boom")
+        self.assertFalse(self.svc.ensure(task))
+        self.assertFalse(self.svc.ensure(task))
+        task.gather_facts.assert_called_once_with(["host-a"])
+        self.assertEqual(self.svc.stats["failed"], 1)
+
+    def test_prefetch(self):
+        self.svc.configure("eager", cache_dir="/facts")
+        task_a = _task(["host-a"])
+        task_b = _task(["host-b"])
+        other = _task(["host-c"], inventory="/other.yaml")
+        self.svc.prefetch([task_a, task_b, other, mock.MagicMock(shared_facts=False)])
+        task_a.gather_facts.assert_called_once_with(["host-a", "host-b"])
+        other.gather_facts.assert_called_once_with(["host-c"])
+        self.svc.ensure(task_b)
+        task_b.gather_facts.assert_not_called()
+        self.assertEqual(self.svc.stats["reused"], 1)
+
+    def test_many_waiting(self):
+        # tasks waiting on a gathering give their slot back, more of them
+        # than the executor has threads must not deadlock it
+        self.svc.configure("lazy", cache_dir="/facts")
+        dispatch = executor.DispatchExecutor(max_workers=2)
+        self.addCleanup(dispatch.shutdown)
+        first = _task(["host-a"])
+        first.gather_facts.side_effect = lambda hosts: time.sleep(0.5) or True
+        tasks = [first] + [_task(["host-a"]) for _ in range(40)]
+        calls = [dispatch.submit(self.svc.ensure, task) for task in tasks]
+        done, _ = futures.wait(calls, timeout=10)
+        self.assertEqual(len(done), 41)
+        first.gather_facts.assert_called_once_with(["host-a"])
+        self.assertEqual(self.svc.stats["reused"], 40)
@@ -0,0 +1,251 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the graph module"""
+import unittest
+from unittest import mock
+from taskflow.patterns import graph_flow as gf
+from taskflow.patterns import linear_flow as lf
+from task_core import graph
+from task_core.tasks import NoopTask
+
+
+def _node(name, provides=None, requires=None, service="svc", hosts=None):
+    return graph.TaskNode(
+        name=name,
+        service=service,
+        task_id=name,
+        driver="noop",
+        hosts=hosts or ["host-a"],
+        provides=provides or [],
+        requires=requires or [],
+    )
+
+
+def _service(tasks, hosts):
+    svc = mock.MagicMock()
+    svc.tasks = tasks
+    svc.hosts = hosts
+    return svc
+
+
+class TestTaskGraph(unittest.TestCase):
+    """Test TaskGraph"""
+
+    def test_edges(self):
+        obj = graph.TaskGraph()
+        obj.add(_node("a", provides=["a.done"]))
+        obj.add(_node("b", provides=["b.done"], requires=["a.done"]))
+        obj.add(_node("c", requires=["a.done", "b.done"]))
+        self.assertEqual(len(obj), 3)
+        self.assertIn("a", obj)
+        self.assertEqual(obj.successors("a"), ["b", "c"])
+        self.assertEqual(obj.predecessors("c"), ["a", "b"])
+        self.assertEqual(list(obj.edges()), [("a", "b"), ("a", "c"), ("b", "c")])
+        self.assertEqual(obj.topological_order(), ["a", "b", "c"])
+        self.assertEqual(obj.downstream(["a"]), {"b", "c"})
+        self.assertEqual(obj.upstream(["c"]), {"a", "b"})
+        self.assertRaises(ValueError, obj.add, _node("a"))
+
+    def test_validate_ok(self):
+        obj = graph.TaskGraph()
+        obj.add(_node("a", provides=["a.done"]))
+        obj.add(_node("b", requires=["a.done"]))
+        report = obj.validate()
+        self.assertFalse(report.has_errors)
+        self.assertEqual(report.errors(), [])
+        self.assertEqual(report.warnings(), [])
+
+    def test_validate_errors(self):
+        obj = graph.TaskGraph()
+        obj.add(_node("a", provides=["a.done"], requires=["c.done"]))
+        obj.add(_node("b", provides=["b.done", "a.done"], requires=["a.done"]))
+        obj.add(_node("c", provides=["c.done"], requires=["b.done"]))
+        obj.add(_node("d", requires=["nope"]))
+        obj.add(_node("e", provides=["e.done"], requires=["e.done"]))
+        report = obj.validate()
+        self.assertTrue(report.has_errors)
+        self.assertEqual(report.missing, {"nope": ["d"]})
+        self.assertEqual(report.duplicates, {"a.done": ["a", "b"]})
+        self.assertEqual(report.cycles, [["a", "b", "c"], ["e"]])
+        self.assertEqual(len(report.errors()), 4)
+        self.assertRaises(ValueError, obj.topological_order)
+
+    def test_from_services(self):
+        svcs = {
+            "svc-a": _service(
+                [{"id": "init", "provides": ["a.init"]}], ["host-a", "host-b"]
+            ),
+            "svc-b": _service(
+                [{"id": "run", "driver": "print", "requires": ["a.init", "c.init"]}],
+                ["host-b"],
+            ),
+            "svc-c": _service([{"id": "init", "provides": ["c.init"]}], []),
+        }
+        obj = graph.TaskGraph.from_services(svcs)
+        self.assertEqual(list(obj), ["svc-a-init", "svc-b-run"])
+        self.assertEqual(obj.nodes["svc-a-init"].driver, "service")
+        self.assertEqual(obj.nodes["svc-b-run"].hosts, ["host-b"])
+        report = obj.validate()
+        self.assertEqual(report.unreachable, ["svc-c"])
+        self.assertEqual(report.missing, {"c.init": ["svc-b-run"]})
+        self.assertIn("with no hosts", report.errors()[0])
+        self.assertEqual(len(report.warnings()), 1)
+
+    def test_remove_service(self):
+        svcs = {
+            "svc-a": _service([{"id": "init", "provides": ["a.init"]}], ["host-a"]),
+            "svc-b": _service(
+                [{"id": "run", "provides": ["b.run"], "requires": ["a.init"]}],
+                ["host-a"],
+            ),
+            "svc-c": _service([{"id": "init", "provides": ["c.init"]}], []),
+        }
+        obj = graph.TaskGraph.from_services(svcs)
+        self.assertEqual(obj.successors("svc-a-init"), ["svc-b-run"])
+        obj.remove_service("svc-a")
+        obj.remove_service("svc-c")
+        self.assertEqual(list(obj), ["svc-b-run"])
+        self.assertEqual(obj.providers("a.init"), [])
+        report = obj.validate()
+        self.assertEqual(report.missing, {"a.init": ["svc-b-run"]})
+        self.assertEqual(report.unreachable, [])
+        obj.add_service("svc-a", svcs["svc-a"])
+        self.assertEqual(obj.predecessors("svc-b-run"), ["svc-a-init"])
+        self.assertFalse(obj.validate().has_errors)
+
+    def _assert_same_report(self, obj, report):
+        full = graph.TaskGraph()
+        for node in obj.nodes.values():
+            full.add(node)
+        expected = full.validate()
+        self.assertEqual(report.missing, expected.missing)
+        self.assertEqual(report.duplicates, expected.duplicates)
+        self.assertEqual(
+            sorted(sorted(c) for c in report.cycles),
+            sorted(sorted(c) for c in expected.cycles),
+        )
+
+    def test_validate_incremental(self):
+        obj = graph.TaskGraph()
+        obj.add(_node("a", provides=["a.done"], service="svc-a"))
+        obj.add(_node("b", provides=["b.done"], requires=["a.done"], service="svc-b"))
+        obj.add(_node("c", provides=["c.done"], requires=["b.done"], service="svc-c"))
+        obj.add(_node("x", provides=["x.done"], requires=["x.done"], service="svc-x"))
+        obj.add(_node("y", requires=["nope"], service="svc-y"))
+        report = obj.validate()
+        self.assertEqual(report.cycles, [["x"]])
+        # close a cycle through b and c, and provide a duplicate value
+        obj.remove_service("svc-a")
+        obj.add(
+            _node(
+                "a", provides=["a.done", "b.done"], requires=["c.done"], service="svc-a"
+            )
+        )
+        report = obj.validate(report)
+        self._assert_same_report(obj, report)
+        self.assertEqual(sorted(report.cycles[-1]), ["a", "b", "c"])
+        self.assertEqual(report.duplicates, {"b.done": ["b", "a"]})
+        # break the cycle again and remove the missing value
+        obj.remove_service("svc-c")
+        obj.remove_service("svc-y")
+        report = obj.validate(report)
+        self._assert_same_report(obj, report)
+        self.assertEqual(report.cycles, [["x"]])
+        self.assertEqual(report.missing, {"c.done": ["a"]})
+
+    def test_incremental_edges(self):
+        obj = graph.TaskGraph()
+        for idx in range(100):
+            obj.add(
+                _node(
+                    f"t{idx}",
+                    provides=[f"v{idx}"],
+                    requires=[f"v{idx - 1}"] if idx else [],
+                    service=f"svc-{idx}",
+                )
+            )
+        report = obj.validate()
+        unaffected = obj._succ["t10"]  # pylint: disable=protected-access
+        with mock.patch.object(obj, "_build_edges") as build_edges:
+            obj.remove_service("svc-50")
+            obj.add(_node("t50", provides=["v50"], requires=["v99"], service="svc-50"))
+            report = obj.validate(report)
+        build_edges.assert_not_called()
+        self.assertIs(obj._succ["t10"], unaffected)  # pylint: disable=protected-access
+        self.assertEqual(obj.predecessors("t50"), ["t99"])
+        self.assertEqual(obj.successors("t49"), [])
+        self.assertEqual(obj.service_tasks("svc-50"), ["t50"])
+        self.assertEqual(
+            sorted(report.cycles[0]), sorted(f"t{i}" for i in range(50, 100))
+        )
+        with mock.patch.object(obj, "cycles", wraps=obj.cycles) as cycles:
+            obj.remove_service("svc-5")
+            obj.add(_node("t5", provides=["v5"], requires=["v4"], service="svc-5"))
+            report = obj.validate(report)
+        # the tasks downstream of t5 do not lead back to it
+        cycles.assert_called_once_with({"t5"})
+        self.assertEqual(len(report.cycles), 1)
+
+    def test_from_tasks(self):
+        task_a = NoopTask("svc", {"id": "a", "provides": ["a.done"]}, ["host-a"])
+        task_b = NoopTask(
+            "svc", {"id": "b", "provides": ["b.done"], "requires": ["a.done"]}, []
+        )
+        flow = gf.Flow("root")
+        flow.add(task_a, lf.Flow("sub").add(task_b))
+        obj = graph.TaskGraph.from_tasks(flow)
+        self.assertEqual(sorted(obj), ["svc-a", "svc-b"])
+        self.assertEqual(obj.successors("svc-a"), ["svc-b"])
+        self.assertEqual(obj.nodes["svc-a"].hosts, ["host-a"])
+
+    def test_levels(self):
+        obj = graph.TaskGraph()
+        obj.add(_node("a", provides=["a"]))
+        obj.add(_node("b", provides=["b"], requires=["a"]))
+        obj.add(_node("c", provides=["c"], requires=["b"]))
+        obj.add(_node("d", requires=["a"]))
+        earliest, latest = obj.levels()
+        self.assertEqual(earliest, {"a": 0, "b": 1, "c": 2, "d": 1})
+        self.assertEqual(latest, {"a": 0, "b": 1, "c": 2, "d": 2})
+        self.assertEqual(graph.TaskGraph().levels(), ({}, {}))
+
+    def test_grouped_order(self):
+        obj = graph.TaskGraph()
+        obj.add(_node("a1", provides=["a1"], hosts=["a"]))
+        obj.add(_node("b1", provides=["b1"], hosts=["b"]))
+        obj.add(_node("a2", provides=["a2"], requires=["b1"], hosts=["a"]))
+        obj.add(_node("b2", provides=["b2"], requires=["a1"], hosts=["b"]))
+        obj.add(_node("b3", requires=["b1"], hosts=["b"]))
+        obj.add(_node("a3", requires=["a2", "b2"], hosts=["a"]))
+        hosts = lambda name: tuple(obj.nodes[name].hosts)  # noqa: E731
+        # the dependency order switches hosts five times
+        self.assertEqual(obj.topological_order(), ["a1", "b1", "b2", "a2", "b3", "a3"])
+        self.assertEqual(
+            obj.grouped_order(hosts), [["a1"], ["b1", "b2", "b3"], ["a2", "a3"]]
+        )
+        obj.add(_node("c", provides=["c"], requires=["c"]))
+        self.assertRaises(ValueError, obj.grouped_order, hosts)
+
+    def test_linear_chains(self):
+        obj = graph.TaskGraph()
+        obj.add(_node("a", provides=["a.done"]))
+        obj.add(_node("b", provides=["b.done"], requires=["a.done"]))
+        obj.add(_node("c", provides=["c.done"], requires=["b.done"]))
+        obj.add(_node("d", requires=["c.done"]))
+        obj.add(_node("e", requires=["c.done"]))
+        keys = {"a": 1, "b": 1, "c": 1, "d": 1, "e": 1}
+        self.assertEqual(obj.linear_chains(keys.get), [["a", "b", "c"]])
+        keys["b"] = 2
+        self.assertEqual(obj.linear_chains(keys.get), [])
+        keys["b"] = None
+        keys["a"] = None
+        self.assertEqual(obj.linear_chains(keys.get), [])
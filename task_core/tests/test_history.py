@@ -0,0 +1,92 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the history module"""
+import os
+import tempfile
+import time
+import unittest
+from task_core import history
+from task_core.graph import TaskGraph
+from task_core.graph import TaskNode
+
+
+def _graph(hosts):
+    graph = TaskGraph()
+    graph.add(TaskNode("svc-a", "svc", "a", "ansible", hosts, ["a"], []))
+    graph.add(TaskNode("svc-b", "svc", "b", None, [], ["b"], ["a"]))
+    return graph
+
+
+class TestRunHistory(unittest.TestCase):
+    """Test RunHistory"""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, "history.db")
+        self.history = history.RunHistory(self.path, samples=3)
+        self.addCleanup(self.history.close)
+        graph = _graph(["host-a"])
+        now = time.time()
+        for idx, (duration_a, state_b) in enumerate(
+            [(50.0, "SUCCESS"), (10.0, "SUCCESS"), (20.0, "FAILURE"), (12.0, "SUCCESS")]
+        ):
+            self.history.record_run(
+                graph,
+                {
+                    "svc-a": {"duration": duration_a, "state": "SUCCESS"},
+                    "svc-b": {"duration": 1.0, "state": state_b, "attempts": 2},
+                    "unknown": {"duration": 1.0, "state": "SUCCESS"},
+                },
+                now - 100 + idx,
+                "SUCCESS",
+            )
+
+    def test_estimates(self):
+        # the oldest run is beyond the 3 samples kept
+        self.assertEqual(
+            self.history.estimates(_graph(["host-a"])), {"svc-a": 12.0, "svc-b": 1.0}
+        )
+        # no run with 2 hosts, use the runs with any number of hosts
+        self.assertEqual(
+            self.history.estimates(_graph(["host-a", "host-b"]))["svc-a"], 12.0
+        )
+        graph = TaskGraph()
+        graph.add(TaskNode("svc-c", "svc", "c", "ansible", [], [], []))
+        self.assertEqual(self.history.estimates(graph), {})
+
+    def test_queries(self):
+        runs = self.history.runs(limit=2)
+        self.assertEqual(len(runs), 2)
+        self.assertGreater(runs[0]["started"], runs[1]["started"])
+        self.assertEqual(runs[0]["tasks"], 2)
+        slowest = self.history.slowest(1)
+        self.assertEqual(
+            slowest,
+            [
+                {
+                    "service": "svc",
+                    "task_id": "a",
+                    "driver": "ansible",
+                    "hosts": 1,
+                    "runs": 3,
+                    "median": 12.0,
+                    "max": 20.0,
+                }
+            ],
+        )
+        trend = self.history.trend("*-a", limit=3)
+        self.assertEqual([row["duration"] for row in trend], [10.0, 20.0, 12.0])
+        trend = self.history.trend("svc-b", limit=2)
+        self.assertEqual([row["state"] for row in trend], ["FAILURE", "SUCCESS"])
+        self.assertEqual(trend[0]["attempts"], 2)
@@ -10,6 +10,8 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """unit tests of the inventory module"""
+import os
+import tempfile
 import unittest
 from unittest import mock
 from task_core import inventory
@@ -113,6 +115,46 @@ class TestRoles(unittest.TestCase):
             self.assertRaises(ex.InvalidRole, obj.get_services, "doesnotexist")
 
 
+class TestSplitFiles(unittest.TestCase):
+    """Test Inventory and Roles loaded from directories"""
+
+    def _write(self, files):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for name, content in files.items():
+            path = os.path.join(tmp.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, encoding="utf-8", mode="w") as fout:
+                fout.write(content)
+        return tmp.name
+
+    def test_inventory(self):
+        path = self._write(
+            {
+                "00-hosts.yaml": DUMMY_INVENTORY_DATA,
+                # host vars in a later file, without the required role
+                "10-vars/host-a.yaml": "hosts: {host-a: {ip: 10.0.0.1}}",
+            }
+        )
+        obj = inventory.Inventory(path)
+        self.assertEqual(obj.hosts["host-a"], {"role": "keystone", "ip": "10.0.0.1"})
+        self.assertEqual(obj.get_role_hosts("basic"), ["host-b"])
+
+        path = self._write({"hosts.yaml": "hosts: {host-a: {ip: 10.0.0.1}}"})
+        self.assertRaises(Exception, inventory.Inventory, path)
+
+    def test_roles(self):
+        path = self._write(
+            {
+                "basic.yaml": "basic: {services: [chronyd]}",
+                "keystone.yml": "keystone: {services: [mariadb]}",
+            }
+        )
+        obj = inventory.Roles(path)
+        self.assertEqual(sorted(obj.roles), ["basic", "keystone"])
+        self.assertEqual(obj.get_services("keystone"), ["mariadb"])
+
+
 class TestRole(unittest.TestCase):
     """Test Role object"""
 
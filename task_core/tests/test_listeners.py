@@ -0,0 +1,177 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the listeners module"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from taskflow import engines
+from taskflow.patterns import graph_flow as gf
+from task_core import events
+from task_core import listeners
+from task_core.metrics import Metrics
+from task_core import results
+from task_core.base import BaseTask
+from task_core.graph import TaskGraph
+from task_core.tasks import NoopTask
+
+
+def _flow():
+    flow = gf.Flow("root")
+    flow.add(
+        NoopTask("svc", {"id": "a", "provides": ["a"]}, []),
+        NoopTask("svc", {"id": "b", "requires": ["a"]}, []),
+    )
+    return flow
+
+
+class TestTimingListener(unittest.TestCase):
+    """Test TimingListener"""
+
+    def test_timing(self):
+        engine = engines.load(_flow(), engine="serial")
+        with listeners.TimingListener(engine) as timing:
+            engine.run()
+        self.assertEqual(sorted(timing.tasks), ["svc-a", "svc-b"])
+        self.assertEqual(timing.tasks["svc-a"]["state"], "SUCCESS")
+        self.assertGreaterEqual(timing.tasks["svc-a"]["duration"], 0)
+        report = timing.report(elapsed=1)
+        self.assertEqual(report["elapsed"], 1)
+        with mock.patch("builtins.open", mock.mock_open()) as open_mock:
+            timing.write_report("/tmp/report.json", elapsed=1)
+            open_mock.assert_called_with("/tmp/report.json", encoding="utf-8", mode="w")
+            written = "".join(
+                c.args[0] for c in open_mock.return_value.write.mock_calls
+            )
+            self.assertEqual(json.loads(written)["tasks"].keys(), timing.tasks.keys())
+
+
+class TestResultStoreListener(unittest.TestCase):
+    """Test ResultStoreListener"""
+
+    def test_store(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = results.ResultStore(tmp_dir, run_id="run", threshold=0)
+            engine = engines.load(_flow(), engine="serial")
+            with listeners.ResultStoreListener(engine, store):
+                engine.run()
+            stored = engine.storage.fetch("a")
+            self.assertIsInstance(stored, results.StoredResult)
+            self.assertEqual(stored.data, {"id": "a", "hosts": []})
+            self.assertEqual(store.stats["records"], 2)
+            self.assertEqual(store.stats["spilled"], 2)
+
+
+class TestMetricsListener(unittest.TestCase):
+    """Test MetricsListener"""
+
+    def test_metrics(self):
+        metrics = Metrics.instance()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        engine = engines.load(_flow(), engine="serial")
+        with listeners.MetricsListener(engine, {"svc-a": "noop"}):
+            engine.run()
+        text = metrics.render()
+        self.assertIn('task_core_task_duration_seconds_count{driver="noop"} 1', text)
+        self.assertIn('task_core_task_duration_seconds_count{driver="service"} 1', text)
+        self.assertNotIn("task_core_task_failures_total", text)
+
+
+class FailingTask(BaseTask):
+    """task that always fails"""
+
+    def execute(self, *args, **kwargs):
+        raise Exception("boom")
+
+
+class TestEventListener(unittest.TestCase):
+    """Test EventListener"""
+
+    def _run(self, flow, **kwargs) -> list:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "events.jsonl")
+            events.open_stream(path)
+            self.addCleanup(events.close_stream)
+            engine = engines.load(flow, engine="serial")
+            tasks = {task.name: task for task in flow}
+            with listeners.EventListener(engine, tasks, **kwargs):
+                try:
+                    engine.run()
+                except Exception:  # pylint: disable=broad-except
+                    pass
+            events.close_stream()
+            with open(path, encoding="utf-8", mode="r") as fin:
+                return [json.loads(line) for line in fin]
+
+    def test_events(self):
+        lines = self._run(_flow())
+        self.assertEqual(
+            [(e["event"], e.get("task")) for e in lines],
+            [
+                ("run-started", None),
+                ("ready", "svc-a"),
+                ("started", "svc-a"),
+                ("finished", "svc-a"),
+                ("ready", "svc-b"),
+                ("started", "svc-b"),
+                ("finished", "svc-b"),
+                ("run-finished", None),
+            ],
+        )
+        self.assertGreaterEqual(lines[3]["duration"], 0)
+        self.assertEqual(lines[-1]["state"], "SUCCESS")
+
+    def test_failed(self):
+        flow = gf.Flow("root")
+        flow.add(
+            FailingTask("svc", {"id": "a", "provides": ["a"]}, ["host-a"]),
+            NoopTask("svc", {"id": "b", "requires": ["a"]}, []),
+        )
+        lines = self._run(flow)
+        self.assertEqual(
+            [(e["event"], e.get("task")) for e in lines],
+            [
+                ("run-started", None),
+                ("ready", "svc-a"),
+                ("started", "svc-a"),
+                ("failed", "svc-a"),
+                ("skipped", "svc-b"),
+                ("run-finished", None),
+            ],
+        )
+        self.assertEqual(lines[3]["error"], "boom")
+        self.assertEqual(lines[3]["hosts"], ["host-a"])
+
+
+class TestProgressListener(unittest.TestCase):
+    """Test ProgressListener"""
+
+    def test_progress(self):
+        flow = _flow()
+        engine = engines.load(flow, engine="serial")
+        tasks = {task.name: task for task in flow}
+        graph = TaskGraph.from_tasks(flow)
+        progress = listeners.ProgressListener(
+            engine, graph, tasks, {"svc-a": 3.0}, max_workers=1, interval=0
+        )
+        self.assertEqual(
+            progress.progress(),
+            {"done": 0, "tasks": 2, "percent": 0.0, "eta": 4.0},
+        )
+        with progress:
+            engine.run()
+        self.assertEqual(progress.progress()["percent"], 100.0)
+        self.assertEqual(progress.progress()["eta"], 0.0)
+        self.assertEqual(progress.durations["svc-b"]["state"], "SUCCESS")
+        self.assertEqual(progress.durations["svc-b"]["attempts"], 1)
@@ -0,0 +1,100 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the logging module"""
+import logging
+import os
+import queue
+import tempfile
+import unittest
+from unittest import mock
+from task_core import logging as tc_logging
+
+
+def _record(msg, task_output=False, task_name="svc-a", level=logging.INFO):
+    record = logging.LogRecord("test", level, __file__, 1, msg, None, None)
+    record.task_output = task_output
+    record.task_name = task_name
+    return record
+
+
+class TestLogging(unittest.TestCase):
+    """Test logging helpers"""
+
+    def test_truncated(self):
+        self.assertEqual(str(tc_logging.Truncated({"a": 1})), "{'a': 1}")
+        text = str(tc_logging.Truncated("x" * 100, limit=10))
+        self.assertEqual(text, "'xxxxxxxxx... (102 chars)")
+
+    def test_task_context(self):
+        self.assertIsNone(tc_logging.current_task())
+        with tc_logging.task_context("svc-a"):
+            self.assertEqual(tc_logging.current_task(), "svc-a")
+        self.assertIsNone(tc_logging.current_task())
+
+    @mock.patch("time.monotonic", return_value=10)
+    def test_rate_limiter(self, mock_time):
+        stats = {"dropped": 0, "coalesced": 0}
+        limiter = tc_logging.OutputRateLimiter(2, stats)
+        self.assertTrue(limiter.filter(_record("not output")))
+        passed = [limiter.filter(_record(f"line {i}", True)) for i in range(5)]
+        self.assertEqual(passed, [True, True, False, False, False])
+        # other tasks have their own budget
+        self.assertTrue(limiter.filter(_record("line", True, task_name="svc-b")))
+        mock_time.return_value = 11
+        record = _record("next", True)
+        self.assertTrue(limiter.filter(record))
+        self.assertEqual(record.getMessage(), "next (3 lines suppressed)")
+        self.assertEqual(stats, {"dropped": 3, "coalesced": 1})
+
+    def test_queue_handler(self):
+        stats = {"dropped": 0, "coalesced": 0}
+        handler = tc_logging._AsyncQueueHandler(queue.Queue(maxsize=1), stats)
+        with tc_logging.task_context("svc-a"):
+            handler.handle(_record("one %s", task_name=None))
+        handler.handle(_record("two"))
+        self.assertEqual(stats["dropped"], 1)
+        record = handler.queue.get_nowait()
+        self.assertEqual(record.task_name, "svc-a")
+        # formatting is left to the listener
+        self.assertEqual(record.msg, "one %s")
+
+    def test_task_file_handler(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            handler = tc_logging.TaskFileHandler(tmp_dir, max_open=1)
+            handler.handle(_record("a"))
+            handler.handle(_record("b", task_name="svc-b"))
+            handler.handle(_record("c"))
+            handler.handle(_record("none", task_name=None))
+            handler.close()
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["svc-a.log", "svc-b.log"])
+            with open(os.path.join(tmp_dir, "svc-a.log"), encoding="utf-8") as fin:
+                self.assertEqual(fin.read(), "a\nc\n")
+
+    def test_pipeline(self):
+        root = logging.getLogger()
+        handlers = list(root.handlers)
+        level = root.level
+        self.addCleanup(root.setLevel, level)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            pipeline = tc_logging.LoggingPipeline(task_log_dir=tmp_dir).start()
+            try:
+                with tc_logging.task_context("svc-a"):
+                    logging.getLogger("test").info("hello %s", "world")
+            finally:
+                pipeline.stop()
+                for handler in list(root.handlers):
+                    root.removeHandler(handler)
+                for handler in handlers:
+                    root.addHandler(handler)
+            with open(os.path.join(tmp_dir, "svc-a.log"), encoding="utf-8") as fin:
+                self.assertIn("hello world", fin.read())
+        self.assertEqual(pipeline.stats, {"dropped": 0, "coalesced": 0})
@@ -47,14 +47,20 @@ class TestTaskManager(unittest.TestCase):
         self.mock_isfile.side_effect = [True, True]
         self.assertRaises(Exception, TaskManager, "a", "b", "c")
 
-        self.mock_isdir.return_value = True
+        self.mock_isdir.side_effect = lambda path: path == "a"
         self.mock_isfile.side_effect = [False, True]
         self.assertRaises(Exception, TaskManager, "a", "b", "c")
 
-        self.mock_isdir.return_value = True
         self.mock_isfile.side_effect = [True, False]
         self.assertRaises(Exception, TaskManager, "a", "b", "c")
 
+        # inventory and roles directories
+        self.mock_isdir.side_effect = None
+        self.mock_isdir.return_value = True
+        self.mock_isfile.side_effect = [False, False]
+        mgr = TaskManager("a", "b", "c", True)
+        self.assertEqual(mgr.inventory_file, "b")
+
     # NOTE(mwhahaha): because I'll forget this,
     # https://docs.python.org/3/library/unittest.mock.html#where-to-patch
     @mock.patch("task_core.manager.Roles", autospec=True)
@@ -173,3 +179,13 @@ class TestTaskManager(unittest.TestCase):
         mgr.write_flow_graph(mock_flow)
         mock_nx.assert_called_once_with({})
         mock_write.assert_called_once_with("output.svg")
+
+    @mock.patch("task_core.manager.TaskGraph", autospec=True)
+    def test_manager_validate(self, mock_graph):
+        mgr = TaskManager("a", "b", "c", True)
+        mgr.services = {"svc-a": mock.MagicMock()}
+        report = mgr.validate()
+        mock_graph.from_services.assert_called_once_with(mgr.services)
+        self.assertEqual(
+            report, mock_graph.from_services.return_value.validate.return_value
+        )
@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the metrics module"""
+import os
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+from unittest import mock
+from task_core import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    """Test Metrics and MetricsExporter"""
+
+    def setUp(self):
+        super().setUp()
+        self.metrics = metrics.Metrics.instance()
+        self.metrics.reset()
+        self.addCleanup(self.metrics.reset)
+
+    def test_render(self):
+        self.assertEqual(self.metrics.render(), "\n")
+        self.metrics.inc("task_core_task_failures_total", driver="ansible")
+        self.metrics.inc("task_core_task_failures_total", 2, driver="ansible")
+        self.metrics.inc("task_core_directord_polls_total")
+        self.metrics.observe("task_core_task_duration_seconds", 0.7, driver='a"b')
+        self.metrics.observe("task_core_task_duration_seconds", 20, driver='a"b')
+        self.metrics.gauge_function("task_core_tasks_ready", lambda: 4)
+        self.assertEqual(
+            self.metrics.value("task_core_task_failures_total", driver="ansible"), 3
+        )
+        lines = self.metrics.render().splitlines()
+        self.assertIn("# TYPE task_core_task_duration_seconds histogram", lines)
+        self.assertIn(
+            'task_core_task_duration_seconds_bucket{driver="a\\"b",le="0.5"} 0',
+            lines,
+        )
+        self.assertIn(
+            'task_core_task_duration_seconds_bucket{driver="a\\"b",le="1"} 1',
+            lines,
+        )
+        self.assertIn(
+            'task_core_task_duration_seconds_bucket{driver="a\\"b",le="+Inf"} 2',
+            lines,
+        )
+        self.assertIn('task_core_task_duration_seconds_sum{driver="a\\"b"} 20.7', lines)
+        self.assertIn('task_core_task_failures_total{driver="ansible"} 3', lines)
+        self.assertIn("task_core_directord_polls_total 1", lines)
+        self.assertIn("task_core_tasks_ready 4", lines)
+
+    def test_track_executor(self):
+        executor = mock.MagicMock(running=2, pending=5, max_workers=3)
+        self.metrics.track_executor(executor)
+        lines = self.metrics.render().splitlines()
+        self.assertIn("task_core_tasks_running 2", lines)
+        self.assertIn("task_core_tasks_ready 5", lines)
+        self.assertIn("task_core_concurrency_limit 3", lines)
+
+    def test_textfile(self):
+        self.metrics.inc("task_core_directord_polls_total")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "task_core.prom")
+            with metrics.MetricsExporter(textfile=path, interval=60):
+                pass
+            with open(path, encoding="utf-8", mode="r") as fin:
+                self.assertIn("task_core_directord_polls_total 1", fin.read())
+            self.assertEqual(os.listdir(tmp), ["task_core.prom"])
+
+    def test_http(self):
+        self.metrics.inc("task_core_directord_polls_total")
+        with metrics.MetricsExporter(listen="127.0.0.1:0") as exporter:
+            url = "http://127.0.0.1:{}".format(exporter.address[1])
+            with urllib.request.urlopen(url + "/metrics") as resp:
+                self.assertEqual(resp.headers["Content-Type"], metrics.CONTENT_TYPE)
+                self.assertIn(b"task_core_directord_polls_total 1", resp.read())
+            with self.assertRaises(urllib.error.HTTPError) as ctx:
+                urllib.request.urlopen(url + "/nope")
+            self.assertEqual(ctx.exception.code, 404)
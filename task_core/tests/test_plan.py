@@ -0,0 +1,69 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the plan module"""
+import json
+import unittest
+import yaml
+from task_core import plan
+from task_core.graph import TaskGraph
+from task_core.graph import TaskNode
+
+
+def _node(name, provides=None, requires=None):
+    return TaskNode(
+        name=name,
+        service="svc",
+        task_id=name,
+        driver="print",
+        hosts=["host-a"],
+        provides=provides or [],
+        requires=requires or [],
+    )
+
+
+class TestPlan(unittest.TestCase):
+    """Test build_plan"""
+
+    def setUp(self):
+        super().setUp()
+        self.graph = TaskGraph()
+        self.graph.add(_node("a", provides=["a"]))
+        self.graph.add(_node("b", provides=["b"], requires=["a"]))
+        self.graph.add(_node("c", requires=["b"]))
+        self.graph.add(_node("d"))
+
+    def test_build_plan(self):
+        result = plan.build_plan(self.graph)
+        self.assertEqual((result["tasks"], result["depth"]), (4, 3))
+        waves = [[t["name"] for t in wave["tasks"]] for wave in result["waves"]]
+        self.assertEqual(waves, [["a", "d"], ["b"], ["c"]])
+        task_d = result["waves"][0]["tasks"][1]
+        self.assertEqual(
+            task_d,
+            {
+                "name": "d",
+                "service": "svc",
+                "driver": "print",
+                "hosts": ["host-a"],
+                "earliest": 0,
+                "latest": 2,
+                "slack": 2,
+            },
+        )
+        self.assertEqual(result["waves"][2]["tasks"][0]["slack"], 0)
+        self.assertEqual(plan.build_plan(TaskGraph())["waves"], [])
+
+    def test_dump_plan(self):
+        result = plan.build_plan(self.graph)
+        self.assertEqual(json.loads(plan.dump_plan(result, "json")), result)
+        self.assertEqual(yaml.safe_load(plan.dump_plan(result, "yaml")), result)
+        self.assertRaises(ValueError, plan.dump_plan, result, "xml")
@@ -0,0 +1,65 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the pools module"""
+import os
+import tempfile
+import unittest
+import yaml
+from task_core import pools
+from task_core.base import BaseTask
+
+
+class TestPools(unittest.TestCase):
+    """Test Pools"""
+
+    def test_keys(self):
+        task = BaseTask(
+            "service-a",
+            {"id": "run", "driver": "ansible", "pools": ["db", "other"]},
+            ["host-a", "host-b"],
+        )
+        limits = pools.Pools({"db": 1, "ansible": 4, "service-a": 2, "per-host": 2})
+        self.assertEqual(
+            limits.keys(task),
+            ("db", "ansible", "service-a", "per-host:host-a", "per-host:host-b"),
+        )
+        self.assertEqual(pools.Pools().keys(task), ())
+        self.assertFalse(pools.Pools())
+        self.assertRaises(ValueError, pools.Pools, {"ansible": 0})
+
+    def test_acquire(self):
+        limits = pools.Pools({"per-host": 1, "ansible": 2})
+        keys = ("ansible", "per-host:host-a")
+        self.assertIsNone(limits.blocking(keys))
+        limits.acquire(keys)
+        self.assertEqual(limits.blocking(keys), "per-host:host-a")
+        self.assertIsNone(limits.blocking(("ansible", "per-host:host-b")))
+        limits.waited("per-host:host-a", 1.5)
+        limits.release(keys)
+        self.assertIsNone(limits.blocking(keys))
+        self.assertEqual(
+            limits.stats["per-host"],
+            {"limit": 1, "max_in_use": 1, "waits": 1, "wait_time": 1.5},
+        )
+
+    def test_load_pools(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "pools.yaml")
+            with open(path, encoding="utf-8", mode="w") as fout:
+                yaml.safe_dump({"ansible": 4, "directord": 32}, fout)
+            self.assertEqual(
+                pools.load_pools(path, ["ansible=2", "per-host=2"]),
+                {"ansible": 2, "directord": 32, "per-host": 2},
+            )
+        self.assertEqual(pools.load_pools(), {})
+        self.assertRaises(ValueError, pools.parse_pool_args, ["ansible"])
+        self.assertRaises(ValueError, pools.parse_pool_args, ["ansible=x"])
@@ -0,0 +1,88 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the results module"""
+import os
+import tempfile
+import unittest
+from task_core import results
+from task_core.tasks import TaskResult
+
+
+class TestResultStore(unittest.TestCase):
+    """Test ResultStore"""
+
+    def setUp(self):
+        super().setUp()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.store = results.ResultStore(self._tmp.name, run_id="run", threshold=100)
+
+    def test_store(self):
+        small = [TaskResult(True, {})]
+        self.assertIs(self.store.store("small", small), small)
+        large = [TaskResult(True, {"output": "x" * 100})]
+        kept = self.store.store("large", large)
+        self.assertIsNot(kept, large)
+        self.assertIsInstance(kept[0], results.StoredResult)
+        self.assertTrue(kept[0].status)
+        self.assertEqual(kept[0].data, {"output": "x" * 100})
+        self.assertIn("stored", repr(kept[0]))
+        # already stored results are not stored again
+        self.assertIs(self.store.store("large", kept), kept)
+        self.store.store_failure("bad", Exception("boom"))
+        size = kept[0].handle["size"]
+        self.assertGreater(size, 100)
+        self.assertEqual(
+            self.store.stats, {"records": 2, "spilled": 1, "spilled_bytes": size}
+        )
+        # only the large result and the failure were written
+        records = list(results.query(self.store.path))
+        self.assertEqual([r["task"] for r in records], ["large", "bad"])
+
+    def test_store_shared(self):
+        large = TaskResult(True, {"output": "x" * 100})
+        small = TaskResult(True, {})
+        result = {"a": large, "b": large, "c": small}
+        kept = self.store.store("coalesced", result)
+        self.assertIsInstance(kept["a"], results.StoredResult)
+        self.assertIs(kept["b"], kept["a"])
+        self.assertIs(kept["c"], small)
+        self.assertEqual(self.store.stats["records"], 1)
+        records = list(results.query(self.store.path))
+        self.assertEqual(records[0]["index"], "a")
+
+    def test_store_remote(self):
+        remote = [{"status": True, "data": {"output": "x" * 100}}]
+        self.assertIs(self.store.store("remote", remote), remote)
+        records = list(results.query(self.store.path, with_data=True))
+        self.assertEqual(records[0]["task"], "remote")
+        self.assertEqual(records[0]["data"], {"output": "x" * 100})
+        self.assertEqual(self.store.stats["spilled"], 0)
+        small = {"status": True, "data": {}}
+        self.assertIs(self.store.store("remote", small), small)
+        self.assertEqual(self.store.stats["records"], 1)
+
+    def test_query(self):
+        self.store.store("svc-a", [TaskResult(True, {"a": "x" * 100})])
+        self.store.store("svc-b", [TaskResult(True, {"b": "y" * 100})])
+        self.store.store_failure("svc-c", Exception("boom"))
+        self.assertEqual(results.list_runs(self._tmp.name), ["run"])
+        self.assertEqual(results.list_runs(os.path.join(self._tmp.name, "nope")), [])
+        run_dir = self.store.path
+        self.assertEqual(len(list(results.query(run_dir))), 3)
+        records = list(results.query(run_dir, task="svc-[ab]", with_data=True))
+        self.assertEqual(
+            [r["data"] for r in records], [{"a": "x" * 100}, {"b": "y" * 100}]
+        )
+        records = list(results.query(run_dir, state="failure", with_data=True))
+        self.assertEqual(records[0]["task"], "svc-c")
+        self.assertEqual(records[0]["data"], {"error": "boom"})
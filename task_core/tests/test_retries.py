@@ -0,0 +1,200 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the retries module"""
+import threading
+import time
+import unittest
+from unittest import mock
+from taskflow import engines
+from taskflow.patterns import graph_flow as gf
+from taskflow.types import failure
+from task_core import cmd
+from task_core import executor
+from task_core import listeners
+from task_core import retries
+from task_core.base import BaseTask
+from task_core.exceptions import ExecutionFailed
+from task_core.graph import TaskGraph
+from task_core.tasks import NoopTask
+
+real_sleep = time.sleep
+
+
+class FlakyTask(BaseTask):
+    """task failing its first attempts"""
+
+    def execute(self, *args, **kwargs):
+        if self.attempts <= self.data["failures"]:
+            raise ExecutionFailed(f"{self} | attempt {self.attempts} failed")
+        return [self.attempts]
+
+
+def _flow(failures, retry_count):
+    first = NoopTask("svc", {"id": "first", "provides": ["first"]}, [])
+    flaky = FlakyTask(
+        "svc",
+        {
+            "id": "flaky",
+            "provides": ["flaky"],
+            "requires": ["first"],
+            "failures": failures,
+            "retries": retry_count,
+            "delay": 1,
+            "backoff": 2,
+        },
+        [],
+    )
+    last = NoopTask("svc", {"id": "last", "requires": ["flaky"]}, [])
+    flow = gf.Flow("root")
+    flow.add(first, retries.with_retries(flaky), last)
+    return flow, first
+
+
+@mock.patch("time.sleep")
+class TestTaskRetry(unittest.TestCase):
+    """Test TaskRetry"""
+
+    def test_with_retries(self, mock_sleep):
+        task = NoopTask("svc", {"id": "a"}, [])
+        self.assertIs(retries.with_retries(task), task)
+
+    def test_retried(self, mock_sleep):
+        flow, first = _flow(failures=2, retry_count=2)
+        engine = engines.load(flow, engine="serial")
+        with mock.patch.object(first, "execute", wraps=first.execute) as execute:
+            with listeners.TimingListener(engine) as timing:
+                engine.run()
+        self.assertEqual(engine.storage.fetch("flaky"), 3)
+        # only the failed task was run again
+        self.assertEqual(execute.call_count, 1)
+        self.assertEqual(mock_sleep.mock_calls, [mock.call(1), mock.call(2)])
+        self.assertEqual(timing.tasks["svc-flaky"]["attempts"], 3)
+        self.assertEqual(timing.tasks["svc-flaky"]["state"], "SUCCESS")
+        self.assertNotIn("attempts", timing.tasks["svc-first"])
+        stats = timing.retries
+        self.assertEqual(stats["retried_tasks"], 1)
+        self.assertEqual(stats["retries"], 2)
+        self.assertGreaterEqual(stats["retry_time"], 0)
+
+    def test_exhausted(self, mock_sleep):
+        flow, _ = _flow(failures=3, retry_count=2)
+        engine = engines.load(flow, engine="serial")
+        with listeners.TimingListener(engine) as timing:
+            self.assertRaises(ExecutionFailed, engine.run)
+        self.assertEqual(timing.tasks["svc-flaky"]["attempts"], 3)
+        self.assertEqual(timing.tasks["svc-flaky"]["state"], "FAILURE")
+        self.assertNotIn("svc-last", timing.tasks)
+
+    def test_many_waiting(self, mock_sleep):
+        # more tasks waiting their retry delay than the executor has threads
+        # per worker slot must not deadlock the run
+        mock_sleep.side_effect = lambda seconds: real_sleep(0.1)
+        flow = gf.Flow("root")
+        for idx in range(30):
+            task = FlakyTask(
+                "svc",
+                {"id": f"flaky{idx}", "failures": 1, "retries": 1, "delay": 1},
+                [],
+            )
+            flow.add(retries.with_retries(task))
+        dispatch = executor.DispatchExecutor(max_workers=2)
+        self.addCleanup(dispatch.shutdown)
+        engine = engines.load(flow, executor=dispatch, engine="parallel")
+        runner = threading.Thread(target=engine.run, daemon=True)
+        runner.start()
+        runner.join(20)
+        self.assertFalse(runner.is_alive())
+        self.assertEqual(engine.storage.get_flow_state(), "SUCCESS")
+        self.assertEqual(mock_sleep.call_count, 30)
+
+
+def _policy_flow(policy):
+    first = NoopTask("svc", {"id": "first", "provides": ["first"]}, [])
+    failing = FlakyTask(
+        "svc",
+        {
+            "id": "failing",
+            "provides": ["failing"],
+            "requires": ["first"],
+            "failures": 1,
+        },
+        [],
+    )
+    last = NoopTask("svc", {"id": "last", "requires": ["failing"]}, [])
+    other = NoopTask("svc", {"id": "other"}, [])
+    flow = gf.Flow("root")
+    for task in (first, failing, last, other):
+        flow.add(retries.with_retries(task, policy))
+    return flow
+
+
+class TestFailurePolicies(unittest.TestCase):
+    """Test the failure policies"""
+
+    def _run(self, policy):
+        flow = _policy_flow(policy)
+        engine = engines.load(flow, engine="serial")
+        if policy == retries.FAIL_FAST:
+            listeners.FailFastListener(engine).register()
+        self.assertRaises(ExecutionFailed, cmd.run_engine, engine, flow)
+        return engine
+
+    def test_with_retries(self):
+        task = NoopTask("svc", {"id": "a"}, [])
+        wrapped = retries.with_retries(task, retries.CONTINUE_INDEPENDENT)
+        self.assertEqual(wrapped.name, task.name)
+        self.assertIsInstance(wrapped.retry, retries.TaskRetry)
+        self.assertRaises(ValueError, retries.with_retries, task, "unknown")
+
+    def test_revert_all(self):
+        engine = self._run(retries.REVERT_ALL)
+        self.assertEqual(engine.storage.get_atom_state("svc-first"), "REVERTED")
+        self.assertEqual(engine.storage.get_atom_state("svc-last"), "PENDING")
+
+    def test_fail_fast(self):
+        engine = self._run(retries.FAIL_FAST)
+        self.assertEqual(engine.storage.get_atom_state("svc-first"), "SUCCESS")
+        self.assertEqual(list(engine.storage.get_failures()), ["svc-failing"])
+        self.assertEqual(engine.storage.get_atom_state("svc-last"), "PENDING")
+
+    def test_continue_independent(self):
+        engine = self._run(retries.CONTINUE_INDEPENDENT)
+        storage = engine.storage
+        self.assertEqual(storage.get_atom_state("svc-first"), "SUCCESS")
+        self.assertEqual(storage.get_atom_state("svc-other"), "SUCCESS")
+        self.assertEqual(storage.get_atom_state("svc-last"), "PENDING")
+        graph = TaskGraph.from_tasks(_policy_flow(retries.REVERT_ALL))
+        self.assertEqual(
+            retries.failure_summary(graph, storage),
+            {
+                "failed": ["svc-failing"],
+                "blocked": {"svc-failing": ["svc-last"]},
+                "not_run": [],
+            },
+        )
+
+    def test_run_engine_suspended(self):
+        flow = _policy_flow(retries.FAIL_FAST)
+        engine = mock.MagicMock()
+        try:
+            raise ExecutionFailed("failed")
+        except ExecutionFailed:
+            engine.storage.get_failures.return_value = {
+                "svc-failing": failure.Failure()
+            }
+        engine.storage.get_atom_state.return_value = "PENDING"
+        with self.assertLogs("task_core.retries", "ERROR") as logs:
+            self.assertRaises(ExecutionFailed, cmd.run_engine, engine, flow)
+        self.assertIn(
+            "svc-failing | Failed, blocking 1 tasks: svc-last", logs.output[0]
+        )
+        self.assertIn("2 tasks not run: svc-first, svc-other", logs.output[1])
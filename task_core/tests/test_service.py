@@ -13,7 +13,10 @@
 import unittest
 import yaml
 from unittest import mock
+from taskflow.patterns import linear_flow as lf
+from task_core import retries
 from task_core import service
+from task_core import tasks
 
 DUMMY_SERVICE_DATA = """
 id: service-a
@@ -130,6 +133,21 @@ class TestService(unittest.TestCase):
             for x in ret:
                 self.assertTrue(isinstance(x, TestTaskB))
 
+    def test_build_tasks_retries(self):
+        """test tasks with retries are wrapped in a retried flow"""
+        data = yaml.safe_load(DUMMY_SERVICE_DATA)
+        data["tasks"][1]["retries"] = 2
+        self.mock_taskmgr.get_driver.return_value = tasks.ServiceTask
+        obj = service.Service(data)
+        ret = obj.build_tasks()
+        self.assertIsInstance(ret[0], tasks.ServiceTask)
+        self.assertIsInstance(ret[1], lf.Flow)
+        self.assertEqual(ret[1].name, "service-a-setup")
+        self.assertIsInstance(ret[1].retry, retries.TaskRetry)
+        self.assertEqual([t.name for t in ret[1]], ["service-a-setup"])
+        ret = obj.build_tasks(retries=False)
+        self.assertIsInstance(ret[1], tasks.ServiceTask)
+
     @mock.patch("yaml.dump")
     def test_save(self, mock_dump):
         """test save"""
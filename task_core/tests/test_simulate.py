@@ -0,0 +1,83 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the simulate module"""
+import json
+import unittest
+from unittest import mock
+from taskflow.patterns import graph_flow as gf
+from task_core import simulate
+from task_core.graph import TaskGraph
+from task_core.graph import TaskNode
+from task_core.tasks import NoopTask
+
+DURATIONS = {"a": 2.0, "b": 3.0, "c": 1.0, "d": 4.0}
+
+
+def _graph():
+    # a -> b -> d, a -> c, d and c are independent of each other
+    graph = TaskGraph()
+    for name, provides, requires in [
+        ("a", ["a"], []),
+        ("b", ["b"], ["a"]),
+        ("c", ["c"], ["a"]),
+        ("d", ["d"], ["b"]),
+    ]:
+        graph.add(TaskNode(name, "svc", name, "noop", [], provides, requires))
+    return graph
+
+
+class TestSimulator(unittest.TestCase):
+    """Test Simulator"""
+
+    def test_run(self):
+        sim = simulate.Simulator(_graph(), DURATIONS)
+        result = sim.run(1)
+        self.assertEqual(result.makespan, 10.0)
+        self.assertEqual(result.utilization, 1.0)
+        result = sim.run(2)
+        self.assertEqual(result.makespan, 9.0)
+        self.assertAlmostEqual(result.utilization, 10.0 / 18.0)
+        self.assertEqual(result.critical_path, ["a", "b", "d"])
+        self.assertEqual(result.critical_time, 9.0)
+        self.assertEqual(result.as_dict()["max_workers"], 2)
+        self.assertRaises(ValueError, sim.run, 0)
+
+    def test_run_in_progress(self):
+        sim = simulate.Simulator(_graph(), DURATIONS)
+        # a is done and b has 1s left, d follows b while c runs
+        result = sim.run(2, done={"a"}, running={"b": 1.0})
+        self.assertEqual(result.makespan, 5.0)
+        self.assertEqual(sim.run(2, done={"a", "b", "c", "d"}).makespan, 0.0)
+
+    def test_sweep_default_duration(self):
+        sim = simulate.Simulator(_graph(), {"d": 5.0}, default_duration=0.5)
+        results = sim.sweep([1, 4])
+        self.assertEqual([r.makespan for r in results], [6.5, 6.0])
+
+    def test_from_flow(self):
+        flow = gf.Flow("root")
+        flow.add(
+            NoopTask("svc", {"id": "a", "provides": ["a"]}, []),
+            NoopTask("svc", {"id": "b", "requires": ["a"]}, []),
+        )
+        result = simulate.Simulator.from_flow(flow, {"svc-a": 3.0}).run()
+        self.assertEqual(result.makespan, 4.0)
+        self.assertEqual(result.critical_path, ["svc-a", "svc-b"])
+
+    def test_load_durations(self):
+        with mock.patch("builtins.open", mock.mock_open(read_data="a: 1\nb: 2.5\n")):
+            self.assertEqual(simulate.load_durations("d.yaml"), {"a": 1.0, "b": 2.5})
+        report = {"tasks": {"a": {"duration": 3, "state": "SUCCESS"}}}
+        with mock.patch("builtins.open", mock.mock_open(read_data=json.dumps(report))):
+            self.assertEqual(simulate.load_durations("r.json"), {"a": 3.0})
+        with mock.patch("builtins.open", mock.mock_open(read_data="- a\n")):
+            self.assertRaises(ValueError, simulate.load_durations, "bad.yaml")
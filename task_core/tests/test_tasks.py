@@ -11,12 +11,18 @@
 # under the License.
 """unit tests of tasks"""
 import subprocess
+import threading
+import time
 import stevedore.exception
 import unittest
 import yaml
 from unittest import mock
+from taskflow import engines
+from taskflow.patterns import graph_flow as gf
+from task_core import executor
 from task_core import tasks
 from task_core.exceptions import ExecutionFailed
+from task_core.exceptions import TaskTimeout
 
 try:
     import ansible_runner
@@ -128,6 +134,16 @@ class TestServiceTask(unittest.TestCase):
         self.assertTrue(result[0].status)
         self.assertEqual(str(result), "[{'status': True, 'data': {}}]")
 
+    @mock.patch("time.sleep")
+    def test_execute_timeout(self, mock_sleep):
+        """test execute stops once the timeout is reached"""
+        self.data["timeout"] = 0.001
+        self.data["jobs"] = [{"echo": "a"}] * 100
+        obj = tasks.ServiceTask("foo", self.data, ["host-a", "host-b"])
+        with mock.patch("random.random", return_value=0.5):
+            self.assertRaises(TaskTimeout, obj.execute)
+        self.assertTrue(mock_sleep.call_args[0][0] <= 0.001)
+
     @mock.patch("time.sleep")
     def test_execute_bad_job(self, mock_sleep):
         """test execute with bad job definition"""
@@ -339,6 +355,257 @@ class TestAnsibleRunnerTask(unittest.TestCase):
         obj = tasks.AnsibleRunnerTask("foo", self.data, ["host-a"])
         self.assertRaises(ExecutionFailed, obj.execute)
 
+    def test_execute_timeout(self):
+        """test a playbook is canceled once the timeout is reached"""
+
+        def _run():
+            time.sleep(0.01)
+            return ("canceled", 254)
+
+        self.mock_run.return_value.run.side_effect = _run
+        self.data["timeout"] = 0.001
+        obj = tasks.AnsibleRunnerTask("foo", self.data, ["host-a"])
+        self.assertRaises(TaskTimeout, obj.execute)
+        cancel = self.mock_run.call_args[1]["cancel_callback"]
+        self.assertTrue(cancel())
+
+    @mock.patch("task_core.tasks.FactService")
+    def test_execute_shared_facts(self, mock_facts):
+        """test facts are gathered once and the shared cache is used"""
+        mock_result = mock.MagicMock()
+        mock_result.run.return_value = ("successful", 0)
+        self.mock_run.return_value = mock_result
+        mock_facts.instance.return_value.ensure.return_value = True
+        mock_facts.instance.return_value.env.return_value = {
+            "ANSIBLE_GATHERING": "explicit"
+        }
+        self.mock_run_cfg.return_value.env = {}
+        obj = tasks.AnsibleRunnerTask("foo", self.data, ["host-a"])
+        obj.execute()
+        mock_facts.instance.return_value.ensure.assert_called_once_with(obj)
+        # every host is cached, so only plays asking for facts gather them
+        mock_facts.instance.return_value.env.assert_called_with(True)
+        self.assertEqual(
+            self.mock_run_cfg.return_value.env["ANSIBLE_GATHERING"], "explicit"
+        )
+
+        self.mock_run_cfg.reset_mock()
+        self.assertTrue(obj.gather_facts(["host-a", "host-b"]))
+        self.assertEqual(self.mock_run_cfg.call_args[1]["module"], "setup")
+        self.assertEqual(
+            self.mock_run_cfg.call_args[1]["host_pattern"], "host-a:host-b"
+        )
+        self.assertNotIn("playbook", self.mock_run_cfg.call_args[1])
+
+    def test_execute_async(self):
+        """test execute in async mode"""
+        events = [
+            {"event": "playbook_on_task_start", "event_data": {"task": "one"}},
+            {
+                "event": "runner_on_ok",
+                "event_data": {
+                    "host": "host-a",
+                    "task": "one",
+                    "duration": 1.5,
+                    "res": {"changed": True},
+                },
+                "stdout": "line 1\nline 2",
+            },
+            {
+                "event": "runner_on_failed",
+                "event_data": {"host": "host-b", "task": "one", "ignore_errors": True},
+                "stdout": "line 3",
+            },
+        ]
+
+        def _runner(config, event_handler):
+            runner = mock.MagicMock(status="successful", rc=0, stats={})
+
+            def _run():
+                for event in events:
+                    event_handler(event)
+
+            runner.run.side_effect = _run
+            return runner
+
+        self.mock_run.side_effect = _runner
+        self.data.update({"async": True, "stdout_lines": 2})
+        obj = tasks.AnsibleRunnerTask("foo", self.data, ["host-a"])
+        result = obj.execute()
+        self.assertTrue(result[0].status)
+        self.assertEqual(result[0].data["stdout"], "line 2\nline 3")
+        self.assertEqual(
+            result[0].data["hosts"],
+            {"host-a": {"changed": 1}, "host-b": {"ignored": 1}},
+        )
+        self.assertEqual(
+            result[0].data["tasks"],
+            {"one": {"duration": 1.5, "changed": 1, "ignored": 1}},
+        )
+
+        self.mock_run.side_effect = None
+        self.mock_run.return_value = mock.MagicMock(status="failed", rc=2)
+        self.assertRaises(ExecutionFailed, obj.execute)
+
+
+@unittest.skipIf(ANSIBLE_RUNNER_UNAVAILABLE, "ansible runner library unavailable")
+class TestCoalescedAnsibleRunnerTask(unittest.TestCase):
+    """test CoalescedAnsibleRunnerTask"""
+
+    def setUp(self):
+        super().setUp()
+        self.first = yaml.safe_load(DUMMY_ANSIBLE_RUNNER_TASK_DATA)
+        self.second = yaml.safe_load(DUMMY_ANSIBLE_RUNNER_TASK_DATA)
+        self.second.update(
+            {"id": "second", "provides": ["second"], "requires": ["ansible_task"]}
+        )
+        runner_cfg_patcher = mock.patch("ansible_runner.runner_config.RunnerConfig")
+        self.mock_run_cfg = runner_cfg_patcher.start()
+        self.addCleanup(runner_cfg_patcher.stop)
+        runner_patcher = mock.patch("ansible_runner.Runner")
+        self.mock_run = runner_patcher.start()
+        self.addCleanup(runner_patcher.stop)
+
+    def _tasks(self):
+        return [
+            tasks.AnsibleRunnerTask("foo", self.first, ["host-a"]),
+            tasks.AnsibleRunnerTask("foo", self.second, ["host-a"]),
+        ]
+
+    def test_object(self):
+        """test object"""
+        obj = tasks.CoalescedAnsibleRunnerTask(self._tasks())
+        self.assertEqual(obj.name, "foo-ansible+foo-second")
+        self.assertEqual(list(obj.provides), ["ansible_task", "second"])
+        self.assertEqual(list(obj.requires), ["something"])
+        self.assertEqual(obj.working_dir, "/working/dir")
+        plays = obj._playbook()
+        self.assertEqual(plays[0]["name"], "task-core: foo-ansible")
+        self.assertEqual(plays[0]["tasks"], [])
+        self.assertEqual(plays[1], {"import_playbook": "foo.yml"})
+        self.assertTrue(plays[2]["any_errors_fatal"])
+        self.assertEqual(len(plays[2]["tasks"]), 1)
+        self.assertIsNone(obj.timeout)
+
+    def test_object_timeout(self):
+        """test the timeout covers every task"""
+        self.first["timeout"] = 10
+        self.second["timeout"] = 5
+        self.assertEqual(tasks.CoalescedAnsibleRunnerTask(self._tasks()).timeout, 15)
+        del self.second["timeout"]
+        self.assertIsNone(tasks.CoalescedAnsibleRunnerTask(self._tasks()).timeout)
+
+    @mock.patch("os.unlink")
+    def test_execute(self, mock_unlink):
+        """test execute"""
+        obj = tasks.CoalescedAnsibleRunnerTask(self._tasks())
+        obj._write_playbook = mock.MagicMock(return_value="/tmp/play.yaml")
+
+        def _run(config, event_handler):
+            for event, data in [
+                ("playbook_on_play_start", {"play": "task-core: foo-ansible"}),
+                ("playbook_on_play_start", {"play": "first"}),
+                ("runner_on_ok", {}),
+                ("playbook_on_play_start", {"play": "task-core: foo-second"}),
+                ("playbook_on_play_start", {"play": "second"}),
+                ("runner_on_failed", {"ignore_errors": True}),
+            ]:
+                event_handler({"event": event, "event_data": data})
+            runner = mock.MagicMock(stdout="foo", stats={})
+            runner.run.return_value = ("successful", 0)
+            return runner
+
+        self.mock_run.side_effect = _run
+        result = obj.execute()
+        self.assertEqual(list(result), ["ansible_task", "second"])
+        self.assertTrue(all(r.status for r in result.values()))
+        self.assertEqual(result["second"].data["status"], "successful")
+        self.mock_run_cfg.assert_called_once_with(
+            envvars=mock.ANY,
+            playbook="/tmp/play.yaml",
+            private_data_dir="/working/dir",
+            project_dir="/working/dir",
+        )
+        mock_unlink.assert_called_once_with("/tmp/play.yaml")
+
+    @mock.patch("os.unlink")
+    def test_execute_failure(self, mock_unlink):
+        """test a failure is reported against the original task"""
+        obj = tasks.CoalescedAnsibleRunnerTask(self._tasks())
+        obj._write_playbook = mock.MagicMock(return_value="/tmp/play.yaml")
+
+        def _run(config, event_handler):
+            for event, data in [
+                ("playbook_on_play_start", {"play": "task-core: foo-ansible"}),
+                ("playbook_on_play_start", {"play": "first"}),
+                ("runner_on_failed", {}),
+                ("playbook_on_play_start", {"play": "task-core: foo-second"}),
+                ("runner_on_failed", {}),
+            ]:
+                event_handler({"event": event, "event_data": data})
+            runner = mock.MagicMock(stdout="foo", stats={})
+            runner.run.return_value = ("failed", 2)
+            return runner
+
+        self.mock_run.side_effect = _run
+        with self.assertRaisesRegex(ExecutionFailed, "failed for foo-ansible, foo-sec"):
+            obj.execute()
+
+    @mock.patch("os.unlink")
+    def test_execute_no_provides(self, mock_unlink):
+        """test results map to the task providing them"""
+        del self.first["provides"]
+        obj = tasks.CoalescedAnsibleRunnerTask(self._tasks())
+        obj._write_playbook = mock.MagicMock(return_value="/tmp/play.yaml")
+
+        def _run(config, event_handler):
+            for event, data in [
+                ("playbook_on_play_start", {"play": "task-core: foo-ansible"}),
+                ("runner_on_ok", {}),
+                ("playbook_on_play_start", {"play": "task-core: foo-second"}),
+                ("runner_on_ok", {"task": "second task"}),
+            ]:
+                event_handler({"event": event, "event_data": data})
+            runner = mock.MagicMock(stdout="foo", stats={})
+            runner.run.return_value = ("successful", 0)
+            return runner
+
+        self.mock_run.side_effect = _run
+        self.assertEqual(list(obj.provides), ["second"])
+        result = obj.execute()
+        self.assertEqual(list(result), ["second"])
+        self.assertIsNot(result["second"], None)
+        self.assertEqual(obj.save_as, {"second": "second"})
+
+    def test_coalesce_ansible_tasks(self):
+        """test chains are replaced with a single task"""
+        ansible_tasks = self._tasks()
+        noop = tasks.NoopTask("bar", {"id": "noop", "requires": ["second"]}, [])
+        result = tasks.coalesce_ansible_tasks(ansible_tasks + [noop])
+        self.assertEqual(len(result), 2)
+        self.assertIsInstance(result[0], tasks.CoalescedAnsibleRunnerTask)
+        self.assertEqual(result[0].tasks, ansible_tasks)
+        self.assertIs(result[1], noop)
+
+        self.second["coalesce"] = False
+        result = tasks.coalesce_ansible_tasks(self._tasks())
+        self.assertEqual(len(result), 2)
+        self.assertNotIsInstance(result[0], tasks.CoalescedAnsibleRunnerTask)
+
+    def test_coalesce_settings(self):
+        """test tasks with different run settings are not coalesced"""
+        for key, value in (("timeout", 60), ("async", True), ("stdout_lines", 5)):
+            self.first = yaml.safe_load(DUMMY_ANSIBLE_RUNNER_TASK_DATA)
+            self.second.pop("timeout", None)
+            self.second.pop("async", None)
+            self.second.pop("stdout_lines", None)
+            self.second[key] = value
+            result = tasks.coalesce_ansible_tasks(self._tasks())
+            self.assertEqual(len(result), 2, key)
+            self.first[key] = value
+            result = tasks.coalesce_ansible_tasks(self._tasks())
+            self.assertEqual(len(result), 1, key)
+
 
 class TestNoopTask(unittest.TestCase):
     """test NoopTask"""
@@ -394,6 +661,7 @@ class TestLocalTask(unittest.TestCase):
             shell=True,
             stderr=subprocess.STDOUT,
             stdout=subprocess.PIPE,
+            start_new_session=True,
         )
         self.assertTrue(result[0].status)
         self.assertEqual(
@@ -409,6 +677,7 @@ class TestLocalTask(unittest.TestCase):
             shell=True,
             stderr=subprocess.STDOUT,
             stdout=subprocess.PIPE,
+            start_new_session=True,
         )
 
         self.assertTrue(result[0].status)
@@ -429,6 +698,7 @@ class TestLocalTask(unittest.TestCase):
             shell=True,
             stderr=subprocess.STDOUT,
             stdout=subprocess.PIPE,
+            start_new_session=True,
         )
 
         self.assertTrue(result[0].status)
@@ -456,6 +726,7 @@ class TestLocalTask(unittest.TestCase):
             shell=True,
             stderr=subprocess.STDOUT,
             stdout=subprocess.PIPE,
+            start_new_session=True,
         )
 
         self.assertTrue(result[0].status)
@@ -481,3 +752,110 @@ class TestLocalTask(unittest.TestCase):
                 "returncode": 5,
             },
         )
+
+
+class TestLocalTaskTimeout(unittest.TestCase):
+    """test LocalTask timeouts with real commands"""
+
+    def setUp(self):
+        super().setUp()
+        self.data = yaml.safe_load(DUMMY_LOCAL_TASK_DATA)
+        self.data["timeout"] = 0.2
+
+    def test_execute_timeout(self):
+        obj = tasks.LocalTask("foo", self.data, ["host-a"])
+        start = time.monotonic()
+        self.assertRaises(TaskTimeout, obj.execute)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_execute_quiet_timeout(self):
+        self.data["quiet"] = True
+        obj = tasks.LocalTask("foo", self.data, ["host-a"])
+        start = time.monotonic()
+        self.assertRaises(TaskTimeout, obj.execute)
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_execute_in_time(self):
+        self.data["command"] = "echo done"
+        self.data["timeout"] = 10
+        result = tasks.LocalTask("foo", self.data, ["host-a"]).execute()
+        self.assertTrue(result[0].status)
+
+
+class TestBenchTask(unittest.TestCase):
+    """test BenchTask"""
+
+    def setUp(self):
+        super().setUp()
+        self.data = {
+            "id": "bench",
+            "driver": "bench",
+            "duration": {"distribution": "uniform", "min": 1, "max": 2},
+            "memory": 1024,
+            "output": 10,
+            "seed": 42,
+        }
+
+    def test_sample(self):
+        rng = mock.MagicMock()
+        rng.gauss.return_value = -1
+        self.assertEqual(tasks.BenchTask.sample(1.5, rng), 1.5)
+        self.assertEqual(tasks.BenchTask.sample({"value": 2}, rng), 2.0)
+        self.assertEqual(
+            tasks.BenchTask.sample({"distribution": "normal", "mean": 1}, rng), 0.0
+        )
+        self.assertRaises(
+            ValueError, tasks.BenchTask.sample, {"distribution": "nope"}, rng
+        )
+
+    @mock.patch("time.sleep")
+    def test_execute(self, mock_sleep):
+        obj = tasks.BenchTask("foo", self.data, [])
+        obj.pre_execute()
+        result = obj.execute()
+        self.assertTrue(result[0].status)
+        self.assertEqual(result[0].data["attempt"], 1)
+        self.assertEqual(result[0].data["memory"], 1024)
+        self.assertEqual(result[0].data["output"], "x" * 10)
+        duration = result[0].data["duration"]
+        self.assertTrue(1 <= duration <= 2)
+        mock_sleep.assert_called_once_with(duration)
+        # the same seed, name and attempt give the same values
+        again = tasks.BenchTask("foo", self.data, [])
+        again.pre_execute()
+        self.assertEqual(again.execute()[0].data["duration"], duration)
+        obj.pre_execute()
+        self.assertNotEqual(obj.execute()[0].data["duration"], duration)
+
+    @mock.patch("time.sleep")
+    def test_execute_failure(self, mock_sleep):
+        self.data["failure_rate"] = 1
+        obj = tasks.BenchTask("foo", self.data, [])
+        self.assertRaises(ExecutionFailed, obj.execute)
+        self.assertTrue(mock_sleep.called)
+
+    @mock.patch("time.sleep")
+    def test_execute_timeout(self, mock_sleep):
+        self.data["timeout"] = 0.5
+        obj = tasks.BenchTask("foo", self.data, [])
+        self.assertRaises(TaskTimeout, obj.execute)
+        self.assertTrue(mock_sleep.call_args[0][0] <= 0.5)
+
+    def test_bench_released(self):
+        # a bench of released tasks keeps far more tasks in flight than the
+        # executor has slots, it must finish rather than hang the executor
+        flow = gf.Flow("bench")
+        for idx in range(60):
+            data = {"id": f"bench{idx}", "duration": 0.2, "release": True}
+            flow.add(tasks.BenchTask("foo", data, []))
+        dispatch = executor.DispatchExecutor(max_workers=2)
+        self.addCleanup(dispatch.shutdown)
+        engine = engines.load(flow, executor=dispatch, engine="parallel")
+        runner = threading.Thread(target=engine.run, daemon=True)
+        start = time.monotonic()
+        runner.start()
+        runner.join(20)
+        self.assertFalse(runner.is_alive())
+        self.assertEqual(engine.storage.get_flow_state(), "SUCCESS")
+        # the sleeps overlap instead of running two at a time
+        self.assertLess(time.monotonic() - start, 60 * 0.2 / 2)
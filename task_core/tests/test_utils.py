@@ -90,3 +90,64 @@ class TestUtils(unittest.TestCase):
         base = {"a": "b"}
         to_merge = ["x"]
         self.assertRaises(Exception, utils.merge_dict, base, to_merge)
+
+    def test_layered_mapping(self):
+        """test layered mapping without extend"""
+        layers = [
+            {"a": 1, "c": [3], "d": {"x": "y", "z": None}, "s": 1},
+            {"c": [4], "d": {"y": "foo", "z": "bar"}, "e": "4", "s": {"k": 1}},
+            {"d": {"x": {"deep": True}}},
+        ]
+        obj = utils.LayeredMapping(layers)
+        self.assertEqual(list(obj), ["a", "c", "d", "s", "e"])
+        self.assertEqual(len(obj), 5)
+        self.assertIn("e", obj)
+        self.assertNotIn("x", obj)
+        self.assertEqual(obj["c"], [4])
+        # a mapping replaces the value below it
+        self.assertIs(obj["s"], layers[1]["s"])
+        self.assertIsInstance(obj["d"], utils.LayeredMapping)
+        self.assertIs(obj["d"], obj["d"])
+        self.assertEqual(
+            obj.to_dict(),
+            {
+                "a": 1,
+                "c": [4],
+                "d": {"x": {"deep": True}, "z": "bar", "y": "foo"},
+                "s": {"k": 1},
+                "e": "4",
+            },
+        )
+        self.assertEqual(obj, obj.to_dict())
+        # the layers are left untouched
+        self.assertEqual(layers[0]["d"], {"x": "y", "z": None})
+        self.assertRaises(KeyError, obj.__getitem__, "x")
+
+    def test_layered_mapping_extend(self):
+        """test layered mapping with extend"""
+        layers = [
+            {"l": [2, 3], "t": (1, 2), "f": {1, 2}, "r": [1]},
+            {"l": {1}, "t": (2, 3), "f": {2, 3}, "r": 5},
+            {"l": (4,), "r": [6]},
+        ]
+        obj = utils.LayeredMapping(layers, merge_extend=True)
+        self.assertEqual(obj["l"], [2, 3, 1, 4])
+        self.assertEqual(obj["t"], (1, 2, 2, 3))
+        self.assertEqual(obj["f"], {1, 2, 3})
+        # a scalar replaces the values before it
+        self.assertEqual(obj["r"], [6])
+        self.assertEqual(layers[0]["l"], [2, 3])
+
+    def test_deadline(self):
+        """test deadline"""
+        deadline = utils.Deadline()
+        self.assertIsNone(deadline.timeout)
+        self.assertIsNone(deadline.remaining())
+        self.assertFalse(deadline.expired())
+        deadline = utils.Deadline(60)
+        self.assertEqual(deadline.timeout, 60)
+        self.assertTrue(0 < deadline.remaining() <= 60)
+        self.assertFalse(deadline.expired())
+        deadline = utils.Deadline(0)
+        self.assertEqual(deadline.remaining(), 0)
+        self.assertTrue(deadline.expired())
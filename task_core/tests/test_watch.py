@@ -0,0 +1,166 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""unit tests of the watch module"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+import yaml
+from task_core import watch
+from task_core.manager import TaskManager
+from task_core.service import Service
+
+
+def _service(name, tasks):
+    return {"id": name, "type": "service", "version": "1.0.0", "tasks": tasks}
+
+
+def _task(task_id, provides, requires=None, needed_by=None):
+    data = {"id": task_id, "driver": "print", "message": "m", "provides": provides}
+    if requires:
+        data["requires"] = requires
+    if needed_by:
+        data["needed-by"] = needed_by
+    return data
+
+
+SERVICE_A = _service("service-a", [_task("init", ["a.init"])])
+SERVICE_B = _service("service-b", [_task("run", ["b.run"], requires=["a.init"])])
+SERVICE_C = _service("service-c", [_task("pre", ["c.pre"], needed_by=["a.init"])])
+
+
+class TestWatch(unittest.TestCase):
+    """Test PollingWatcher and ModelWatcher"""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.services_dir = os.path.join(tmp.name, "services")
+        os.makedirs(self.services_dir)
+        self.inventory_file = os.path.join(tmp.name, "inventory.yaml")
+        self.roles_file = os.path.join(tmp.name, "roles.yaml")
+        self._write("service-a", SERVICE_A)
+        self._write("service-b", SERVICE_B)
+        self._write("service-c", SERVICE_C)
+        self._write(self.inventory_file, {"hosts": {"host-a": {"role": "role-a"}}})
+        self._write(
+            self.roles_file,
+            {"role-a": {"services": ["service-a", "service-b", "service-c"]}},
+        )
+        self.mgr = TaskManager(self.services_dir, self.inventory_file, self.roles_file)
+
+    def _write(self, name, data) -> str:
+        path = name
+        if not os.path.isabs(name):
+            path = os.path.join(self.services_dir, name + ".yaml")
+        with open(path, encoding="utf-8", mode="w") as fout:
+            yaml.safe_dump(data, fout)
+        return path
+
+    def test_polling_watcher(self):
+        watcher = watch.PollingWatcher(
+            self.services_dir, [self.inventory_file], interval=0.01
+        )
+        self.assertEqual(watcher.changes(timeout=0), set())
+        path_a = self._write("service-a", _service("service-a", []))
+        # make sure the change is seen on file systems with coarse mtimes
+        os.utime(path_a, ns=(0, 0))
+        path_d = self._write("service-d", _service("service-d", []))
+        os.unlink(os.path.join(self.services_dir, "service-c.yaml"))
+        self.assertEqual(
+            watcher.changes(timeout=1),
+            {path_a, path_d, os.path.join(self.services_dir, "service-c.yaml")},
+        )
+        os.utime(self.inventory_file, ns=(0, 0))
+        self.assertEqual(watcher.changes(timeout=1), {self.inventory_file})
+
+    def test_needed_by(self):
+        self.assertEqual(self.mgr.services["service-a"].tasks[0]["requires"], ["c.pre"])
+        model = watch.ModelWatcher(self.mgr)
+        path = self._write(
+            "service-c", _service("service-c", [_task("pre", ["c.pre"])])
+        )
+        with mock.patch("task_core.manager.Service", wraps=Service) as svc:
+            report = model.update([path])
+        # service-a lost the requires added by the needed-by of service-c,
+        # service-b was not loaded again
+        self.assertEqual(
+            sorted(c[1][0] for c in svc.mock_calls),
+            sorted([path, os.path.join(self.services_dir, "service-a.yaml")]),
+        )
+        self.assertEqual(self.mgr.services["service-a"].tasks[0].get("requires"), None)
+        self.assertEqual(self.mgr.services["service-a"].hosts, ["host-a"])
+        self.assertEqual(model.graph.predecessors("service-a-init"), [])
+        self.assertFalse(report.has_errors)
+
+    def test_service_removed(self):
+        model = watch.ModelWatcher(self.mgr)
+        path = os.path.join(self.services_dir, "service-a.yaml")
+        os.unlink(path)
+        report = model.update([path])
+        self.assertNotIn("service-a", self.mgr.services)
+        self.assertNotIn("service-a-init", model.graph)
+        self.assertEqual(report.missing, {"a.init": ["service-b-run"]})
+        self._write("service-a", SERVICE_A)
+        self.assertFalse(model.update([path]).has_errors)
+        self.assertEqual(len(model.graph), 3)
+
+    def test_incremental(self):
+        model = watch.ModelWatcher(self.mgr)
+        graph = model.graph
+        unaffected = graph._succ["service-c-pre"]  # pylint: disable=protected-access
+        path = self._write(
+            "service-b",
+            _service("service-b", [_task("run", ["b.run"], requires=["b.none"])]),
+        )
+        with mock.patch.object(graph, "_build_edges") as build_edges:
+            report = model.update([path])
+        build_edges.assert_not_called()
+        self.assertIs(model.graph, graph)
+        self.assertIs(
+            graph._succ["service-c-pre"], unaffected  # pylint: disable=protected-access
+        )
+        self.assertEqual(graph.successors("service-a-init"), [])
+        self.assertEqual(report.missing, {"b.none": ["service-b-run"]})
+        self.assertIs(model.report, report)
+
+    def test_inventory_changed(self):
+        model = watch.ModelWatcher(self.mgr)
+        self._write(
+            self.roles_file,
+            {"role-a": {"services": ["service-a", "service-c"]}},
+        )
+        report = model.update([self.roles_file])
+        self.assertEqual(self.mgr.services["service-b"].hosts, [])
+        self.assertEqual(report.unreachable, ["service-b"])
+        self._write(
+            self.inventory_file,
+            {"hosts": {"host-a": {"role": "role-a"}, "host-b": {"role": "role-a"}}},
+        )
+        model.update([self.inventory_file])
+        self.assertEqual(
+            model.graph.nodes["service-a-init"].hosts, ["host-a", "host-b"]
+        )
+
+    def test_run(self):
+        path = os.path.join(self.services_dir, "service-a.yaml")
+        watcher = mock.MagicMock()
+        watcher.changes.side_effect = [set(), {path}, {path}, KeyboardInterrupt]
+        model = watch.ModelWatcher(self.mgr, watcher)
+        callback = mock.MagicMock()
+        with mock.patch.object(model, "update") as update:
+            update.side_effect = [Exception("bad yaml"), "report"]
+            self.assertRaises(KeyboardInterrupt, model.run, callback)
+        callback.assert_called_once_with("report")
+        model.close()
+        watcher.close.assert_called_once_with()
@@ -10,7 +10,9 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """util classess"""
+import collections.abc
 import logging
+import time
 
 LOG = logging.getLogger(__name__)
 
@@ -34,3 +36,107 @@ def merge_dict(base, to_merge, merge_extend=False) -> dict:
         else:
             base[key] = to_merge[key]
     return base
+
+
+class LayeredMapping(collections.abc.Mapping):
+    """read only deep merged view over a list of mappings
+
+    Later layers override earlier ones like merge_dict does, but nothing is
+    merged up front and no layer is modified. A key is resolved the first
+    time it is read: a mapping value becomes another LayeredMapping over the
+    mappings the layers hold for that key, any other value is taken from
+    the last layer that has it. With merge_extend, list, tuple and set
+    values of all layers are joined, with the type of the first one.
+    """
+
+    def __init__(self, layers, merge_extend=False):
+        self._layers = list(layers)
+        self._merge_extend = merge_extend
+        self._values = None
+        self._resolved = {}
+
+    @property
+    def layers(self) -> list:
+        return self._layers
+
+    def _index(self) -> dict:
+        # values of every key in layer order, built in a single pass
+        if self._values is None:
+            values = {}
+            for layer in self._layers:
+                for key, value in layer.items():
+                    values.setdefault(key, []).append(value)
+            self._values = values
+        return self._values
+
+    def _resolve(self, values):
+        top = values[-1]
+        if isinstance(top, collections.abc.Mapping):
+            kinds = collections.abc.Mapping
+        elif self._merge_extend and isinstance(top, (list, tuple, set)):
+            kinds = (list, tuple, set)
+        else:
+            return top
+        # only the values after the last one of another kind are merged,
+        # that one replaced everything before it
+        run = []
+        for value in reversed(values):
+            if not isinstance(value, kinds):
+                break
+            run.append(value)
+        run.reverse()
+        if len(run) == 1:
+            return top
+        if kinds is collections.abc.Mapping:
+            return LayeredMapping(run, self._merge_extend)
+        items = [item for value in run for item in value]
+        return type(run[0])(items)
+
+    def __getitem__(self, key):
+        try:
+            return self._resolved[key]
+        except KeyError:
+            pass
+        value = self._resolve(self._index()[key])
+        self._resolved[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._index()
+
+    def __iter__(self):
+        return iter(self._index())
+
+    def __len__(self):
+        return len(self._index())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({len(self._layers)} layers)"
+
+    def to_dict(self) -> dict:
+        """fully merged copy as plain dicts"""
+        return {
+            key: value.to_dict() if isinstance(value, LayeredMapping) else value
+            for key, value in self.items()
+        }
+
+
+class Deadline:
+    """time left of an optional timeout in seconds"""
+
+    def __init__(self, timeout=None):
+        self._timeout = timeout
+        self._end = None if timeout is None else time.monotonic() + timeout
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def remaining(self):
+        """seconds left, or None without a timeout"""
+        if self._end is None:
+            return None
+        return max(0.0, self._end - time.monotonic())
+
+    def expired(self) -> bool:
+        return self._end is not None and time.monotonic() >= self._end
@@ -0,0 +1,242 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""watch the deployment files and revalidate on change"""
+import glob
+import logging
+import os
+import time
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+from .graph import GraphReport
+from .graph import TaskGraph
+from .manager import TaskManager
+
+LOG = logging.getLogger(__name__)
+
+
+def _within(path, directory) -> bool:
+    return path.startswith(directory + os.sep)
+
+
+class PollingWatcher:
+    """find changed files by comparing their modification time and size"""
+
+    def __init__(self, services_dir: str, files: list, interval: float = 0.5):
+        self._services_dir = services_dir
+        self._files = list(files)
+        self._interval = interval
+        self._state = self._scan()
+
+    def _scan(self) -> dict:
+        state = {}
+        paths = glob.glob(
+            os.path.join(self._services_dir, "**", "*.yaml"), recursive=True
+        )
+        for path in self._files:
+            if os.path.isdir(path):
+                paths.extend(
+                    glob.glob(os.path.join(path, "**", "*.y*ml"), recursive=True)
+                )
+            else:
+                paths.append(path)
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+        return state
+
+    def changes(self, timeout: float = None) -> set:
+        """wait for files to be added, changed or removed and return them"""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self._scan()
+            changed = {
+                path
+                for path in set(state) | set(self._state)
+                if state.get(path) != self._state.get(path)
+            }
+            self._state = state
+            if changed or (end is not None and time.monotonic() >= end):
+                return changed
+            time.sleep(self._interval)
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """find changed files with inotify"""
+
+    def __init__(self, services_dir: str, files: list, delay: float = 0.05):
+        self._services_dir = os.path.normpath(services_dir)
+        self._files = {os.path.normpath(f) for f in files}
+        self._delay = delay
+        self._inotify = inotify_simple.INotify()
+        self._dirs = {}
+        flags = inotify_simple.flags
+        self._mask = (
+            flags.CLOSE_WRITE
+            | flags.MOVED_TO
+            | flags.MOVED_FROM
+            | flags.DELETE
+            | flags.CREATE
+        )
+        self._watch_tree(self._services_dir)
+        for path in self._files:
+            if os.path.isdir(path):
+                self._watch_tree(path)
+            else:
+                self._watch(os.path.dirname(path) or ".")
+
+    def _watch(self, path):
+        self._dirs[self._inotify.add_watch(path, self._mask)] = path
+
+    def _watch_tree(self, path):
+        for root, _, _ in os.walk(path):
+            self._watch(root)
+
+    def _wanted(self, path) -> bool:
+        if path in self._files:
+            return True
+        if path.endswith(".yaml") and _within(path, self._services_dir):
+            return True
+        return path.endswith((".yaml", ".yml")) and any(
+            _within(path, f) for f in self._files
+        )
+
+    def changes(self, timeout: float = None) -> set:
+        """wait for files to be added, changed or removed and return them"""
+        # editors write files in several steps, so wait a little for the
+        # rest of the events once the first one arrives
+        events = self._inotify.read(
+            timeout=None if timeout is None else int(timeout * 1000),
+            read_delay=int(self._delay * 1000),
+        )
+        changed = set()
+        for event in events:
+            path = os.path.join(self._dirs.get(event.wd, ""), event.name)
+            if event.mask & inotify_simple.flags.ISDIR:
+                if event.mask & inotify_simple.flags.CREATE:
+                    # services moved in with a new directory
+                    self._watch_tree(path)
+                    changed.update(
+                        glob.glob(os.path.join(path, "**", "*.yaml"), recursive=True)
+                    )
+            elif self._wanted(path):
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        self._inotify.close()
+
+
+def make_watcher(services_dir: str, files: list, interval: float = 0.5):
+    """watch with inotify when available, by polling otherwise"""
+    if inotify_simple is not None:
+        try:
+            return InotifyWatcher(services_dir, files)
+        except OSError as e:
+            LOG.warning("Unable to use inotify, polling instead: %s", e)
+    else:
+        LOG.info("inotify_simple is unavailable, polling for changes")
+    return PollingWatcher(services_dir, files, interval)
+
+
+class ModelWatcher:
+    """keep the loaded deployment and its task graph up to date
+
+    Only the changed service files are loaded again, and only the tasks of
+    the changed services, their edges and the values they provide or
+    require are checked again. A change of the inventory or roles, or of
+    any file in them when they are directories, reassigns the hosts of the
+    loaded services and rebuilds the graph from them without loading any
+    service file.
+    """
+
+    def __init__(self, mgr: TaskManager, watcher=None):
+        self._mgr = mgr
+        self._watcher = watcher
+        self._graph = mgr.build_graph()
+        self._report = self._graph.validate()
+
+    @property
+    def graph(self) -> TaskGraph:
+        return self._graph
+
+    @property
+    def report(self) -> GraphReport:
+        """the validation of the current graph"""
+        return self._report
+
+    def update(self, paths) -> GraphReport:
+        """apply the changed files to the model and validate it again"""
+        start = time.monotonic()
+        paths = {os.path.normpath(p) for p in paths}
+        inventory_file = os.path.normpath(self._mgr.inventory_file)
+        roles_file = os.path.normpath(self._mgr.roles_file)
+        # the inventory and roles can be directories of yaml files
+        inventory = {
+            p for p in paths if p == inventory_file or _within(p, inventory_file)
+        }
+        roles = {p for p in paths if p == roles_file or _within(p, roles_file)}
+        if inventory:
+            self._mgr.reload_inventory()
+        if roles:
+            self._mgr.reload_roles()
+        rebuild = bool(inventory or roles)
+        names = set()
+        for path in sorted(paths - inventory - roles):
+            names.update(self._mgr.reload_service_file(path))
+        if rebuild:
+            self._graph = self._mgr.build_graph()
+            self._report = self._graph.validate()
+        else:
+            for name in names:
+                self._graph.remove_service(name)
+                if name in self._mgr.services:
+                    self._graph.add_service(name, self._mgr.services[name])
+            self._report = self._graph.validate(self._report)
+        LOG.info(
+            "Updated %s services of %s tasks in %.1fms",
+            "all" if rebuild else len(names),
+            len(self._graph),
+            (time.monotonic() - start) * 1000,
+        )
+        return self._report
+
+    def run(self, callback) -> None:
+        """update on every change until interrupted
+
+        callback is called with the GraphReport of every update.
+        """
+        while True:
+            paths = self._watcher.changes()
+            if not paths:
+                continue
+            LOG.debug("Changed: %s", ", ".join(sorted(paths)))
+            try:
+                report = self.update(paths)
+            except Exception as e:  # pylint: disable=broad-except
+                # keep watching, the next save may fix the file
+                LOG.error("Unable to load changes: %s", e)
+                continue
+            callback(report)
+
+    def close(self) -> None:
+        if self._watcher:
+            self._watcher.close()